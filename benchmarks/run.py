@@ -0,0 +1,271 @@
+import os, sys, json, time, shutil, platform, tempfile, argparse, subprocess
+from datetime import datetime, timezone
+
+# Benchmarks for the pipeline stages at several scales.
+#
+# Every stage runs in its own child process (this file with the hidden "_stage" command),
+# so its peak RSS is the child's ru_maxrss as reported by wait4 and nothing leaks between
+# stages. The child times the stage call itself (without interpreter start-up and imports)
+# and reports the rows it produced; the parent adds wall time and memory and writes one
+# JSON file per run under benchmarks/results/. "compare" fails when a stage regressed.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCHEMA_VERSION = 1
+SCALES = "10k,1m,10m"
+GEN_NOW = "2025-06-01T00:00:00"  # pinned so every run generates the same data
+THRESHOLD = 0.15       # allowed drop in rows/s before "compare" fails
+RSS_THRESHOLD = 0.25   # allowed growth of peak RSS
+
+for d in ("generate", "ingest", "transform"):
+    sys.path.insert(0, os.path.join(ROOT, "src", d))
+
+# ---- stages (run in the child; env is already set up for the work directory) ----
+
+def _argv(*args):
+    sys.argv = [sys.argv[0], *map(str, args)]
+
+def gen_products(n, work):
+    import wine_data_generator as g
+    return g.write_csv_chunks(os.path.join(work, "products.csv"), g.PRODUCT_HEADER, g.product_chunks(n), quiet=True)
+
+def gen_consumers(n, work):
+    import wine_data_generator as g
+    return g.write_csv_chunks(os.path.join(work, "consumers.csv"), g.CONSUMER_HEADER, g.consumer_chunks(n), quiet=True)
+
+def gen_orders(n, work):
+    import wine_data_generator as g
+    return g.write_csv_chunks(os.path.join(work, "orders.csv"), g.ORDER_HEADER,
+                              g.order_chunks(n, n_consumers=n, n_products=n), quiet=True)
+
+def customer_generator(n, work):
+    import customer_generator as c
+    _argv("--n", n, "--out", os.path.join(work, "customers.csv"))
+    c.main()
+    return _lines(os.path.join(work, "customers.csv")) - 1
+
+def events_batch(n, work):
+    import order_event_generator as e
+    _argv("--count", n, "--out", os.path.join(work, "orders_events.jsonl"))
+    e.main()
+    return _lines(os.path.join(work, "orders_events.jsonl"))
+
+def events_stream(n, work):
+    import order_event_generator as e
+    # an unreachable rate measures the producer flat out; --workers 0 keeps it in this process
+    _argv("--rate", 1e12, "--count", n, "--workers", 0, "--report-every", 1e9,
+          "--out", os.path.join(work, "orders_events_stream.jsonl"))
+    e.main()
+    return _lines(os.path.join(work, "orders_events_stream.jsonl"))
+
+def seed_sqlite(n, work):
+    import sqlite_seed as s
+    s.main([])
+    return _count(os.environ["SQLITE_DB"], s.TABLES)
+
+def extract_sqlite(n, work):
+    import extract_and_load_to_snowflake as x
+    target = os.path.join(work, "staging.db")
+    x.main(["--sink", "sqlite", "--target", target, "--replace"])  # --repeat must not append duplicates
+    return _count(target, x.RAW_MAP.values())
+
+def cdc_promote(n, work):
+    import cdc_promote as c
+    # a fresh layer file every run, so each repeat is a first promotion of every row
+    db = os.path.join(work, "layers.db")
+    if os.path.exists(db):
+        os.remove(db)
+    c.main(["--db", db, "--staging", os.path.join(work, "staging.db")])
+    return _count(db, [c.layer_table(t, "dev") for t in c.TABLES])
+
+def prd_wines(n, work):
+    import prd_wines as p
+    db = os.path.join(work, "layers.db")
+    p.main(["--db", db, "--src", "dev_products"])
+    return _count(db, ["dev_products"])
+
+def _lines(path):
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+
+def _count(db, tables):
+    import sqlite3
+    with sqlite3.connect(db) as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables)
+
+# name -> (function, largest scale it is run at, stages whose output it needs)
+STAGES = {
+    "gen_products": (gen_products, None, []),
+    "gen_consumers": (gen_consumers, None, []),
+    "gen_orders": (gen_orders, None, []),
+    "customer_generator": (customer_generator, None, []),
+    # builds every event in memory before writing; 10M events do not fit on a laptop
+    "events_batch": (events_batch, 1_000_000, []),
+    "events_stream": (events_stream, None, []),
+    "sqlite_seed": (seed_sqlite, None, ["gen_products", "gen_consumers", "gen_orders"]),
+    "extract_sqlite": (extract_sqlite, None, ["sqlite_seed"]),
+    "cdc_promote": (cdc_promote, None, ["extract_sqlite"]),
+    "prd_wines": (prd_wines, None, ["cdc_promote"]),
+}
+
+def child(name, n, work, result_path):
+    fn = STAGES[name][0]
+    sys.stdout = sys.stderr = open(os.path.join(work, f"{name}.log"), "w", buffering=1)  # the scripts' own output
+    t0 = time.perf_counter()
+    rows = fn(n, work)
+    seconds = time.perf_counter() - t0
+    with open(result_path, "w") as f:
+        json.dump({"rows": int(rows), "seconds": seconds}, f)
+
+# ---- parent ----
+
+def parse_scale(s):
+    s = s.strip().lower()
+    mult = {"k": 10**3, "m": 10**6, "g": 10**9}.get(s[-1])
+    return int(float(s[:-1]) * mult) if mult else int(s)
+
+def run_stage(name, n, work):
+    result_path = os.path.join(work, f"{name}.result.json")
+    env = dict(os.environ, OUT_DIR=work, DATA_DIR=work, SQLITE_DB=os.path.join(work, "winenot.db"),
+               EXTRACT_STATE=os.path.join(work, ".extract_state.json"), GEN_NOW=GEN_NOW)
+    env.setdefault("METRICS", "on")  # measure the scripts as the pipeline runs them, spans included
+    t0 = time.perf_counter()
+    p = subprocess.Popen([sys.executable, os.path.abspath(__file__), "_stage", name, str(n), work, result_path],
+                         env=env, cwd=work)
+    _, status, usage = os.wait4(p.pid, 0)
+    p.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    if p.returncode != 0 or not os.path.exists(result_path):
+        log = os.path.join(work, f"{name}.log")
+        if os.path.exists(log):
+            with open(log, errors="replace") as f:
+                print("".join(f.readlines()[-15:]), file=sys.stderr)
+        return {"error": f"exit code {p.returncode}", "wall_seconds": round(wall, 3), "peak_rss_mb": round(rss / 2**20, 1)}
+    with open(result_path) as f:
+        r = json.load(f)
+    return {"rows": r["rows"], "seconds": round(r["seconds"], 3), "wall_seconds": round(wall, 3),
+            "rows_per_s": round(r["rows"] / max(r["seconds"], 1e-9), 1), "peak_rss_mb": round(rss / 2**20, 1)}
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+    except OSError:
+        return None
+
+def best_of(name, n, work, repeat):
+    """Fastest of `repeat` runs (less noise at small scales); peak RSS is the highest seen."""
+    runs = [run_stage(name, n, work) for _ in range(repeat)]
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return runs[-1]
+    best = dict(min(ok, key=lambda r: r["seconds"]), repeat=repeat)
+    best["peak_rss_mb"] = max(r["peak_rss_mb"] for r in ok)
+    return best
+
+def run(scales, stages, out_path=None, keep=False, repeat=1):
+    commit = git_commit()
+    doc = {"schema_version": SCHEMA_VERSION, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+           "git_commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+           "cpus": os.cpu_count(), "scales": scales, "results": {}}
+    for n in scales:
+        work = tempfile.mkdtemp(prefix=f"winenot-bench-{n}-")
+        done = set()
+        try:
+            for name in stages:
+                fn, max_rows, needs = STAGES[name]
+                if max_rows and n > max_rows:
+                    r = {"skipped": f"only run up to {max_rows:,} rows"}
+                elif not set(needs) <= done:
+                    r = {"skipped": f"needs {', '.join(sorted(set(needs) - done))}"}
+                else:
+                    r = best_of(name, n, work, repeat)
+                    if "error" not in r:
+                        done.add(name)
+                doc["results"].setdefault(name, {})[str(n)] = r
+                print(f"{name:>20} {n:>12,}  " + (
+                    f"{r['rows']:>12,} rows  {r['seconds']:>8.2f}s  {r['rows_per_s']:>12,.0f} rows/s  "
+                    f"{r['peak_rss_mb']:>8.1f} MB" if "rows" in r else r.get("error") or r["skipped"]), flush=True)
+        finally:
+            if keep:
+                print(f"kept {work}")
+            else:
+                shutil.rmtree(work, ignore_errors=True)
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        out_path = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'nogit'}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1)
+    print(f"Results → {out_path}")
+    return out_path
+
+def compare(base_path, new_path, threshold=THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """Print per stage/scale changes; returns the list of regressions."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for doc, path in [(base, base_path), (new, new_path)]:
+        if doc.get("schema_version") != SCHEMA_VERSION:
+            raise SystemExit(f"{path}: schema_version {doc.get('schema_version')}, expected {SCHEMA_VERSION}")
+    regressions = []
+    print(f"{base.get('git_commit')} → {new.get('git_commit')}")
+    for stage, by_scale in new["results"].items():
+        for scale, r in by_scale.items():
+            b = base["results"].get(stage, {}).get(scale)
+            if not b or "rows_per_s" not in b:
+                continue
+            if "rows_per_s" not in r:
+                if "error" in r:
+                    regressions.append(f"{stage}@{scale}: {r['error']}")
+                    print(f"{stage:>20} {int(scale):>12,}  FAILED ({r['error']})")
+                continue
+            speed = r["rows_per_s"] / b["rows_per_s"] - 1
+            rss = r["peak_rss_mb"] / max(b["peak_rss_mb"], 1e-9) - 1
+            flag = ""
+            if speed < -threshold:
+                flag += " SLOWER"; regressions.append(f"{stage}@{scale}: rows/s {speed:+.1%}")
+            if rss > rss_threshold:
+                flag += " MORE-MEMORY"; regressions.append(f"{stage}@{scale}: peak RSS {rss:+.1%}")
+            print(f"{stage:>20} {int(scale):>12,}  rows/s {speed:+7.1%}  peak RSS {rss:+7.1%}{flag}")
+    print("No regressions." if not regressions else f"{len(regressions)} regression(s).")
+    return regressions
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["_stage"]:
+        name, n, work, result_path = argv[1:5]
+        return child(name, int(n), work, result_path)
+    ap = argparse.ArgumentParser(description="Benchmark the pipeline stages at several scales.")
+    sub = ap.add_subparsers(dest="cmd")
+    r = sub.add_parser("run", help="run the benchmarks (default)")
+    r.add_argument("--scales", default=SCALES, help=f"comma-separated row counts, e.g. {SCALES}")
+    r.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    r.add_argument("--out", help="result file (default: benchmarks/results/<utc time>-<commit>.json)")
+    r.add_argument("--baseline", help="compare with this result file afterwards; exit 1 on regression")
+    r.add_argument("--threshold", type=float, default=THRESHOLD)
+    r.add_argument("--rss-threshold", type=float, default=RSS_THRESHOLD)
+    r.add_argument("--repeat", type=int, default=1, help="run every stage N times and keep the fastest")
+    r.add_argument("--keep", action="store_true", help="keep the work directories")
+    c = sub.add_parser("compare", help="compare two result files; exit 1 on regression")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed drop in rows/s (0.15 = 15%%)")
+    c.add_argument("--rss-threshold", type=float, default=RSS_THRESHOLD, help="allowed growth of peak RSS")
+    args = ap.parse_args(argv or ["run"])
+
+    if args.cmd == "compare":
+        if compare(args.base, args.new, args.threshold, args.rss_threshold):
+            raise SystemExit(1)
+        return
+    out = run([parse_scale(s) for s in args.scales.split(",")], args.stages, args.out, args.keep, args.repeat)
+    if args.baseline and compare(args.baseline, out, args.threshold, args.rss_threshold):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,222 +1,411 @@
-import pandas as pd
-import random
-from faker import Faker
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
-from dotenv import load_dotenv
 import os
-import string
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from dotenv import load_dotenv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "src", "generate"))
+sys.path.insert(0, os.path.join(HERE, "src", "ingest"))
+sys.path.insert(0, os.path.join(HERE, "src"))
+from value_pools import ValuePools, random_datetimes
+from columnar import Batch, Categorical, int_dtype
+from extract_and_load_to_snowflake import load_state, save_state
+import instrumentation as ins
 
 load_dotenv()
 
-try:
-    conn = snowflake.connector.connect(
-        user=os.getenv("SNOWFLAKE_USER"),
-        password=os.getenv("SNOWFLAKE_PASSWORD"),
-        account=os.getenv("SNOWFLAKE_ACCOUNT"),
-        warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-        database=os.getenv("SNOWFLAKE_DATABASE"),
-        schema=os.getenv("SNOWFLAKE_SCHEMA"),
-        role=os.getenv("SNOWFLAKE_ROLE"),
-    )
-
-    def generate_customers(customers: int, seed: int = 42) -> pd.DataFrame:
-        random.seed(seed)
-        fake = Faker('fr_FR')
-        Faker.seed(seed)
-
-        rows = []
-        for cid in range(1, customers + 1):
-            name = fake.name()
-            email = f"{fake.user_name()}@gmail.com" if random.random() > 0.1 else None
-            address = fake.street_address() if random.random() > 0.1 else None
-            city = fake.city()
-            password = fake.password(length=12)
-
-            rows.append(
-                {
-                    "customer_id": cid,
-                    "customer_name": name,
-                    "customer_email": email,
-                    "password": password,
-                    "address": address,
-                    "city": city
-                }
-            )
-
-        df = pd.DataFrame(rows)
-        return df
-
-    customers_df = generate_customers(customers=50, seed=42)
-
-    table_name_customers = "CUSTOMERS"
-    write_pandas(
-        conn,
-        customers_df,
-        table_name_customers,
-        auto_create_table=True,
-        overwrite=False,
-    )
-
-    def generate_wines(wines: int = 500, seed: int = 42) -> pd.DataFrame:
-        random.seed(seed)
-        fake = Faker('fr_FR')
-        Faker.seed(seed)
-
-        colors = ['white', 'red', 'orange']
-        sweetness_levels = ['dry', 'off-dry', 'sweet']
-        bottle_sizes = [0.375, 0.75, 1.5]
-        grapes_list = [
-            'Merlot', 'Grenache', 'Viognier', 'Pinot Gris', 'Tempranillo', 'Albarino', 'Chardonnay',
-            'Semillon', 'Riesling', 'Pinot Noir', 'Rkatsiteli', 'Sangiovese', 'Syrah', 'Nebbiolo',
-            'Chenin Blanc', 'Gewurztraminer', 'Sauvignon Blanc', 'Cabernet Sauvignon', 'Muscadet',
-            'Zinfandel', 'Malbec'
-        ]
-
-        country_data = {
-            'France': {
-                'regions': ['Rhone', 'Bordeaux', 'Loire', 'Alsace', 'Provence', 'Jura', 'Champagne', 'Languedoc', 'Beaujolais', 'Burgundy'],
-                'appellations': {
-                    'Rhone': ['Crozes-Hermitage', 'Hermitage', 'Cote-Rotie', 'Chateauneuf-du-Pape'],
-                    'Bordeaux': ['Saint-Emilion', 'Pomerol', 'Graves', 'Medoc', 'Pauillac'],
-                    'Loire': ['Vouvray', 'Muscadet', 'Sancerre', 'Chinon'],
-                    'Alsace': ['Alsace AOC'],
-                    'Provence': ["Coteaux d'Aix", 'Cotes de Provence'],
-                    'Jura': ['Arbois'],
-                    'Champagne': ['Champagne AOC'],
-                    'Languedoc': ['Corbieres', 'Minervois', 'Faugeres'],
-                    'Beaujolais': ['Fleurie', 'Moulin-a-Vent', 'Beaujolais-Villages'],
-                    'Burgundy': ['Maconnais', 'Cote de Beaune', 'Cote de Nuits']
-                },
-                'region_codes': {
-                    'Rhone': 'RHO', 'Bordeaux': 'BOR', 'Loire': 'LOI', 'Alsace': 'ALS',
-                    'Provence': 'PRO', 'Jura': 'JUR', 'Champagne': 'CHA', 'Languedoc': 'LAN',
-                    'Beaujolais': 'BEA', 'Burgundy': 'BUR'
-                }
-            },
-            'Georgia': {
-                'regions': ['Kakheti'],
-                'appellations': {'Kakheti': ['Kakheti PDO']},
-                'region_codes': {'Kakheti': 'KAK'}
-            },
-            'Italy': {
-                'regions': ['Tuscany', 'Sicily', 'Piedmont', 'Veneto'],
-                'appellations': {
-                    'Tuscany': ['Brunello di Montalcino', 'Chianti Classico', 'Bolgheri'],
-                    'Sicily': ['Etna', "Nero d'Avola IGT"],
-                    'Piedmont': ['Langhe', 'Barbaresco', 'Barolo'],
-                    'Veneto': ['Prosecco', 'Valpolicella', 'Soave']
-                },
-                'region_codes': {
-                    'Tuscany': 'TUS', 'Sicily': 'SIC', 'Piedmont': 'PIE', 'Veneto': 'VEN'
-                }
-            },
-            'Spain': {
-                'regions': ['Rioja', 'Ribera del Duero', 'Rias Baixas'],
-                'appellations': {
-                    'Rioja': ['Rioja DOCa'],
-                    'Ribera del Duero': ['Ribera del Duero DO'],
-                    'Rias Baixas': ['Rias Baixas DO']
-                },
-                'region_codes': {
-                    'Rioja': 'RIO', 'Ribera del Duero': 'RIB', 'Rias Baixas': 'RIA'
-                }
-            }
-        }
-
-        rows = []
-        for wid in range(1, wines + 1):
-            country = random.choice(list(country_data.keys()))
-            regions = country_data[country]['regions']
-            region = random.choice(regions)
-            appellations = country_data[country]['appellations'][region]
-            appellation = random.choice(appellations)
-            region_code = country_data[country]['region_codes'][region]
-
-            vintage = random.randint(1980, 2025)
-            num_grapes = random.randint(1, 3)
-            grapes = ', '.join(random.sample(grapes_list, num_grapes))
-
-            alcohol_percent = round(random.uniform(11.0, 16.0), 1)
-            bottle_size_l = random.choice(bottle_sizes)
-            sweetness = random.choice(sweetness_levels)
-            tannin = random.randint(1, 5)
-            acidity = random.randint(1, 5)
-            rating = round(random.uniform(80.0, 100.0), 1)
-            price_eur = round(random.uniform(5.0, 100.0), 2)
-            producer = random.choice(['Maison', 'Chateau', 'Domaine', 'Bodegas', 'Cantina', 'Winery', 'Estate', 'Marani']) + ' ' + fake.last_name()
-            stock_quantity = random.randint(0, 250)
-
-            id_padded = f"{wid:04d}"
-            random_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
-            reference = f"WN-{vintage}-{region_code}-{id_padded}-{random_code}"
-
-            rows.append({
-                "id": wid,
-                "reference": reference,
-                "color": random.choice(colors),
-                "country": country,
-                "region": region,
-                "appellation": appellation,
-                "vintage": vintage,
-                "grapes": grapes,
-                "alcohol_percent": alcohol_percent,
-                "bottle_size_l": bottle_size_l,
-                "sweetness": sweetness,
-                "tannin": tannin,
-                "acidity": acidity,
-                "rating": rating,
-                "price_eur": price_eur,
-                "producer": producer,
-                "stock_quantity": stock_quantity
-            })
-
-        df = pd.DataFrame(rows)
-        return df
-
-    wines_df = generate_wines(wines=500, seed=42)
-
-    table_name_wines = "WINES"
-    write_pandas(
-        conn,
-        wines_df,
-        table_name_wines,
-        auto_create_table=True,
-        overwrite=False,
-    )
-
-    fake = Faker('fr_FR')
-    random.seed(42)
-    rows = []
-    customer_ids = list(customers_df["customer_id"])
-    wine_ids = list(wines_df["id"])
-    for oid in range(1, 101):
-        rows.append({
-            "order_id": oid,
-            "wine_id": random.choice(wine_ids),
-            "customer_id": random.choice(customer_ids),
-            "order_date": fake.date_time_between(start_date="-1y", end_date="now"),
-            "status": random.choice(["pending", "shipped", "delivered"]),
-            "quantity": random.randint(1, 10)
-        })
-
-    orders_df = pd.DataFrame(rows)
-
-    table_name_orders = "ORDERS"
-    write_pandas(
-        conn,
-        orders_df,
-        table_name_orders,
-        auto_create_table=True,
-        overwrite=False,
-    )
-
-    print(f"Inserted {len(customers_df)} customers into {table_name_customers}")
-    print(f"Inserted {len(orders_df)} orders into {table_name_orders}")
-    print(f"Inserted {len(wines_df)} wines into {table_name_wines}")
-
-except ImportError as e:
-    print(f"Error: {e}. Please ensure required packages are installed with '/opt/miniconda3/bin/pip install pandas faker snowflake-connector-python python-dotenv' and try again.")
-finally:
-    if 'conn' in locals():
-        conn.close()
+# Bulk generator for the CUSTOMERS, WINES and ORDERS tables, in fixed-size chunks:
+#
+#   python data_generator_in_snowflake.py --orders 100000000 --sink sqlite --target bulk.db
+#
+# Chunk k of a table holds ids k*chunk_rows+1 .. (k+1)*chunk_rows and is drawn from its own
+# seeded stream, so any chunk can be regenerated on its own and memory holds one chunk.
+# After each chunk is written its id goes into the checkpoint (GEN_STATE). A rerun with
+# the same options skips the recorded chunks. It first deletes whatever an unfinished
+# run wrote past them (with no checkpoint, every row), so nothing is written twice.
+# Sinks: Snowflake (write_pandas over one connection), SQLite and Parquet, for offline runs.
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 100_000))
+GEN_STATE = os.getenv("GEN_STATE", ".generate_state.json")
+GEN_NOW = os.getenv("GEN_NOW")  # ISO timestamp used as "now"; otherwise the first run's, kept in GEN_STATE
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
+SEED = 42
+
+SF = dict(
+    user=os.getenv("SNOWFLAKE_USER"),
+    password=os.getenv("SNOWFLAKE_PASSWORD"),
+    account=os.getenv("SNOWFLAKE_ACCOUNT"),
+    warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
+    database=os.getenv("SNOWFLAKE_DATABASE"),
+    schema=os.getenv("SNOWFLAKE_SCHEMA"),
+    role=os.getenv("SNOWFLAKE_ROLE"),
+)
+
+COLORS = ["white", "red", "orange"]
+SWEETNESS = ["dry", "off-dry", "sweet"]
+BOTTLE_SIZES = np.array([0.375, 0.75, 1.5])
+PRODUCER_PREFIXES = np.array(["Maison", "Chateau", "Domaine", "Bodegas", "Cantina", "Winery", "Estate", "Marani"], dtype=object)
+GRAPES = [
+    "Merlot", "Grenache", "Viognier", "Pinot Gris", "Tempranillo", "Albarino", "Chardonnay",
+    "Semillon", "Riesling", "Pinot Noir", "Rkatsiteli", "Sangiovese", "Syrah", "Nebbiolo",
+    "Chenin Blanc", "Gewurztraminer", "Sauvignon Blanc", "Cabernet Sauvignon", "Muscadet",
+    "Zinfandel", "Malbec",
+]
+STATUSES = ["pending", "shipped", "delivered"]
+CODE_CHARS = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"), dtype=object)
+
+# country -> region -> (region code, appellations)
+COUNTRY_DATA = {
+    "France": {
+        "Rhone": ("RHO", ["Crozes-Hermitage", "Hermitage", "Cote-Rotie", "Chateauneuf-du-Pape"]),
+        "Bordeaux": ("BOR", ["Saint-Emilion", "Pomerol", "Graves", "Medoc", "Pauillac"]),
+        "Loire": ("LOI", ["Vouvray", "Muscadet", "Sancerre", "Chinon"]),
+        "Alsace": ("ALS", ["Alsace AOC"]),
+        "Provence": ("PRO", ["Coteaux d'Aix", "Cotes de Provence"]),
+        "Jura": ("JUR", ["Arbois"]),
+        "Champagne": ("CHA", ["Champagne AOC"]),
+        "Languedoc": ("LAN", ["Corbieres", "Minervois", "Faugeres"]),
+        "Beaujolais": ("BEA", ["Fleurie", "Moulin-a-Vent", "Beaujolais-Villages"]),
+        "Burgundy": ("BUR", ["Maconnais", "Cote de Beaune", "Cote de Nuits"]),
+    },
+    "Georgia": {"Kakheti": ("KAK", ["Kakheti PDO"])},
+    "Italy": {
+        "Tuscany": ("TUS", ["Brunello di Montalcino", "Chianti Classico", "Bolgheri"]),
+        "Sicily": ("SIC", ["Etna", "Nero d'Avola IGT"]),
+        "Piedmont": ("PIE", ["Langhe", "Barbaresco", "Barolo"]),
+        "Veneto": ("VEN", ["Prosecco", "Valpolicella", "Soave"]),
+    },
+    "Spain": {
+        "Rioja": ("RIO", ["Rioja DOCa"]),
+        "Ribera del Duero": ("RIB", ["Ribera del Duero DO"]),
+        "Rias Baixas": ("RIA", ["Rias Baixas DO"]),
+    },
+}
+
+COUNTRIES = list(COUNTRY_DATA)
+REGIONS = [r for c in COUNTRIES for r in COUNTRY_DATA[c]]
+REGION_CODES = np.array([COUNTRY_DATA[c][r][0] for c in COUNTRIES for r in COUNTRY_DATA[c]], dtype=object)
+APPELLATIONS = [a for c in COUNTRIES for r in COUNTRY_DATA[c] for a in COUNTRY_DATA[c][r][1]]
+# first region of each country and its region count; same for the appellations of each region
+REGION_START = np.cumsum([0] + [len(COUNTRY_DATA[c]) for c in COUNTRIES])[:-1]
+REGION_COUNT = np.array([len(COUNTRY_DATA[c]) for c in COUNTRIES])
+APPELLATION_START = np.cumsum([0] + [len(COUNTRY_DATA[c][r][1]) for c in COUNTRIES for r in COUNTRY_DATA[c]])[:-1]
+APPELLATION_COUNT = np.array([len(COUNTRY_DATA[c][r][1]) for c in COUNTRIES for r in COUNTRY_DATA[c]])
+
+def _grape_blends():
+    """Every ordered blend of 1-3 distinct grapes, in itertools.permutations order per size."""
+    from itertools import permutations
+    return [", ".join(p) for k in (1, 2, 3) for p in permutations(GRAPES, k)]
+
+GRAPE_BLENDS = _grape_blends()
+
+# ---- chunks: one Batch per (table, chunk id), from the chunk's own random stream ----
+
+def chunk_ids(k, n, chunk_rows):
+    return np.arange(k * chunk_rows + 1, min((k + 1) * chunk_rows, n) + 1, dtype=np.int64)
+
+def customer_chunk(k, n, chunk_rows, seed=SEED, pools=None):
+    pools = pools or ValuePools("fr_FR", seed)
+    rng = np.random.default_rng([seed, k, 1])
+    ids = chunk_ids(k, n, chunk_rows)
+    m = len(ids)
+    emails = pools.unique_emails(ids, rng, domain="gmail.com")
+    address = pools.sample_codes("street_address", m, rng)
+    return Batch({
+        "customer_id": ids,
+        "customer_name": Categorical(pools.sample_codes("name", m, rng), pools["name"]),
+        "customer_email": np.where(rng.random(m) > 0.1, emails, None),
+        "password": Categorical(pools.sample_codes("password", m, rng), pools["password"]),
+        "address": Categorical(np.where(rng.random(m) > 0.1, address, -1), pools["street_address"]),
+        "city": Categorical(pools.sample_codes("city", m, rng), pools["city"]),
+    })
+
+def wine_chunk(k, n, chunk_rows, seed=SEED, pools=None):
+    pools = pools or ValuePools("fr_FR", seed)
+    rng = np.random.default_rng([seed, k, 2])
+    ids = chunk_ids(k, n, chunk_rows)
+    m = len(ids)
+    country = rng.integers(0, len(COUNTRIES), size=m)
+    region = REGION_START[country] + (rng.random(m) * REGION_COUNT[country]).astype(np.int64)
+    appellation = APPELLATION_START[region] + (rng.random(m) * APPELLATION_COUNT[region]).astype(np.int64)
+    vintage = rng.integers(1980, 2025, size=m, endpoint=True).astype(np.int16)
+    # a blend of 1-3 distinct grapes as its index in GRAPE_BLENDS: first grape, then ranks among those left
+    size = rng.integers(1, 3, size=m, endpoint=True)
+    g = len(GRAPES)
+    g1, r2, r3 = rng.integers(0, g, size=m), rng.integers(0, g - 1, size=m), rng.integers(0, g - 2, size=m)
+    grapes = np.select([size == 1, size == 2], [g1, g + g1 * (g - 1) + r2],
+                       g + g * (g - 1) + g1 * (g - 1) * (g - 2) + r2 * (g - 2) + r3)
+    code = CODE_CHARS[rng.integers(0, len(CODE_CHARS), size=(m, 3))]
+    reference = ("WN-" + vintage.astype(str).astype(object) + "-" + REGION_CODES[region] + "-"
+                 + np.char.zfill(ids.astype(str), 4).astype(object) + "-" + code[:, 0] + code[:, 1] + code[:, 2])
+    producer = (PRODUCER_PREFIXES[rng.integers(0, len(PRODUCER_PREFIXES), size=m)] + " "
+                + pools.sample("last_name", m, rng))
+    return Batch({
+        "id": ids,
+        "reference": reference,
+        "color": Categorical(rng.integers(0, len(COLORS), size=m), COLORS),
+        "country": Categorical(country, COUNTRIES),
+        "region": Categorical(region, REGIONS),
+        "appellation": Categorical(appellation, APPELLATIONS),
+        "vintage": vintage,
+        "grapes": Categorical(grapes, GRAPE_BLENDS),
+        "alcohol_percent": np.round(rng.uniform(11.0, 16.0, size=m), 1),
+        "bottle_size_l": BOTTLE_SIZES[rng.integers(0, len(BOTTLE_SIZES), size=m)],
+        "sweetness": Categorical(rng.integers(0, len(SWEETNESS), size=m), SWEETNESS),
+        "tannin": rng.integers(1, 5, size=m, endpoint=True).astype(np.int8),
+        "acidity": rng.integers(1, 5, size=m, endpoint=True).astype(np.int8),
+        "rating": np.round(rng.uniform(80.0, 100.0, size=m), 1),
+        "price_eur": np.round(rng.uniform(5.0, 100.0, size=m), 2),
+        "producer": producer,
+        "stock_quantity": rng.integers(0, 250, size=m, endpoint=True).astype(np.int16),
+    })
+
+def order_chunk(k, n, chunk_rows, seed=SEED, now=None, n_customers=50, n_wines=500):
+    now = now or datetime.now()
+    rng = np.random.default_rng([seed, k, 3])
+    ids = chunk_ids(k, n, chunk_rows)
+    m = len(ids)
+    return Batch({
+        "order_id": ids,
+        "wine_id": rng.integers(1, n_wines, size=m, endpoint=True).astype(int_dtype(n_wines)),
+        "customer_id": rng.integers(1, n_customers, size=m, endpoint=True).astype(int_dtype(n_customers)),
+        "order_date": random_datetimes(now - timedelta(days=365), now, m, rng).astype("datetime64[s]"),
+        "status": Categorical(rng.integers(0, len(STATUSES), size=m), STATUSES),
+        "quantity": rng.integers(1, 10, size=m, endpoint=True).astype(np.int8),
+    })
+
+# ---- sinks: write(batch, table) -> (success, nchunks, nrows, output), delete_after(table,
+# col, value) for rows with col > value (value None: all rows), reset() and close() ----
+
+class SnowflakeSink:
+    """write_pandas over one connection; tables are created from the first chunk."""
+    def __init__(self, params=SF):
+        self.params, self._conn = params, None
+
+    def conn(self):
+        if self._conn is None or self._conn.is_closed():
+            try:
+                import snowflake.connector
+            except ImportError:
+                raise SystemExit("The Snowflake sink needs: pip install 'snowflake-connector-python[pandas]'")
+            self._conn = snowflake.connector.connect(**self.params)
+        return self._conn
+
+    def write(self, batch, table):
+        from snowflake.connector.pandas_tools import write_pandas
+        return write_pandas(self.conn(), batch.to_pandas(), table, auto_create_table=True, overwrite=False)
+
+    def delete_after(self, table, col, value):
+        cur = self.conn().cursor()
+        try:
+            cur.execute("SELECT COUNT(*) FROM information_schema.tables "
+                        "WHERE table_schema = CURRENT_SCHEMA() AND table_name = %s", (table,))
+            if not cur.fetchone()[0]:
+                return 0
+            # write_pandas quotes identifiers, so the columns keep their lower-case names
+            if value is None:
+                cur.execute(f"DELETE FROM {table}")
+            else:
+                cur.execute(f'DELETE FROM {table} WHERE "{col}" > %s', (value,))
+            return cur.rowcount
+        finally:
+            cur.close()
+
+    def reset(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def close(self):
+        self.reset()
+
+def sqlite_type(col):
+    if isinstance(col, Categorical) or col.dtype.kind in "OUM":
+        return "TEXT"
+    return "INTEGER" if col.dtype.kind in "iu" else "REAL"
+
+class SQLiteSink:
+    """Offline stand-in for Snowflake; the first column (the id) is the INTEGER PRIMARY KEY."""
+    def __init__(self, path):
+        self.path, self._conn = path, None
+
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+        return self._conn
+
+    def write(self, batch, table):
+        conn = self.conn()
+        cols = [f"{name} {sqlite_type(col)}" for name, col in batch.columns.items()]
+        cols[0] += " PRIMARY KEY"
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(cols)})")
+            batch.to_sqlite(conn, table)
+        return True, 1, len(batch), []
+
+    def delete_after(self, table, col, value):
+        conn = self.conn()
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            return 0
+        with conn:
+            if value is None:
+                return conn.execute(f"DELETE FROM {table}").rowcount
+            return conn.execute(f"DELETE FROM {table} WHERE {col} > ?", (value,)).rowcount
+
+    def reset(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close(); self._conn = None
+
+class ParquetSink:
+    """<target>/<table>/part-<first id>.parquet, one file per chunk (written to a temp name, then renamed)."""
+    def __init__(self, path):
+        self.path = path
+
+    def _parts(self, table):
+        d = os.path.join(self.path, table)
+        if not os.path.isdir(d):
+            return []
+        return [(int(f[5:-8]), os.path.join(d, f)) for f in sorted(os.listdir(d))
+                if f.startswith("part-") and f.endswith(".parquet")]
+
+    def write(self, batch, table):
+        import pyarrow.parquet as pq
+        d = os.path.join(self.path, table)
+        os.makedirs(d, exist_ok=True)
+        first = int(batch[batch.names[0]][0])
+        path = os.path.join(d, f"part-{first:012d}.parquet")
+        pq.write_table(batch.to_arrow(), f"{path}.tmp", compression="zstd")
+        os.replace(f"{path}.tmp", path)
+        return True, 1, len(batch), []
+
+    def delete_after(self, table, col, value):
+        # chunks never straddle a checkpoint boundary, so whole files go
+        import pyarrow.parquet as pq
+        n = 0
+        for first, path in self._parts(table):
+            if value is None or first > value:
+                n += pq.read_metadata(path).num_rows
+                os.remove(path)
+        return n
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_sink(kind, target=None):
+    if kind == "snowflake":
+        return SnowflakeSink()
+    if kind == "sqlite":
+        return SQLiteSink(target or "bulk_local.db")
+    if kind == "parquet":
+        return ParquetSink(target or os.path.join("data", "bulk"))
+    raise ValueError(f"unknown sink {kind!r}")
+
+# ---- chunked, resumable load ----
+
+class PartialWrite(Exception):
+    """The sink reported a failed or short write for a chunk."""
+
+def write_chunk(sink, batch, table, col, after, retries=MAX_RETRIES, backoff=1.0):
+    """Write one chunk; before a retry, drop whatever the failed attempt left behind.
+
+    A write that raises or reports success=False or fewer rows than the chunk is retried,
+    so the caller only checkpoints chunks that fully landed.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            result = sink.write(batch, table)
+            ok, _, nrows, _ = result
+            if not ok or nrows != len(batch):
+                raise PartialWrite(f"write reported success={ok} with {nrows} of {len(batch)} rows")
+            return result
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"{table}: chunk of {len(batch)} rows failed ({e}); retry {attempt}/{retries - 1}")
+            ins.count("write_retries", table=table)
+            sink.reset()
+            time.sleep(backoff * 2 ** (attempt - 1))
+            sink.delete_after(table, col, after)
+
+def load_table(sink, table, col, n, chunk_rows, make, state, state_path=GEN_STATE):
+    """Generate and write the chunks of one table that the checkpoint does not list yet."""
+    done = set(state["done"].get(table, []))
+    first = 0
+    while first in done:
+        first += 1
+    # chunks are written in order: only a contiguous prefix counts, and anything past it is a leftover
+    removed = sink.delete_after(table, col, first * chunk_rows)
+    if removed:
+        print(f"{table}: removed {removed:,} rows left by an unfinished run.")
+    n_chunks = -(-n // chunk_rows)
+    rows, t0 = 0, time.perf_counter()
+    with ins.span("generate_load", table=table) as s:
+        for k in range(first, n_chunks):
+            batch = make(k)
+            write_chunk(sink, batch, table, col, k * chunk_rows)
+            rows += len(batch); s.add(rows=len(batch))
+            state["done"][table] = list(range(k + 1))
+            save_state(state, state_path)
+    dt = time.perf_counter() - t0
+    skipped = f", {first} chunks already loaded" if first else ""
+    print(f"{table}: {rows:,} rows in {n_chunks - first} chunks, {dt:.1f}s ({rows / max(dt, 1e-9):,.0f} rows/s){skipped}.")
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate CUSTOMERS, WINES and ORDERS in resumable chunks into Snowflake, SQLite or Parquet.")
+    ap.add_argument("--customers", type=int, default=50)
+    ap.add_argument("--wines", type=int, default=500)
+    ap.add_argument("--orders", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--sink", choices=["snowflake", "sqlite", "parquet"], default="snowflake")
+    ap.add_argument("--target", help="database file (sqlite) or directory (parquet)")
+    ap.add_argument("--state", default=GEN_STATE, help="checkpoint of completed chunks")
+    ap.add_argument("--restart", action="store_true",
+                    help="ignore the checkpoint and regenerate everything (the sink's tables are emptied first)")
+    args = ap.parse_args(argv)
+
+    params = dict(customers=args.customers, wines=args.wines, orders=args.orders, seed=args.seed,
+                  chunk_rows=args.chunk_rows, sink=args.sink, target=args.target)
+    state = {} if args.restart else load_state(args.state)
+    if state and state.get("params") != params:
+        raise SystemExit(f"{args.state} was written with {state.get('params')}; rerun with the same options, "
+                         "or add --restart to start over")
+    if not state:
+        now = datetime.fromisoformat(GEN_NOW) if GEN_NOW else datetime.now().replace(microsecond=0)
+        state = {"params": params, "now": now.isoformat(), "done": {}}
+        save_state(state, args.state)
+    now = datetime.fromisoformat(state["now"])  # a resumed run keeps the first run's dates
+
+    pools = ValuePools("fr_FR", args.seed)
+    tables = [
+        ("CUSTOMERS", "customer_id", args.customers, lambda k: customer_chunk(k, args.customers, args.chunk_rows, args.seed, pools)),
+        ("WINES", "id", args.wines, lambda k: wine_chunk(k, args.wines, args.chunk_rows, args.seed, pools)),
+        ("ORDERS", "order_id", args.orders,
+         lambda k: order_chunk(k, args.orders, args.chunk_rows, args.seed, now, args.customers, args.wines)),
+    ]
+    sink = make_sink(args.sink, args.target)
+    t0 = time.perf_counter()
+    try:
+        n = sum(load_table(sink, table, col, size, args.chunk_rows, make, state, args.state)
+                for table, col, size, make in tables)
+    finally:
+        sink.close()
+    dt = time.perf_counter() - t0
+    print(f"Generated {n:,} rows in {dt:.1f}s ({n / max(dt, 1e-9):,.0f} rows/s) → {args.sink}; checkpoint {args.state}.")
+
+if __name__ == "__main__":
+    main()
@@ -26,25 +26,170 @@ CREATE OR REPLACE TABLE STAGING.ORDERS_RAW (
   ID INTEGER, CONSUMER_ID INTEGER, PRODUCT_ID INTEGER, QTY INTEGER, CHANNEL STRING, ORDER_TS TIMESTAMP_NTZ
 );
 
--- DEV destination (curated mirrors for now)
+-- DEV destination (curated mirrors for now); ROW_HASH drives the CDC promotion below
 CREATE OR REPLACE TABLE DEV.PRODUCTS LIKE STAGING.PRODUCTS_RAW;
 CREATE OR REPLACE TABLE DEV.CONSUMERS LIKE STAGING.CONSUMERS_RAW;
 CREATE OR REPLACE TABLE DEV.ORDERS   LIKE STAGING.ORDERS_RAW;
+ALTER TABLE DEV.PRODUCTS  ADD COLUMN ROW_HASH NUMBER(19,0);
+ALTER TABLE DEV.CONSUMERS ADD COLUMN ROW_HASH NUMBER(19,0);
+ALTER TABLE DEV.ORDERS    ADD COLUMN ROW_HASH NUMBER(19,0);
 
--- Simple promotion step (DEV <- STAGING)
+-- Changed keys per promotion (OP = I/U/D) and how far each downstream table has consumed them;
+-- SP_REFRESH prunes keys every consumer has applied, beyond the last few versions
+CREATE OR REPLACE TABLE DEV.CDC_CHANGES (TBL STRING, VERSION INTEGER, ID INTEGER, OP STRING);
+CREATE OR REPLACE TABLE DEV.CDC_OFFSETS (CONSUMER STRING, TBL STRING, VERSION INTEGER);
+CREATE OR REPLACE SEQUENCE DEV.CDC_VERSION_SEQ;
+-- Register the PRODUCTS consumers up front so pruning waits for their first run
+-- (PROD.WINES: SP_REFRESH below; PRD.WINES: extract_UAT_to_PRD.SQL)
+INSERT INTO DEV.CDC_OFFSETS (CONSUMER, TBL, VERSION) VALUES ('PROD.WINES', 'PRODUCTS', 0), ('PRD.WINES', 'PRODUCTS', 0);
+-- Ids the incremental extract wrote or deleted per *_RAW table since the last refresh;
+-- a row with ID NULL marks a table whose DEV copy may be diffed by those keys alone
+CREATE OR REPLACE TABLE STAGING.RAW_CHANGES (TBL STRING, ID INTEGER);
+
+-- Promotion step (DEV <- STAGING, PROD <- DEV): only inserted, updated or deleted rows are
+-- written; returns the counts. Generated by: python src/transform/cdc_promote.py sql
 CREATE OR REPLACE PROCEDURE DEV.SP_REFRESH()
 RETURNS STRING LANGUAGE SQL AS
 $$
-  MERGE INTO DEV.PRODUCTS t USING STAGING.PRODUCTS_RAW s ON t.ID = s.ID
-    WHEN MATCHED THEN UPDATE SET * = s.*
-    WHEN NOT MATCHED THEN INSERT *;
-  MERGE INTO DEV.CONSUMERS t USING STAGING.CONSUMERS_RAW s ON t.ID = s.ID
-    WHEN MATCHED THEN UPDATE SET * = s.*
-    WHEN NOT MATCHED THEN INSERT *;
-  MERGE INTO DEV.ORDERS t USING STAGING.ORDERS_RAW s ON t.ID = s.ID
-    WHEN MATCHED THEN UPDATE SET * = s.*
-    WHEN NOT MATCHED THEN INSERT *;
-  RETURN 'OK';
+BEGIN
+  LET v NUMBER := (SELECT DEV.CDC_VERSION_SEQ.NEXTVAL);
+
+  -- STAGING.PRODUCTS_RAW -> DEV.PRODUCTS: changed keys by hash diff, then a MERGE over those keys only.
+  -- The diff reads just the keys the extract logged when the marker row (ID NULL) says
+  -- DEV matched RAW before they were written, and both whole tables otherwise.
+  LET keyed_products BOOLEAN := (SELECT COUNT(*) > 0 FROM STAGING.RAW_CHANGES WHERE TBL = 'PRODUCTS_RAW' AND ID IS NULL);
+  IF (keyed_products) THEN
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'PRODUCTS', :v, k.ID,
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT DISTINCT ID FROM STAGING.RAW_CHANGES WHERE TBL = 'PRODUCTS_RAW' AND ID IS NOT NULL) k
+      LEFT JOIN (SELECT r.ID, HASH(r.REFERENCE, r.COLOR, r.COUNTRY, r.REGION, r.APPELLATION, r.VINTAGE, r.GRAPES, r.ALCOHOL_PERCENT, r.BOTTLE_SIZE_L, r.SWEETNESS, r.TANNIN, r.ACIDITY, r.RATING, r.PRICE_EUR, r.PRODUCER, r.STOCK_QUANTITY) AS ROW_HASH FROM STAGING.PRODUCTS_RAW r) s ON s.ID = k.ID
+      LEFT JOIN DEV.PRODUCTS t ON t.ID = k.ID
+      WHERE (s.ID IS NOT NULL OR t.ID IS NOT NULL)
+        AND (t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH);
+  ELSE
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'PRODUCTS', :v, COALESCE(s.ID, t.ID),
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT r.ID, HASH(r.REFERENCE, r.COLOR, r.COUNTRY, r.REGION, r.APPELLATION, r.VINTAGE, r.GRAPES, r.ALCOHOL_PERCENT, r.BOTTLE_SIZE_L, r.SWEETNESS, r.TANNIN, r.ACIDITY, r.RATING, r.PRICE_EUR, r.PRODUCER, r.STOCK_QUANTITY) AS ROW_HASH FROM STAGING.PRODUCTS_RAW r) s
+      FULL OUTER JOIN DEV.PRODUCTS t ON t.ID = s.ID
+      WHERE t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH;
+  END IF;
+  DELETE FROM STAGING.RAW_CHANGES WHERE TBL = 'PRODUCTS_RAW';
+  INSERT INTO STAGING.RAW_CHANGES (TBL, ID) VALUES ('PRODUCTS_RAW', NULL);
+  MERGE INTO DEV.PRODUCTS t
+  USING (SELECT c.ID AS CDC_ID, c.OP, r.*, HASH(r.REFERENCE, r.COLOR, r.COUNTRY, r.REGION, r.APPELLATION, r.VINTAGE, r.GRAPES, r.ALCOHOL_PERCENT, r.BOTTLE_SIZE_L, r.SWEETNESS, r.TANNIN, r.ACIDITY, r.RATING, r.PRICE_EUR, r.PRODUCER, r.STOCK_QUANTITY) AS NEW_HASH
+         FROM DEV.CDC_CHANGES c LEFT JOIN STAGING.PRODUCTS_RAW r ON r.ID = c.ID
+         WHERE c.TBL = 'PRODUCTS' AND c.VERSION = :v) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.OP = 'D' THEN DELETE
+  WHEN MATCHED THEN UPDATE SET t.REFERENCE = s.REFERENCE, t.COLOR = s.COLOR, t.COUNTRY = s.COUNTRY, t.REGION = s.REGION, t.APPELLATION = s.APPELLATION, t.VINTAGE = s.VINTAGE, t.GRAPES = s.GRAPES, t.ALCOHOL_PERCENT = s.ALCOHOL_PERCENT, t.BOTTLE_SIZE_L = s.BOTTLE_SIZE_L, t.SWEETNESS = s.SWEETNESS, t.TANNIN = s.TANNIN, t.ACIDITY = s.ACIDITY, t.RATING = s.RATING, t.PRICE_EUR = s.PRICE_EUR, t.PRODUCER = s.PRODUCER, t.STOCK_QUANTITY = s.STOCK_QUANTITY, t.ROW_HASH = s.NEW_HASH
+  WHEN NOT MATCHED AND s.OP = 'I' THEN INSERT (ID, REFERENCE, COLOR, COUNTRY, REGION, APPELLATION, VINTAGE, GRAPES, ALCOHOL_PERCENT, BOTTLE_SIZE_L, SWEETNESS, TANNIN, ACIDITY, RATING, PRICE_EUR, PRODUCER, STOCK_QUANTITY, ROW_HASH)
+    VALUES (s.ID, s.REFERENCE, s.COLOR, s.COUNTRY, s.REGION, s.APPELLATION, s.VINTAGE, s.GRAPES, s.ALCOHOL_PERCENT, s.BOTTLE_SIZE_L, s.SWEETNESS, s.TANNIN, s.ACIDITY, s.RATING, s.PRICE_EUR, s.PRODUCER, s.STOCK_QUANTITY, s.NEW_HASH);
+
+  -- DEV.PRODUCTS -> PROD.WINES: only the keys logged since PROD.WINES last consumed them
+  LET since_products NUMBER := (SELECT COALESCE(MAX(VERSION), 0) FROM DEV.CDC_OFFSETS
+                                WHERE CONSUMER = 'PROD.WINES' AND TBL = 'PRODUCTS');
+  MERGE INTO PROD.WINES t
+  USING (SELECT k.ID AS CDC_ID, d.*
+         FROM (SELECT DISTINCT ID FROM DEV.CDC_CHANGES
+               WHERE TBL = 'PRODUCTS' AND VERSION > :since_products AND VERSION <= :v) k
+         LEFT JOIN DEV.PRODUCTS d ON d.ID = k.ID) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.ID IS NULL THEN DELETE
+  WHEN MATCHED AND t.ROW_HASH IS DISTINCT FROM s.ROW_HASH THEN
+    UPDATE SET t.REFERENCE = s.REFERENCE, t.COLOR = s.COLOR, t.COUNTRY = s.COUNTRY, t.REGION = s.REGION, t.APPELLATION = s.APPELLATION, t.VINTAGE = s.VINTAGE, t.GRAPES = s.GRAPES, t.ALCOHOL_PERCENT = s.ALCOHOL_PERCENT, t.BOTTLE_SIZE_L = s.BOTTLE_SIZE_L, t.SWEETNESS = s.SWEETNESS, t.TANNIN = s.TANNIN, t.ACIDITY = s.ACIDITY, t.RATING = s.RATING, t.PRICE_EUR = s.PRICE_EUR, t.PRODUCER = s.PRODUCER, t.STOCK_QUANTITY = s.STOCK_QUANTITY, t.ROW_HASH = s.ROW_HASH
+  WHEN NOT MATCHED AND s.ID IS NOT NULL THEN INSERT (ID, REFERENCE, COLOR, COUNTRY, REGION, APPELLATION, VINTAGE, GRAPES, ALCOHOL_PERCENT, BOTTLE_SIZE_L, SWEETNESS, TANNIN, ACIDITY, RATING, PRICE_EUR, PRODUCER, STOCK_QUANTITY, ROW_HASH)
+    VALUES (s.ID, s.REFERENCE, s.COLOR, s.COUNTRY, s.REGION, s.APPELLATION, s.VINTAGE, s.GRAPES, s.ALCOHOL_PERCENT, s.BOTTLE_SIZE_L, s.SWEETNESS, s.TANNIN, s.ACIDITY, s.RATING, s.PRICE_EUR, s.PRODUCER, s.STOCK_QUANTITY, s.ROW_HASH);
+  MERGE INTO DEV.CDC_OFFSETS o USING (SELECT 'PROD.WINES' AS CONSUMER, 'PRODUCTS' AS TBL) n
+    ON o.CONSUMER = n.CONSUMER AND o.TBL = n.TBL
+    WHEN MATCHED THEN UPDATE SET o.VERSION = :v
+    WHEN NOT MATCHED THEN INSERT (CONSUMER, TBL, VERSION) VALUES (n.CONSUMER, n.TBL, :v);
+
+  -- keys every consumer of DEV.PRODUCTS has applied, older than the last 10 versions
+  DELETE FROM DEV.CDC_CHANGES WHERE TBL = 'PRODUCTS' AND VERSION <= :v - 10
+    AND VERSION <= (SELECT COALESCE(MIN(VERSION), :v) FROM DEV.CDC_OFFSETS WHERE TBL = 'PRODUCTS');
+
+  -- STAGING.CONSUMERS_RAW -> DEV.CONSUMERS: changed keys by hash diff, then a MERGE over those keys only.
+  -- The diff reads just the keys the extract logged when the marker row (ID NULL) says
+  -- DEV matched RAW before they were written, and both whole tables otherwise.
+  LET keyed_consumers BOOLEAN := (SELECT COUNT(*) > 0 FROM STAGING.RAW_CHANGES WHERE TBL = 'CONSUMERS_RAW' AND ID IS NULL);
+  IF (keyed_consumers) THEN
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'CONSUMERS', :v, k.ID,
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT DISTINCT ID FROM STAGING.RAW_CHANGES WHERE TBL = 'CONSUMERS_RAW' AND ID IS NOT NULL) k
+      LEFT JOIN (SELECT r.ID, HASH(r.NAME, r.EMAIL, r.COUNTRY, r.CREATED_AT) AS ROW_HASH FROM STAGING.CONSUMERS_RAW r) s ON s.ID = k.ID
+      LEFT JOIN DEV.CONSUMERS t ON t.ID = k.ID
+      WHERE (s.ID IS NOT NULL OR t.ID IS NOT NULL)
+        AND (t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH);
+  ELSE
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'CONSUMERS', :v, COALESCE(s.ID, t.ID),
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT r.ID, HASH(r.NAME, r.EMAIL, r.COUNTRY, r.CREATED_AT) AS ROW_HASH FROM STAGING.CONSUMERS_RAW r) s
+      FULL OUTER JOIN DEV.CONSUMERS t ON t.ID = s.ID
+      WHERE t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH;
+  END IF;
+  DELETE FROM STAGING.RAW_CHANGES WHERE TBL = 'CONSUMERS_RAW';
+  INSERT INTO STAGING.RAW_CHANGES (TBL, ID) VALUES ('CONSUMERS_RAW', NULL);
+  MERGE INTO DEV.CONSUMERS t
+  USING (SELECT c.ID AS CDC_ID, c.OP, r.*, HASH(r.NAME, r.EMAIL, r.COUNTRY, r.CREATED_AT) AS NEW_HASH
+         FROM DEV.CDC_CHANGES c LEFT JOIN STAGING.CONSUMERS_RAW r ON r.ID = c.ID
+         WHERE c.TBL = 'CONSUMERS' AND c.VERSION = :v) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.OP = 'D' THEN DELETE
+  WHEN MATCHED THEN UPDATE SET t.NAME = s.NAME, t.EMAIL = s.EMAIL, t.COUNTRY = s.COUNTRY, t.CREATED_AT = s.CREATED_AT, t.ROW_HASH = s.NEW_HASH
+  WHEN NOT MATCHED AND s.OP = 'I' THEN INSERT (ID, NAME, EMAIL, COUNTRY, CREATED_AT, ROW_HASH)
+    VALUES (s.ID, s.NAME, s.EMAIL, s.COUNTRY, s.CREATED_AT, s.NEW_HASH);
+
+  -- keys every consumer of DEV.CONSUMERS has applied, older than the last 10 versions
+  DELETE FROM DEV.CDC_CHANGES WHERE TBL = 'CONSUMERS' AND VERSION <= :v - 10
+    AND VERSION <= (SELECT COALESCE(MIN(VERSION), :v) FROM DEV.CDC_OFFSETS WHERE TBL = 'CONSUMERS');
+
+  -- STAGING.ORDERS_RAW -> DEV.ORDERS: changed keys by hash diff, then a MERGE over those keys only.
+  -- The diff reads just the keys the extract logged when the marker row (ID NULL) says
+  -- DEV matched RAW before they were written, and both whole tables otherwise.
+  LET keyed_orders BOOLEAN := (SELECT COUNT(*) > 0 FROM STAGING.RAW_CHANGES WHERE TBL = 'ORDERS_RAW' AND ID IS NULL);
+  IF (keyed_orders) THEN
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'ORDERS', :v, k.ID,
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT DISTINCT ID FROM STAGING.RAW_CHANGES WHERE TBL = 'ORDERS_RAW' AND ID IS NOT NULL) k
+      LEFT JOIN (SELECT r.ID, HASH(r.CONSUMER_ID, r.PRODUCT_ID, r.QTY, r.CHANNEL, r.ORDER_TS) AS ROW_HASH FROM STAGING.ORDERS_RAW r) s ON s.ID = k.ID
+      LEFT JOIN DEV.ORDERS t ON t.ID = k.ID
+      WHERE (s.ID IS NOT NULL OR t.ID IS NOT NULL)
+        AND (t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH);
+  ELSE
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT 'ORDERS', :v, COALESCE(s.ID, t.ID),
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT r.ID, HASH(r.CONSUMER_ID, r.PRODUCT_ID, r.QTY, r.CHANNEL, r.ORDER_TS) AS ROW_HASH FROM STAGING.ORDERS_RAW r) s
+      FULL OUTER JOIN DEV.ORDERS t ON t.ID = s.ID
+      WHERE t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH;
+  END IF;
+  DELETE FROM STAGING.RAW_CHANGES WHERE TBL = 'ORDERS_RAW';
+  INSERT INTO STAGING.RAW_CHANGES (TBL, ID) VALUES ('ORDERS_RAW', NULL);
+  MERGE INTO DEV.ORDERS t
+  USING (SELECT c.ID AS CDC_ID, c.OP, r.*, HASH(r.CONSUMER_ID, r.PRODUCT_ID, r.QTY, r.CHANNEL, r.ORDER_TS) AS NEW_HASH
+         FROM DEV.CDC_CHANGES c LEFT JOIN STAGING.ORDERS_RAW r ON r.ID = c.ID
+         WHERE c.TBL = 'ORDERS' AND c.VERSION = :v) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.OP = 'D' THEN DELETE
+  WHEN MATCHED THEN UPDATE SET t.CONSUMER_ID = s.CONSUMER_ID, t.PRODUCT_ID = s.PRODUCT_ID, t.QTY = s.QTY, t.CHANNEL = s.CHANNEL, t.ORDER_TS = s.ORDER_TS, t.ROW_HASH = s.NEW_HASH
+  WHEN NOT MATCHED AND s.OP = 'I' THEN INSERT (ID, CONSUMER_ID, PRODUCT_ID, QTY, CHANNEL, ORDER_TS, ROW_HASH)
+    VALUES (s.ID, s.CONSUMER_ID, s.PRODUCT_ID, s.QTY, s.CHANNEL, s.ORDER_TS, s.NEW_HASH);
+
+  -- keys every consumer of DEV.ORDERS has applied, older than the last 10 versions
+  DELETE FROM DEV.CDC_CHANGES WHERE TBL = 'ORDERS' AND VERSION <= :v - 10
+    AND VERSION <= (SELECT COALESCE(MIN(VERSION), :v) FROM DEV.CDC_OFFSETS WHERE TBL = 'ORDERS');
+
+  LET summary STRING := (SELECT COALESCE(LISTAGG(TBL || ' ' || OP || '=' || N, ', ')
+                                  WITHIN GROUP (ORDER BY TBL, OP), 'no changes')
+                         FROM (SELECT TBL, OP, COUNT(*) AS N FROM DEV.CDC_CHANGES
+                               WHERE VERSION = :v GROUP BY TBL, OP));
+  RETURN summary;
+END;
 $$;
 
 -- Optional compatibility (so your existing teacher SQL that reads UAT.WINE_CATALOG still works)
@@ -53,3 +198,4 @@ CREATE OR REPLACE VIEW UAT.WINE_CATALOG AS SELECT * FROM DEV.PRODUCTS;
 
 -- PROD tables (empty for now; your transform will fill WINENOT.PRD.WINES)
 CREATE OR REPLACE TABLE PROD.WINES LIKE STAGING.PRODUCTS_RAW;
+ALTER TABLE PROD.WINES ADD COLUMN ROW_HASH NUMBER(19,0);
@@ -1,18 +1,17 @@
 
+import os
+import sys
 import argparse
-import csv
-import random
+from datetime import datetime, timedelta
 from pathlib import Path
-from faker import Faker
+import numpy as np
+from value_pools import ValuePools, random_datetimes, format_datetimes
+from columnar import Batch, Categorical
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import instrumentation as ins
 
-def random_date_format(dt, rng):
-    style = rng.choice(["iso", "eu", "us"])
-    if style == "iso":
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
-    elif style == "eu":
-        return dt.strftime("%d/%m/%Y %H:%M")
-    else:
-        return dt.strftime("%m-%d-%Y %H:%M:%S")
+COUNTRIES = ["France", "Italy", "Spain", "USA", "Portugal", "Germany", "Belgium"]
+DATE_TEMPLATES = ["YYYY-mm-dd HH:MM:SS", "dd/mm/YYYY HH:MM", "mm-dd-YYYY HH:MM:SS"]  # iso, eu, us
 
 def sanitize_email_name(name: str) -> str:
     s = name.lower().replace(" ", ".").replace("'", "")
@@ -24,43 +23,50 @@ def main():
     ap.add_argument("--n", type=int, default=150)
     ap.add_argument("--dup_ratio", type=float, default=0.05)
     ap.add_argument("--out", type=Path, default=Path("customers.csv"))
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--locale", default="en_US")
     args = ap.parse_args()
 
-    fake = Faker()
-    Faker.seed(42)
-    rng = random.Random(42)
+    with ins.span("generate", table="customers") as sp:
+        pools = ValuePools(args.locale, args.seed)
+        rng = np.random.default_rng(args.seed)
+        n = args.n
 
-    rows = []
-    for i in range(1, args.n + 1):
-        name = fake.name()
-        email_local = sanitize_email_name(name) + str(rng.randint(1, 999))
-        email = email_local + "@example.com"
-        reg_date = fake.date_time_between(start_date="-3y", end_date="now")
-        country = rng.choice(["France", "Italy", "Spain", "USA", "Portugal", "Germany", "Belgium"])
-        city = fake.city()
+        # sanitize once per pool entry instead of once per row
+        names = pools["name"]
+        locals_ = np.array([sanitize_email_name(x) for x in names], dtype=object)
+        name_idx = rng.integers(0, len(names), size=n)
+        now = datetime.now()
+        reg_dates = random_datetimes(now - timedelta(days=3*365), now, n, rng)
+        style = rng.integers(0, len(DATE_TEMPLATES), size=n)
+        reg_str = np.empty(n, dtype=object)
+        for k, template in enumerate(DATE_TEMPLATES):
+            m = style == k
+            reg_str[m] = format_datetimes(reg_dates[m], template)
 
-        rows.append({
-            "customer_id": i,
-            "customer_name": name,
-            "customer_email": email,
-            "password": fake.password(length=12),
-            "registration_date": random_date_format(reg_date, rng),
-            "country": country,
-            "city": city,
+        batch = Batch({
+            "customer_id": np.arange(1, n + 1),
+            "customer_name": Categorical(name_idx, names),
+            "customer_email": locals_[name_idx] + rng.integers(1, 999, size=n, endpoint=True).astype(str).astype(object) + "@example.com",
+            "password": Categorical(pools.sample_codes("password", n, rng), pools["password"]),
+            "registration_date": reg_str,
+            "country": Categorical(rng.integers(0, len(COUNTRIES), size=n), COUNTRIES),
+            "city": Categorical(pools.sample_codes("city", n, rng), pools["city"]),
         })
 
-    dup_count = max(1, int(args.dup_ratio * len(rows)))
-    dups = rng.choices(rows, k=dup_count)
-    all_rows = rows + dups
-    rng.shuffle(all_rows)
+        dup_count = max(1, int(args.dup_ratio * n))
+        order = rng.permutation(np.concatenate([np.arange(n), rng.integers(0, n, size=dup_count)]))
+        sp.add(rows=len(order))
 
     args.out.parent.mkdir(parents=True, exist_ok=True)
-    with args.out.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=list(all_rows[0].keys()))
-        writer.writeheader()
-        writer.writerows(all_rows)
+    with ins.span("write_csv", file=args.out.name) as sp:
+        with args.out.open("w", newline="", encoding="utf-8") as f:
+            batch.head(0).to_csv(f, header=True)
+            for lo in range(0, len(order), 1 << 16):
+                batch.take(order[lo:lo + (1 << 16)]).to_csv(f)
+        sp.add(rows=len(order), bytes_written=args.out.stat().st_size)
 
-    print(f"Wrote {len(all_rows)} rows to {args.out} (including {dup_count} duplicates).")
+    print(f"Wrote {len(order)} rows to {args.out} (including {dup_count} duplicates).")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,213 @@
+import os
+import json
+from functools import lru_cache
+from datetime import datetime
+import numpy as np
+
+# Load profiles: skewed key popularity and seasonal timestamps for the order generators.
+#
+#   profile = LoadProfile.load("retail")        # a name from load_profiles.json, or a path
+#   p_id = profile.keys("products", n_products, n, rng)
+#   minutes = profile.minutes(start, 540, n, rng)
+#
+# A profile is a small JSON object; every part is optional and falls back to uniform:
+#
+#   {"products":  {"dist": "zipf", "s": 1.1},           popularity of key rank r ~ 1 / r^s;
+#    "consumers": {"dist": "zipf", "s": 0.8},           ranks map to ids through a seeded shuffle
+#    "time": {"diurnal": [24 weights, hour 0..23],
+#             "weekly":  [7 weights, Monday..Sunday],
+#             "bursts":  [{"start": "11-28", "days": 4, "factor": 6},          every year
+#                         {"start": "2025-06-01T18:00", "hours": 3, "factor": 20}]}}
+#
+# Keys and minutes are drawn from alias tables (Vose): after an O(n) build, a batch of samples
+# is one uniform draw and two lookups per row, whatever the skew; next to formatting the rows
+# that is noise. Tables are built once per process and profile.
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_profiles.json")
+MINUTES_PER_DAY = 24 * 60
+
+class AliasTable:
+    """O(1) sampling of indices 0..n-1 with probability proportional to weights."""
+
+    def __init__(self, weights):
+        w = np.asarray(weights, dtype=np.float64)
+        if w.ndim != 1 or not len(w) or (w < 0).any() or not w.sum() > 0:
+            raise ValueError("weights must be a non-empty 1-d array of non-negative values with a positive sum")
+        n = len(w)
+        q = w * (n / w.sum())
+        self.prob = np.ones(n)
+        self.alias = np.arange(n, dtype=np.int32 if n < 2**31 else np.int64)
+        small, large = np.flatnonzero(q < 1), np.flatnonzero(q >= 1)
+        # Vose's pairing, done for all small slots at once: small slot i takes its missing
+        # mass 1 - q[i] from the large key whose surplus covers where that mass starts in the
+        # running total. A large key that gives away more than its surplus turns small (its
+        # q stays > 0) and is paired in the next round; a few rounds settle any distribution.
+        while len(small) and len(large):
+            deficit = 1 - q[small]
+            starts = np.cumsum(deficit) - deficit
+            surplus_end = np.cumsum(q[large] - 1)
+            donor = np.searchsorted(surplus_end, starts, side="right")
+            paired = donor < len(large)
+            s, d = small[paired], large[donor[paired]]
+            self.prob[s], self.alias[s] = q[s], d
+            np.subtract.at(q, d, deficit[paired])
+            done_large = np.zeros(n, dtype=bool); done_large[d] = True
+            turned = large[done_large[large] & (q[large] < 1)]
+            large = large[~np.isin(large, turned)]
+            small = np.concatenate([small[~paired], turned])
+            if not paired.any():
+                break
+        # whatever is left is 1 up to rounding
+        self.prob[small] = 1.0; self.prob[large] = 1.0
+        self.prob = self.prob.astype(np.float32)  # half the cache footprint of the random lookups
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, size, rng):
+        # one uniform draw per sample: its integer part picks the slot, its fraction the coin
+        u = rng.random(size) * len(self.prob)
+        k = u.astype(self.alias.dtype)
+        return np.where(u - k < self.prob[k], k, self.alias[k])
+
+    def probabilities(self):
+        """Exact probability of every index (for checks and reports)."""
+        n = len(self.prob)
+        prob = self.prob.astype(np.float64)
+        p = prob / n
+        np.add.at(p, self.alias, (1 - prob) / n)
+        return p
+
+def _key(spec):
+    return json.dumps(spec, sort_keys=True)
+
+@lru_cache(maxsize=16)
+def _key_table(spec_key, n_keys, seed):
+    spec = json.loads(spec_key)
+    dist = spec.get("dist", "uniform")
+    if dist == "uniform":
+        return None
+    if dist != "zipf":
+        raise ValueError(f"unknown key distribution {dist!r} (uniform, zipf)")
+    weights = 1.0 / np.arange(1, n_keys + 1, dtype=np.float64) ** float(spec.get("s", 1.0))
+    if spec.get("shuffle", True):
+        # rank 1 is not id 1: the hot keys are spread over the id range, like real traffic
+        weights = weights[np.random.default_rng([seed, n_keys]).permutation(n_keys)]
+    return AliasTable(weights)  # index i is id i + 1
+
+def _burst_windows(burst, first, last):
+    """[lo, hi) minute offsets from `first` covered by one burst, for every year of the window."""
+    length = int(burst.get("days", 0) * MINUTES_PER_DAY + burst.get("hours", 0) * 60) or MINUTES_PER_DAY
+    start = burst["start"]
+    if len(start) == 5:  # MM-DD: every year
+        when = [datetime.fromisoformat(f"{y}-{start}") for y in range(first.year - 1, last.year + 1)]
+    else:
+        when = [datetime.fromisoformat(start)]
+    for t in when:
+        lo = int((np.datetime64(t, "m") - np.datetime64(first, "m")).astype(np.int64))
+        yield lo, lo + length
+
+@lru_cache(maxsize=8)
+def _minute_weights(spec_key, start_minute, n_minutes):
+    """Relative intensity of every minute of the window that starts at start_minute."""
+    spec = json.loads(spec_key)
+    t = np.datetime64(start_minute, "m") + np.arange(n_minutes)
+    w = np.ones(n_minutes)
+    if "diurnal" in spec:
+        hours = (t.astype("datetime64[h]").astype(np.int64) % 24)
+        w *= np.asarray(spec["diurnal"], dtype=np.float64)[hours]
+    if "weekly" in spec:
+        weekday = (t.astype("datetime64[D]").astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        w *= np.asarray(spec["weekly"], dtype=np.float64)[weekday]
+    first = start_minute.astype(datetime)
+    last = (start_minute + n_minutes).astype(datetime)
+    for burst in spec.get("bursts", []):
+        for lo, hi in _burst_windows(burst, first, last):
+            w[max(lo, 0):max(min(hi, n_minutes), 0)] *= float(burst["factor"])
+    return w
+
+@lru_cache(maxsize=8)
+def _minute_table(spec_key, start_minute, n_minutes):
+    return AliasTable(_minute_weights(spec_key, start_minute, n_minutes))
+
+@lru_cache(maxsize=8)
+def _minute_cumsum(spec_key, start_minute, n_minutes):
+    w = _minute_weights(spec_key, start_minute, n_minutes)
+    return np.cumsum(w * (60.0 / w.mean()))  # expected events by the end of each minute at 1 event/s
+
+class LoadProfile:
+    """A named load profile: key popularity per field plus time seasonality (see module comment)."""
+
+    def __init__(self, name="uniform", spec=None, seed=0):
+        self.name, self.spec, self.seed = name, spec or {}, seed
+
+    @classmethod
+    def load(cls, name_or_path, seed=0, profiles_path=PROFILES_PATH):
+        """A profile from load_profiles.json by name, or from a JSON file of its own."""
+        if not name_or_path:
+            return cls(seed=seed)
+        if os.path.exists(name_or_path):
+            with open(name_or_path, encoding="utf-8") as f:
+                return cls(os.path.splitext(os.path.basename(name_or_path))[0], json.load(f), seed)
+        with open(profiles_path, encoding="utf-8") as f:
+            profiles = json.load(f)
+        if name_or_path not in profiles:
+            raise SystemExit(f"Unknown load profile {name_or_path!r}; known: {', '.join(sorted(profiles))} (or a .json path)")
+        return cls(name_or_path, profiles[name_or_path], seed)
+
+    @property
+    def uniform(self):
+        return not any(self.spec.values())
+
+    @property
+    def seasonal(self):
+        return bool(self.spec.get("time"))
+
+    def key_weights(self, field, n_keys):
+        """Probability of every id 1..n_keys (index 0 is id 1)."""
+        table = _key_table(_key(self.spec.get(field, {})), n_keys, self.seed)
+        return np.full(n_keys, 1.0 / n_keys) if table is None else table.probabilities()
+
+    def keys(self, field, n_keys, size, rng):
+        """size ids in 1..n_keys drawn with the field's popularity."""
+        table = _key_table(_key(self.spec.get(field, {})), n_keys, self.seed)
+        if table is None:
+            return rng.integers(1, n_keys, size=size, endpoint=True)
+        return table.sample(size, rng) + 1
+
+    def minutes(self, start, days, size, rng):
+        """size minute offsets from start over `days`, drawn with the time seasonality.
+
+        Uniform offsets include the end point days*1440, as the generators always drew them.
+        """
+        n = days * MINUTES_PER_DAY
+        if not self.seasonal:
+            return rng.integers(0, n, size=size, endpoint=True)
+        return _minute_table(_key(self.spec["time"]), np.datetime64(start, "m"), n).sample(size, rng)
+
+    def warp(self, start, seconds, days=366):
+        """Event times for positions `seconds` of a stream with a mean rate of 1 event/s.
+
+        Busy minutes get proportionally more events, quiet ones fewer; the times stay in the
+        same order as the positions. Past `days` the stream continues at 1 event/s.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        base = np.datetime64(start, "us")
+        if not self.seasonal:
+            return base + (seconds * 1e6).astype("timedelta64[us]")
+        cum = _minute_cumsum(_key(self.spec["time"]), np.datetime64(start, "m"), days * MINUTES_PER_DAY)
+        m = np.searchsorted(cum, seconds, side="right")
+        inside = m < len(cum)
+        mi = np.minimum(m, len(cum) - 1)
+        prev = np.where(mi > 0, cum[mi - 1], 0.0)
+        offset = np.where(inside, (mi + (seconds - prev) / (cum[mi] - prev)) * 60.0,
+                          len(cum) * 60.0 + seconds - cum[-1])
+        return base + (offset * 1e6).astype("timedelta64[us]")
+
+    def describe(self, n_products, n_consumers):
+        """One line on how concentrated the traffic is, e.g. for the generators' summaries."""
+        parts = []
+        for field, n in (("products", n_products), ("consumers", n_consumers)):
+            p = np.sort(self.key_weights(field, n))[::-1]
+            top = max(1, n // 100)
+            parts.append(f"top 1% of {field} {100 * p[:top].sum():.0f}% of orders")
+        return f"profile {self.name}: " + ", ".join(parts)
@@ -1,10 +1,32 @@
 
-import argparse
+import os
+import sys
+import stat
 import json
-import random
 import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
+import numpy as np
+from value_pools import format_datetimes
+from load_profile import LoadProfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import instrumentation as ins
+
+STATUSES = ["pending", "confirmed", "shipped", "delivered"]
+PAYMENTS = ["card", "paypal", "bank_transfer"]
+DATE_STYLES = {"iso": "YYYY-mm-ddTHH:MM:SSZ", "eu": "dd/mm/YYYY HH:MM", "us": "mm-dd-YYYY HH:MM:SS"}
+PRICE_STYLES = ["euro_symbol", "euro_suffix", "comma", "plain"]
+BLOCK = 16384        # unique events encoded per worker task
+MAX_WRITE = 32768    # most events handed to the sink in one write
+RECENT = 5000        # an in-stream duplicate follows its original within RECENT events
+# same layout as json.dumps(generate_order(...), ensure_ascii=False); the price is built from 5 parts
+LINE = ('{"order_id": "ORD-2025-%06d", "wine_id": %d, "customer_id": %d, "quantity": %d, '
+        '"order_date": "%s", "total_price": "%s%d%s%s%s", "status": "%s", "payment_method": "%s"}\n')
 
 def random_price_format(value, rng):
     style = rng.choice(["euro_symbol", "euro_suffix", "comma", "plain"])
@@ -25,15 +47,15 @@ def random_date_format(dt, rng):
     else:
         return dt.strftime("%m-%d-%Y %H:%M:%S")
 
-def generate_order(order_idx, wine_max, cust_max, dt, rng):
+def generate_order(order_idx, wine_max, cust_max, dt, rng, wine_id=None, customer_id=None):
     q = rng.randint(1, 6)
     unit = rng.uniform(5, 120)
     total = q * unit
     order_id = f"ORD-2025-{order_idx:06d}"
     return {
         "order_id": order_id,
-        "wine_id": rng.randint(1, wine_max),
-        "customer_id": rng.randint(1, cust_max),
+        "wine_id": rng.randint(1, wine_max) if wine_id is None else wine_id,
+        "customer_id": rng.randint(1, cust_max) if customer_id is None else customer_id,
         "quantity": q,
         "order_date": random_date_format(dt, rng),
         "total_price": random_price_format(total, rng),
@@ -41,35 +63,250 @@ def generate_order(order_idx, wine_max, cust_max, dt, rng):
         "payment_method": rng.choice(["card", "paypal", "bank_transfer"]),
     }
 
+# ---- rate-controlled producer ----
+
+# Price strings of random_price_format assembled from table lookups: prefix, euros, separator,
+# cents, suffix. str(round(v, 2)) drops a trailing zero, so the comma style writes 12.5 as "12,5".
+PRICE_PREFIX = np.array(["€", "", "", ""], dtype=object)
+PRICE_SEP = np.array([".", ".", ",", "."], dtype=object)
+PRICE_SUFFIX = np.array(["", " EUR", "", ""], dtype=object)
+PRICE_CENTS = np.array([[f"{c:02d}" if k != 2 or c % 10 else str(c // 10) for c in range(100)]
+                        for k in range(len(PRICE_STYLES))], dtype=object)
+
+def event_batch(first_idx, n, base_dt, wine_max, cust_max, rng, profile=None):
+    """n consecutive events starting at order index first_idx, as JSONL lines.
+
+    Event i happens i seconds after base_dt, or at the i-th second of the profile's warped
+    clock when it has a time seasonality; wine and customer ids follow its popularity.
+    """
+    profile = profile or LoadProfile()
+    idx = np.arange(first_idx, first_idx + n)
+    q = rng.integers(1, 7, n)
+    cents = np.round(q * rng.uniform(5, 120, n) * 100).astype(np.int64)
+    ts = profile.warp(base_dt, idx) if profile.seasonal else np.datetime64(base_dt, "s") + idx
+    date_styles = rng.integers(0, len(DATE_STYLES), n)
+    dates = np.empty(n, dtype=object)
+    for k, template in enumerate(DATE_STYLES.values()):
+        m = date_styles == k
+        dates[m] = format_datetimes(ts[m], template)
+    price_styles = rng.integers(0, len(PRICE_STYLES), n)
+    wines = profile.keys("products", wine_max, n, rng)
+    customers = profile.keys("consumers", cust_max, n, rng)
+    cols = (idx.tolist(), wines.tolist(), customers.tolist(),
+            q.tolist(), dates.tolist(),
+            PRICE_PREFIX[price_styles].tolist(), (cents // 100).tolist(), PRICE_SEP[price_styles].tolist(),
+            PRICE_CENTS[price_styles, cents % 100].tolist(), PRICE_SUFFIX[price_styles].tolist(),
+            np.array(STATUSES, dtype=object)[rng.integers(0, len(STATUSES), n)].tolist(),
+            np.array(PAYMENTS, dtype=object)[rng.integers(0, len(PAYMENTS), n)].tolist())
+    return [LINE % row for row in zip(*cols)]
+
+def encode_block(b, n, seed, base_dt, wine_max, cust_max, dup_ratio, profile=None):
+    """Block b of the stream: n new events plus duplicates, as (JSONL bytes, end offset of every line, duplicates).
+
+    The content depends only on (seed, b), so blocks can be encoded by any worker in any order.
+    """
+    rng = np.random.default_rng([seed, b])
+    new = event_batch(b * BLOCK + 1, n, base_dt, wine_max, cust_max, rng, profile)
+    n_dup = int(rng.binomial(n, dup_ratio))
+    src = rng.integers(0, n, n_dup)
+    # a duplicate goes right before event src + gap (gap >= 1), i.e. always after its original
+    before = np.minimum(src + rng.integers(1, RECENT + 1, n_dup), n)
+    order = np.argsort(np.concatenate([np.arange(n) * 2, before * 2 - 1]), kind="stable")
+    lines = new + [new[i] for i in src.tolist()]
+    data = "".join([lines[i] for i in order.tolist()]).encode("utf-8")
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10) + 1
+    return data, ends, n_dup
+
+class FileSink:
+    """Regular file, FIFO or stdout; writes go through one large buffer."""
+    def __init__(self, target):
+        if target == "-":
+            self.f = open(sys.stdout.fileno(), "wb", buffering=1 << 20, closefd=False)
+        else:
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            # opening a FIFO blocks until a reader is attached, like any producer would
+            self.f = open(target, "ab" if _is_fifo(target) else "wb", buffering=1 << 20)
+
+    async def write(self, data):
+        self.f.write(data)
+
+    async def close(self):
+        self.f.close()
+
+class StreamSink:
+    """tcp://host:port or unix:///path; drain() applies the reader's backpressure."""
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def _is_fifo(path):
+    return os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)
+
+async def open_sink(target):
+    if target.startswith("tcp://"):
+        host, port = target[len("tcp://"):].rsplit(":", 1)
+        _, writer = await asyncio.open_connection(host, int(port))
+        return StreamSink(writer)
+    if target.startswith("unix://"):
+        _, writer = await asyncio.open_unix_connection(target[len("unix://"):])
+        return StreamSink(writer)
+    return FileSink(target)
+
+class TokenBucket:
+    """Target rate (events/s) reached linearly over `ramp` seconds; at most `burst` events at once."""
+    def __init__(self, rate, burst, ramp=0.0, now=0.0):
+        self.rate, self.burst, self.ramp = rate, burst, ramp
+        self.t0 = self.last = now
+        self.tokens = 0.0
+
+    def current_rate(self, now):
+        if self.ramp and now - self.t0 < self.ramp:
+            return self.rate * (now - self.t0) / self.ramp
+        return self.rate
+
+    def take(self, now, limit):
+        """Whole events that may be sent now (<= limit), and seconds to wait when none."""
+        r = self.current_rate(now)
+        # a token per event accrues at the mean rate over the elapsed interval
+        self.tokens = min(self.burst, self.tokens + (r + self.current_rate(self.last)) / 2 * (now - self.last))
+        self.last = now
+        n = int(min(self.tokens, limit))
+        self.tokens -= n
+        wait = (1 - self.tokens) / r if n == 0 and r > 0 else 0.001
+        return n, min(max(wait, 0.0005), 0.05)
+
+async def produce(args):
+    loop = asyncio.get_running_loop()
+    sink = await open_sink(args.out)
+    burst = args.burst or max(1, int(args.rate / 20))  # default: up to 50 ms worth of events at once
+    base_dt = datetime.utcnow().replace(microsecond=0)
+    n_blocks = None if args.count is None else -(-args.count // BLOCK)
+    pool = ProcessPoolExecutor(args.workers) if args.workers else None  # None: a thread of the loop
+
+    def submit(b):
+        n = BLOCK if args.count is None else min(BLOCK, args.count - b * BLOCK)
+        return loop.run_in_executor(pool, encode_block, b, n, args.seed, base_dt, args.wine_max,
+                                    args.cust_max, args.dup_ratio, args.load_profile)
+
+    ahead = deque(submit(b) for b in range(min(2 * max(args.workers, 1), n_blocks or 1 << 62)))
+    next_block = len(ahead)
+    data, ends, pos = b"", np.zeros(0, dtype=np.int64), 0
+    sent = dups = report_sent = written = 0
+    await asyncio.wait([ahead[0]])  # start the clock once the first block is ready
+    t0 = last_report = end = loop.time()
+    bucket = TokenBucket(args.rate, burst, args.ramp, t0)
+    steady_from, steady_sent = t0 + args.ramp, None
+    with ins.span("produce", sink=args.out.split("://")[0] if "://" in args.out else "file") as sp:
+        try:
+            while not args.duration or loop.time() - t0 < args.duration:
+                if pos == len(ends):
+                    if not ahead:
+                        break
+                    data, ends, n_dup = await ahead.popleft()
+                    pos, dups = 0, dups + n_dup
+                    if n_blocks is None or next_block < n_blocks:
+                        ahead.append(submit(next_block)); next_block += 1
+                now = loop.time()
+                if steady_sent is None and now >= steady_from:
+                    steady_sent, steady_from = sent, now
+                if now - last_report >= args.report_every:
+                    print(f"rate: {(sent - report_sent) / (now - last_report):,.0f} ev/s "
+                          f"(target {bucket.current_rate(now):,.0f}), {sent} sent", file=sys.stderr, flush=True)
+                    last_report, report_sent = now, sent
+                n, wait = bucket.take(now, min(MAX_WRITE, len(ends) - pos))
+                if n == 0:
+                    await asyncio.sleep(wait)
+                    continue
+                start = ends[pos - 1] if pos else 0
+                await sink.write(memoryview(data)[start:ends[pos + n - 1]])
+                pos += n; sent += n
+                written += ends[pos - 1] - start
+                end = loop.time()
+        except (asyncio.CancelledError, BrokenPipeError, ConnectionError):
+            pass
+        finally:
+            for f in ahead:
+                f.cancel()
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            try:
+                await sink.close()
+            except (BrokenPipeError, ConnectionError):
+                pass
+        sp.add(rows=sent, bytes_written=int(written))
+    steady_rate = (sent - steady_sent) / (end - steady_from) if steady_sent is not None and end > steady_from else 0.0
+    print(f"Sent {sent} events to {args.out} in {end - t0:.1f}s ({dups} duplicates encoded): "
+          f"{sent / max(end - t0, 1e-9):,.0f} ev/s overall, {steady_rate:,.0f} ev/s after ramp "
+          f"(target {args.rate:,.0f}, {100 * (steady_rate / args.rate - 1):+.1f}%).", file=sys.stderr)
+
 def main():
     ap = argparse.ArgumentParser(description="Generate order events as JSONL with mixed date/price formats and ~5% duplicates.")
-    ap.add_argument("--count", type=int, default=60, help="Number of unique events to generate")
+    ap.add_argument("--count", type=int, help="Number of unique events to generate (default 60; unlimited with --rate)")
     ap.add_argument("--dup_ratio", type=float, default=0.05, help="Fraction of duplicates to append")
     ap.add_argument("--wine_max", type=int, default=500)
     ap.add_argument("--cust_max", type=int, default=150)
-    ap.add_argument("--out", type=Path, default=Path("orders_events.jsonl"))
+    ap.add_argument("--out", default="orders_events.jsonl",
+                    help="file or FIFO path; with --rate also - (stdout), tcp://host:port or unix:///path")
     ap.add_argument("--sleep", type=float, default=0.0, help="Sleep seconds between events (for demo streaming)")
+    ap.add_argument("--rate", type=float, help="stream events at this many per second instead of writing a batch")
+    ap.add_argument("--ramp", type=float, default=0.0, help="seconds to ramp up linearly to --rate")
+    ap.add_argument("--burst", type=int, help="token bucket size in events (default: rate/20)")
+    ap.add_argument("--duration", type=float, help="stop streaming after this many seconds")
+    ap.add_argument("--report-every", type=float, default=5.0, help="seconds between rate reports on stderr")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="processes encoding event blocks for --rate (0: one thread)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--profile", default=os.getenv("LOAD_PROFILE"),
+                    help="load profile: a name in load_profiles.json (retail, hot_keys...) or a .json path")
     args = ap.parse_args()
+    args.load_profile = LoadProfile.load(args.profile, seed=args.seed)
+
+    if args.rate:
+        try:
+            asyncio.run(produce(args))
+        except KeyboardInterrupt:
+            pass
+        return
+    args.count = 60 if args.count is None else args.count
+    args.out = Path(args.out)
 
-    rng = random.Random(42)
+    rng = random.Random(args.seed)
     base_dt = datetime.utcnow()
 
-    unique = []
-    for i in range(1, args.count + 1):
-        evt = generate_order(i, args.wine_max, args.cust_max, base_dt + timedelta(seconds=i), rng)
-        unique.append(evt)
+    with ins.span("generate", table="order_events") as sp:
+        profile, n = args.load_profile, args.count
+        if profile.uniform:
+            wines = customers = [None] * n
+            dts = [base_dt + timedelta(seconds=i) for i in range(1, n + 1)]
+        else:
+            prng = np.random.default_rng(args.seed)
+            wines = profile.keys("products", args.wine_max, n, prng).tolist()
+            customers = profile.keys("consumers", args.cust_max, n, prng).tolist()
+            dts = profile.warp(base_dt, np.arange(1, n + 1)).tolist()
+        unique = [generate_order(i, args.wine_max, args.cust_max, dts[i - 1], rng, wines[i - 1], customers[i - 1])
+                  for i in range(1, n + 1)]
 
-    dup_count = max(1, int(args.dup_ratio * len(unique)))
-    dups = rng.choices(unique, k=dup_count)
-    events = unique + dups
-    rng.shuffle(events)
+        dup_count = max(1, int(args.dup_ratio * len(unique)))
+        dups = rng.choices(unique, k=dup_count)
+        events = unique + dups
+        rng.shuffle(events)
+        sp.add(rows=len(events))
 
     args.out.parent.mkdir(parents=True, exist_ok=True)
-    with args.out.open("w", encoding="utf-8") as f:
-        for e in events:
-            f.write(json.dumps(e, ensure_ascii=False) + "\n")
-            if args.sleep > 0:
-                time.sleep(args.sleep)
+    with ins.span("write_jsonl", file=args.out.name) as sp:
+        with args.out.open("w", encoding="utf-8") as f:
+            for e in events:
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                if args.sleep > 0:
+                    time.sleep(args.sleep)
+        sp.add(rows=len(events), bytes_written=args.out.stat().st_size)
 
     # Optional CSV snapshot
     csv_path = args.out.with_suffix(".csv")
@@ -0,0 +1,92 @@
+import os
+import gzip
+import numpy as np
+from faker import Faker
+
+# Faker is slow per call (and fake.unique slower as it grows), so every generator draws
+# names, companies, cities... from pools built once per (locale, seed, size) and cached on disk.
+POOL_DIR = os.getenv("POOL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "winenot", "pools"))
+POOL_SIZE = int(os.getenv("POOL_SIZE", 20000))
+POOL_VERSION = 1  # bump when FIELDS change so stale caches are rebuilt
+
+FIELDS = {
+    "name": lambda f: f.name(),
+    "last_name": lambda f: f.last_name(),
+    "company": lambda f: f.company(),
+    "city": lambda f: f.city(),
+    "country": lambda f: f.country(),
+    "user_name": lambda f: f.user_name(),
+    "email_domain": lambda f: f.free_email_domain(),
+    "street_address": lambda f: f.street_address(),
+    "password": lambda f: f.password(length=12),
+}
+
+
+class ValuePools:
+    """Seeded, locale-aware pools of Faker values; pools[field] is a numpy object array."""
+
+    def __init__(self, locale="en_US", seed=0, size=POOL_SIZE, cache_dir=POOL_DIR):
+        self.locale, self.seed, self.size = locale, seed, size
+        self.dir = os.path.join(cache_dir, f"{locale}-s{seed}-n{size}-v{POOL_VERSION}")
+        self._pools = {}
+
+    def __getitem__(self, field):
+        if field not in self._pools:
+            self._pools[field] = self._load(field)
+        return self._pools[field]
+
+    def _load(self, field):
+        path = os.path.join(self.dir, f"{field}.txt.gz")
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return np.array(f.read().split("\n"), dtype=object)
+        values = self._build(field)
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write("\n".join(values))
+        os.replace(tmp, path)
+        return np.array(values, dtype=object)
+
+    def _build(self, field):
+        # every field gets its own Faker stream so adding a field never shifts another pool
+        fake = Faker(self.locale)
+        fake.seed_instance(f"{self.seed}:{field}")
+        make = FIELDS[field]
+        return [make(fake).replace("\n", ", ") for _ in range(self.size)]
+
+    def sample_codes(self, field, n, rng):
+        """Indices into pools[field]; sample() without building the strings (same draws)."""
+        return rng.integers(0, len(self[field]), size=n)
+
+    def sample(self, field, n, rng):
+        return self[field][self.sample_codes(field, n, rng)]
+
+    def unique_emails(self, ids, rng, domain=None):
+        """user_name pool entry + the row id, so uniqueness needs no retry loop."""
+        users = self.sample("user_name", len(ids), rng)
+        domains = np.full(len(ids), domain, dtype=object) if domain else self.sample("email_domain", len(ids), rng)
+        return users + np.asarray(ids).astype(str).astype(object) + "@" + domains
+
+
+def random_datetimes(start, end, n, rng):
+    """n uniform datetime64[us] values in [start, end]."""
+    lo, hi = np.datetime64(start, "us"), np.datetime64(end, "us")
+    span = int((hi - lo) / np.timedelta64(1, "us"))
+    return lo + rng.integers(0, span, size=n, endpoint=True).astype("timedelta64[us]")
+
+
+def format_datetimes(ts, template):
+    """Vectorized strftime for datetime64 arrays; template uses YYYY mm dd HH MM SS placeholders."""
+    iso = np.datetime_as_string(ts.astype("datetime64[s]"), unit="s").astype("U19")
+    chars = iso.view("U1").reshape(len(iso), 19)
+    pos = {"Y": [0, 1, 2, 3], "m": [5, 6], "d": [8, 9], "H": [11, 12], "M": [14, 15], "S": [17, 18]}
+    taken = {k: 0 for k in pos}
+    cols = []
+    for c in template:
+        if c in pos:
+            cols.append(chars[:, pos[c][taken[c]]]); taken[c] += 1
+        else:
+            cols.append(np.full(len(iso), c, dtype="U1"))
+    out = np.ascontiguousarray(np.stack(cols, axis=1)) if cols else chars[:, :0]
+    return out.view(f"U{len(template)}").ravel()
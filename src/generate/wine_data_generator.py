@@ -1,16 +1,29 @@
 import os
+import sys
 import csv
-import random
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from faker import Faker
+import numpy as np
+from value_pools import ValuePools, random_datetimes
+from columnar import Batch, Categorical, int_dtype
+from load_profile import LoadProfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import instrumentation as ins
 
 # ---- Config ----
 OUT_DIR = os.getenv("OUT_DIR", "data")
 N_PRODUCTS = int(os.getenv("N_PRODUCTS", 500))
 N_CONSUMERS = int(os.getenv("N_CONSUMERS", 600))
 N_ORDERS = int(os.getenv("N_ORDERS", 4000))
-random.seed(7)
-fake = Faker()
+SEED = int(os.getenv("SEED", 7))
+GEN_NOW = os.getenv("GEN_NOW")  # ISO timestamp used as "now"; pin it for reproducible runs
+ORDER_BLOCK = 1 << 16  # rows per order chunk; also the unit of the seeded random streams
+SHARD_BLOCKS = int(os.getenv("SHARD_BLOCKS", 16))  # blocks per orders part file in --workers mode
+LOAD_PROFILE = os.getenv("LOAD_PROFILE")  # name in load_profiles.json or a .json path; unset = uniform
+ORDER_DAYS = 540
 
 COLORS = ["red", "white", "rosé", "sparkling"]
 GRAPES = ["Cabernet Sauvignon","Merlot","Pinot Noir","Syrah","Grenache","Chardonnay","Sauvignon Blanc","Riesling","Sangiovese","Tempranillo"]
@@ -29,71 +42,260 @@ COUNTRIES = {
 
 CHANNELS = ["web","mobile","store"]
 
+COUNTRY_NAMES = np.array(list(COUNTRIES), dtype=object)
+REGION_COUNTS = np.array([len(r) for r in COUNTRIES.values()])
+REGION_TABLE = np.array([r + [""] * (REGION_COUNTS.max() - len(r)) for r in COUNTRIES.values()], dtype=object)
+GRAPE_NAMES = np.array(GRAPES, dtype=object)
+# grapes codes: g for one grape, len(GRAPES) + g1*len(GRAPES) + g2 for the blend "g1, g2"
+GRAPE_COMBOS = np.array(GRAPES + [f"{a}, {b}" for a in GRAPES for b in GRAPES], dtype=object)
+
 def ensure_dir():
     os.makedirs(OUT_DIR, exist_ok=True)
 
-def gen_products(n=N_PRODUCTS):
-    rows = []
-    for i in range(1, n+1):
-        country = random.choice(list(COUNTRIES.keys()))
-        region = random.choice(COUNTRIES[country])
-        reference = f"WINE-{i:05d}"
-        color = random.choice(COLORS)
-        appellation = random.choice(APPELLATIONS)
-        grapes = ", ".join(random.sample(GRAPES, k=random.randint(1,2)))
-        vintage = random.randint(1995, 2024)
-        alcohol_percent = round(random.uniform(11.0, 15.5), 1)
-        bottle_size_l = random.choice([0.375, 0.75, 1.5])
-        sweetness = random.choice(SWEETNESS)
-        tannin = random.choice(TANNIN)
-        acidity = random.choice(ACIDITY)
-        rating = random.randint(78, 99)
-        price_eur = round(random.uniform(6.0, 120.0), 2)
-        producer = fake.company()
-        stock_quantity = random.randint(0, 800)
-        rows.append([i, reference, color, country, region, appellation, vintage, grapes, alcohol_percent,
-                     bottle_size_l, sweetness, tannin, acidity, rating, price_eur, producer, stock_quantity])
-    return rows
-
-def gen_consumers(n=N_CONSUMERS):
-    rows = []
-    for i in range(1, n+1):
-        name = fake.name()
-        email = fake.unique.email()
-        country = fake.country()
-        created_at = fake.date_time_between(start_date="-3y", end_date="now").isoformat()
-        rows.append([i, name, email, country, created_at])
-    return rows
-
-def gen_orders(n=N_ORDERS, max_qty=6, n_consumers=N_CONSUMERS, n_products=N_PRODUCTS):
-    rows = []
-    start = datetime.now() - timedelta(days=540)
-    for i in range(1, n+1):
-        c_id = random.randint(1, n_consumers)
-        p_id = random.randint(1, n_products)
-        qty = random.randint(1, max_qty)
-        channel = random.choice(CHANNELS)
-        ts = start + timedelta(minutes=random.randint(0, 540*24*60))
-        rows.append([i, c_id, p_id, qty, channel, ts.isoformat()])
-    return rows
-
-def write_csv(path, header, rows):
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(header); w.writerows(rows)
-
-def main():
+def gen_now():
+    return datetime.fromisoformat(GEN_NOW) if GEN_NOW else datetime.now()
+
+def orders_start():
+    return gen_now() - timedelta(days=ORDER_DAYS)
+
+def product_block(b, seed=SEED, pools=None):
+    """Batch of products b*ORDER_BLOCK+1 .. (b+1)*ORDER_BLOCK; text columns are dictionary-coded."""
+    rng = np.random.default_rng([seed, b, 1])
+    pools = pools or ValuePools(seed=seed)
+    n = ORDER_BLOCK
+    ids = np.arange(b*n + 1, (b+1)*n + 1, dtype=np.int64)
+    country = rng.integers(0, len(COUNTRY_NAMES), size=n)
+    region = country * REGION_TABLE.shape[1] + (rng.random(n) * REGION_COUNTS[country]).astype(np.int64)
+    reference = "WINE-" + np.char.zfill(ids.astype(str), 5).astype(object)
+    g1 = rng.integers(0, len(GRAPES), size=n)
+    g2 = (g1 + rng.integers(1, len(GRAPES), size=n)) % len(GRAPES)
+    grapes = np.where(rng.integers(1, 2, size=n, endpoint=True) == 2, len(GRAPES) * (1 + g1) + g2, g1)
+    # every draw below happens in the same order as when rows were tuples, so the files are unchanged
+    return Batch({
+        "id": ids,
+        "reference": reference,
+        "color": Categorical(rng.integers(0, len(COLORS), size=n), COLORS),
+        "country": Categorical(country, COUNTRY_NAMES),
+        "region": Categorical(region, REGION_TABLE.ravel()),
+        "appellation": Categorical(rng.integers(0, len(APPELLATIONS), size=n), APPELLATIONS),
+        "vintage": rng.integers(1995, 2024, size=n, endpoint=True).astype(np.int16),
+        "grapes": Categorical(grapes, GRAPE_COMBOS),
+        "alcohol_percent": np.round(rng.uniform(11.0, 15.5, size=n), 1),
+        "bottle_size_l": np.asarray([0.375, 0.75, 1.5])[rng.integers(0, 3, size=n)],
+        "sweetness": Categorical(rng.integers(0, len(SWEETNESS), size=n), SWEETNESS),
+        "tannin": Categorical(rng.integers(0, len(TANNIN), size=n), TANNIN),
+        "acidity": Categorical(rng.integers(0, len(ACIDITY), size=n), ACIDITY),
+        "rating": rng.integers(78, 99, size=n, endpoint=True).astype(np.int8),
+        "price_eur": np.round(rng.uniform(6.0, 120.0, size=n), 2),
+        "producer": Categorical(pools.sample_codes("company", n, rng), pools["company"]),
+        "stock_quantity": rng.integers(0, 800, size=n, endpoint=True).astype(np.int16),
+    })
+
+def product_chunks(n=N_PRODUCTS, seed=SEED):
+    pools = ValuePools(seed=seed)
+    for b in range(-(-n // ORDER_BLOCK)):
+        yield product_block(b, seed, pools).head(min(ORDER_BLOCK, n - b*ORDER_BLOCK))
+
+def gen_products(n=N_PRODUCTS, seed=SEED):
+    return Batch.concat(product_chunks(n, seed))
+
+def consumer_block(b, now, seed=SEED, pools=None):
+    """Batch of consumers b*ORDER_BLOCK+1 .. (b+1)*ORDER_BLOCK; names and countries are pool codes."""
+    rng = np.random.default_rng([seed, b, 2])
+    pools = pools or ValuePools(seed=seed)
+    n = ORDER_BLOCK
+    ids = np.arange(b*n + 1, (b+1)*n + 1, dtype=np.int64)
+    created_at = random_datetimes(now - timedelta(days=3*365), now, n, rng)
+    return Batch({
+        "id": ids,
+        "name": Categorical(pools.sample_codes("name", n, rng), pools["name"]),
+        "email": pools.unique_emails(ids, rng),
+        "country": Categorical(pools.sample_codes("country", n, rng), pools["country"]),
+        "created_at": created_at,  # datetime64[us], written as isoformat with microseconds
+    })
+
+def consumer_chunks(n=N_CONSUMERS, seed=SEED, now=None):
+    pools, now = ValuePools(seed=seed), now or gen_now()
+    for b in range(-(-n // ORDER_BLOCK)):
+        yield consumer_block(b, now, seed, pools).head(min(ORDER_BLOCK, n - b*ORDER_BLOCK))
+
+def gen_consumers(n=N_CONSUMERS, seed=SEED):
+    return Batch.concat(consumer_chunks(n, seed))
+
+def order_block(b, start, seed=SEED, max_qty=6, n_consumers=N_CONSUMERS, n_products=N_PRODUCTS, profile=None):
+    """Batch of orders b*ORDER_BLOCK+1 .. (b+1)*ORDER_BLOCK, drawn from the block's own stream.
+
+    Consumers, products and minutes follow the LoadProfile's popularity and seasonality; the
+    uniform profile (the default) makes exactly the draws the generator always made.
+    """
+    rng = np.random.default_rng([seed, b])
+    profile = profile or LoadProfile()
+    n = ORDER_BLOCK
+    ids = np.arange(b*n + 1, (b+1)*n + 1, dtype=np.int64)
+    c_id = profile.keys("consumers", n_consumers, n, rng)
+    p_id = profile.keys("products", n_products, n, rng)
+    qty = rng.integers(1, max_qty, size=n, endpoint=True).astype(int_dtype(max_qty))
+    channel = Categorical(rng.integers(0, len(CHANNELS), size=n), CHANNELS)
+    minutes = profile.minutes(start, ORDER_DAYS, n, rng)
+    ts = np.datetime64(start, "us") + minutes.astype("timedelta64[m]")
+    # datetime.isoformat() drops the fraction when it is zero; minutes never change it
+    if not start.microsecond:
+        ts = ts.astype("datetime64[s]")
+    return Batch({"id": ids, "consumer_id": c_id.astype(int_dtype(n_consumers)),
+                  "product_id": p_id.astype(int_dtype(n_products)), "qty": qty, "channel": channel, "order_ts": ts})
+
+def order_chunks(n=N_ORDERS, max_qty=6, n_consumers=N_CONSUMERS, n_products=N_PRODUCTS, start=None, seed=SEED,
+                 profile=None):
+    """Yield orders 1..n as Batches of ORDER_BLOCK rows."""
+    start = start or orders_start()
+    for b in range(-(-n // ORDER_BLOCK)):
+        yield order_block(b, start, seed, max_qty, n_consumers, n_products, profile).head(min(ORDER_BLOCK, n - b*ORDER_BLOCK))
+
+def order_shard_chunks(shard, n, max_qty, n_consumers, n_products, start, seed, profile=None):
+    """Chunks of one shard: blocks shard*SHARD_BLOCKS .. (shard+1)*SHARD_BLOCKS-1, clipped to n orders."""
+    last = min((shard+1) * SHARD_BLOCKS, -(-n // ORDER_BLOCK))
+    for b in range(shard * SHARD_BLOCKS, last):
+        yield order_block(b, start, seed, max_qty, n_consumers, n_products, profile).head(min(ORDER_BLOCK, n - b*ORDER_BLOCK))
+
+def gen_orders(n=N_ORDERS, max_qty=6, n_consumers=N_CONSUMERS, n_products=N_PRODUCTS, start=None, seed=SEED,
+               profile=None):
+    return Batch.concat(order_chunks(n, max_qty, n_consumers, n_products, start, seed, profile))
+
+PRODUCT_HEADER = ["id","reference","color","country","region","appellation","vintage","grapes","alcohol_percent","bottle_size_l","sweetness","tannin","acidity","rating","price_eur","producer","stock_quantity"]
+CONSUMER_HEADER = ["id","name","email","country","created_at"]
+ORDER_HEADER = ["id","consumer_id","product_id","qty","channel","order_ts"]
+
+def write_csv(path, header, batch):
+    with ins.span("write_csv", file=os.path.basename(path)) as s:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(header)
+            batch.to_csv(f)
+        s.add(rows=len(batch), bytes_written=os.path.getsize(path))
+
+def write_csv_chunks(path, header, chunks, quiet=False):
+    """Like write_csv, but consumes an iterator of Batches and never holds more than one chunk."""
+    n, t0 = 0, time.perf_counter()
+    with ins.span("write_csv", file=os.path.basename(path)) as s:  # generation included: chunks are lazy
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(header)
+            for chunk in chunks:
+                chunk.to_csv(f); n += len(chunk)
+        s.add(rows=n, bytes_written=os.path.getsize(path))
+    dt = time.perf_counter() - t0
+    if not quiet:
+        print(f"  {os.path.basename(path)}: {n} rows in {dt:.1f}s ({n / max(dt, 1e-9):,.0f} rows/s)")
+    return n
+
+def write_parquet_chunks(path, chunks, quiet=False):
+    """Stream Batches into one Parquet file; Categorical columns stay dictionary-encoded."""
+    import pyarrow.parquet as pq
+    n, t0, writer = 0, time.perf_counter(), None
+    with ins.span("write_parquet", file=os.path.basename(path)) as s:
+        try:
+            for chunk in chunks:
+                table = chunk.to_arrow()
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+                writer.write_table(table); n += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        s.add(rows=n, bytes_written=os.path.getsize(path) if writer is not None else 0)
+    dt = time.perf_counter() - t0
+    if not quiet:
+        print(f"  {os.path.basename(path)}: {n} rows in {dt:.1f}s ({n / max(dt, 1e-9):,.0f} rows/s)")
+    return n
+
+def write_table(fmt, name, header, chunks):
+    if fmt == "parquet":
+        return write_parquet_chunks(os.path.join(OUT_DIR, f"{name}.parquet"), chunks)
+    return write_csv_chunks(os.path.join(OUT_DIR, f"{name}.csv"), header, chunks)
+
+def write_order_shard(shard, parts_dir, n, n_consumers, n_products, start, seed, profile=None, max_qty=6):
+    path = os.path.join(parts_dir, f"part-{shard:05d}.csv")
+    chunks = order_shard_chunks(shard, n, max_qty, n_consumers, n_products, start, seed, profile)
+    return path, write_csv_chunks(path, ORDER_HEADER, chunks, quiet=True)
+
+def merge_parts(paths, out_path):
+    with open(out_path, "w", newline="", encoding="utf-8") as out:
+        for i, p in enumerate(paths):
+            with open(p, newline="", encoding="utf-8") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out, 1 << 20)
+
+def write_orders_sharded(n, n_consumers, n_products, seed, workers, merge=True, profile=None):
+    """Orders split into fixed shards of SHARD_BLOCKS blocks, generated by a process pool.
+
+    Shard layout and every block's stream depend only on the seed and the block index, so
+    the parts (and the merged orders.csv) are identical for any worker count.
+    """
+    start = orders_start()
+    parts_dir = os.path.join(OUT_DIR, "orders")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+    n_shards = max(1, -(-n // (ORDER_BLOCK * SHARD_BLOCKS)))
+    t0 = time.perf_counter()
+    with ins.span("write_orders_sharded", workers=workers, shards=n_shards) as sp:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = [ex.submit(write_order_shard, s, parts_dir, n, n_consumers, n_products, start, seed, profile)
+                    for s in range(n_shards)]
+            results = [f.result() for f in futs]
+        total = sum(r for _, r in results)
+        sp.add(rows=total, bytes_written=sum(os.path.getsize(p) for p, _ in results))
+    dt = time.perf_counter() - t0
+    print(f"  orders: {total} rows in {n_shards} parts, {workers} workers, {dt:.1f}s ({total / max(dt, 1e-9):,.0f} rows/s)")
+    if merge:
+        with ins.span("merge_parts", parts=n_shards) as sp:
+            merge_parts([p for p, _ in results], os.path.join(OUT_DIR, "orders.csv"))
+            sp.add(bytes_written=os.path.getsize(os.path.join(OUT_DIR, "orders.csv")))
+        shutil.rmtree(parts_dir)
+    return total
+
+def main_stream(seed=SEED, workers=0, merge=True, fmt="csv", profile=None):
+    n_prods = write_table(fmt, "products", PRODUCT_HEADER, product_chunks(seed=seed))
+    n_cons = write_table(fmt, "consumers", CONSUMER_HEADER, consumer_chunks(seed=seed))
+    if workers:
+        n_ords = write_orders_sharded(N_ORDERS, n_cons, n_prods, seed, workers, merge, profile)
+    else:
+        n_ords = write_table(fmt, "orders", ORDER_HEADER,
+                             order_chunks(n_products=n_prods, n_consumers=n_cons, seed=seed, profile=profile))
+    print(f"Generated: products({n_prods}), consumers({n_cons}), orders({n_ords}) → {OUT_DIR}/")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate products.csv, consumers.csv and orders.csv.")
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--stream", action="store_true",
+                    help=f"write in chunks of {ORDER_BLOCK} rows with flat memory (same bytes as the default path)")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="generate orders in parallel shards (implies --stream); output is the same for any N")
+    ap.add_argument("--partitioned", action="store_true",
+                    help="with --workers, keep orders/part-*.csv instead of merging into orders.csv")
+    ap.add_argument("--format", choices=("csv", "parquet"), default="csv",
+                    help="parquet writes <table>.parquet with dictionary-encoded text columns (implies --stream)")
+    ap.add_argument("--profile", default=LOAD_PROFILE,
+                    help="load profile for orders: a name in load_profiles.json (retail, hot_keys...) or a .json path")
+    args = ap.parse_args(argv)
+    if args.format != "csv" and args.workers:
+        ap.error("--workers writes CSV part files; use --format csv")
+    profile = LoadProfile.load(args.profile, seed=args.seed)
+    if not profile.uniform:
+        print(profile.describe(N_PRODUCTS, N_CONSUMERS))
+
     ensure_dir()
-    prods = gen_products()
-    cons  = gen_consumers()
-    ords  = gen_orders(len(ords) if isinstance(N_ORDERS, int) else 4000, n_consumers=len(cons), n_products=len(prods)) if False else gen_orders(n_products=len(prods), n_consumers=len(cons))
-
-    write_csv(os.path.join(OUT_DIR, "products.csv"),
-              ["id","reference","color","country","region","appellation","vintage","grapes","alcohol_percent","bottle_size_l","sweetness","tannin","acidity","rating","price_eur","producer","stock_quantity"], prods)
-    write_csv(os.path.join(OUT_DIR, "consumers.csv"),
-              ["id","name","email","country","created_at"], cons)
-    write_csv(os.path.join(OUT_DIR, "orders.csv"),
-              ["id","consumer_id","product_id","qty","channel","order_ts"], ords)
+    if args.stream or args.workers or args.format != "csv":
+        return main_stream(args.seed, args.workers, merge=not args.partitioned, fmt=args.format, profile=profile)
+
+    with ins.span("generate") as s:
+        prods = gen_products(seed=args.seed)
+        cons  = gen_consumers(seed=args.seed)
+        ords  = gen_orders(n_products=len(prods), n_consumers=len(cons), seed=args.seed, profile=profile)
+        s.add(rows=len(prods) + len(cons) + len(ords))
+
+    write_csv(os.path.join(OUT_DIR, "products.csv"), PRODUCT_HEADER, prods)
+    write_csv(os.path.join(OUT_DIR, "consumers.csv"), CONSUMER_HEADER, cons)
+    write_csv(os.path.join(OUT_DIR, "orders.csv"), ORDER_HEADER, ords)
     print(f"Generated: products({len(prods)}), consumers({len(cons)}), orders({len(ords)}) → {OUT_DIR}/")
 
 if __name__ == "__main__":
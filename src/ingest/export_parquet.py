@@ -0,0 +1,251 @@
+import os, re, json, time, sqlite3, hashlib, argparse
+from datetime import date, timedelta
+import pandas as pd
+from sqlite_seed import TABLES, DB_PATH
+
+# SQLite tables -> typed, zstd-compressed Parquet under PARQUET_DIR, then stage + COPY INTO
+# Snowflake. Orders are partitioned by order date. Every partition is written to a .tmp file
+# and digested on the way; one whose digest did not change since the last export is not
+# *replaced or uploaded* again (the .tmp is dropped), so its file and stage copy stay as they are.
+PARQUET_DIR = os.getenv("PARQUET_DIR", os.path.join("data", "parquet"))
+ROW_GROUP_ROWS = int(os.getenv("ROW_GROUP_ROWS", 250_000))
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 250_000))
+BUFFER_ROWS = int(os.getenv("BUFFER_ROWS", 1_000_000))  # rows pending across all partitions
+
+RAW_MAP = {"products": "PRODUCTS_RAW", "consumers": "CONSUMERS_RAW", "orders": "ORDERS_RAW"}
+PARTITION_BY = {"orders": "order_ts"}
+DICT_COLS = {"color", "country", "region", "appellation", "sweetness", "tannin", "acidity", "channel"}
+TIMESTAMP_COLS = {"order_ts", "created_at"}
+WHOLE = "all"  # partition name of unpartitioned tables
+
+def pa():
+    try:
+        import pyarrow, pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise SystemExit("Parquet staging needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+def arrow_schema(table):
+    pa_ = pa()
+    sql_types = dict(re.findall(r"^\s*(\w+) (INTEGER|REAL|TEXT)", TABLES[table]["schema"], re.M))
+    fields = []
+    for c in TABLES[table]["cols"]:
+        if c in TIMESTAMP_COLS:
+            t = pa_.timestamp("us")
+        elif c in DICT_COLS:
+            t = pa_.dictionary(pa_.int32(), pa_.string())
+        else:
+            t = {"INTEGER": pa_.int64(), "REAL": pa_.float64(), "TEXT": pa_.string()}[sql_types[c]]
+        fields.append(pa_.field(c, t))
+    return pa_.schema(fields)
+
+def partition_queries(conn, table):
+    """(partition name, WHERE clause, params) for every partition of the table; used to validate."""
+    col = PARTITION_BY.get(table)
+    if col is None:
+        return [(WHOLE, "1=1", ())]
+    days = [r[0] for r in conn.execute(f"SELECT DISTINCT substr({col}, 1, 10) FROM {table} ORDER BY 1")]
+    out = []
+    for d in days:
+        nxt = (date.fromisoformat(d) + timedelta(days=1)).isoformat()
+        # half-open string range keeps the order_ts index usable
+        out.append((f"order_date={d}", f"{col} >= ? AND {col} < ?", (d, nxt)))
+    return out
+
+def to_frame(df):
+    for c in TIMESTAMP_COLS & set(df.columns):
+        df[c] = pd.to_datetime(df[c], format="ISO8601")
+    return df
+
+def load_manifest():
+    path = os.path.join(PARQUET_DIR, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    path = os.path.join(PARQUET_DIR, "_manifest.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+class PartitionWriters:
+    """One ParquetWriter per partition, fed by a single sequential pass over the table.
+
+    Rows are buffered per partition and written as row groups of at most ROW_GROUP_ROWS;
+    when more than BUFFER_ROWS rows are pending overall the largest buffers are flushed
+    early, so memory stays bounded however many partitions there are.
+    """
+    def __init__(self, table, schema):
+        self.table, self.schema = table, schema
+        self.writers, self.pending, self.rows, self.digests = {}, {}, {}, {}
+        self.buffered = 0
+
+    def add(self, name, df):
+        self.digests.setdefault(name, hashlib.blake2b(digest_size=16)).update(
+            pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        self.rows[name] = self.rows.get(name, 0) + len(df)
+        self.pending.setdefault(name, []).append(df)
+        self.buffered += len(df)
+        if sum(len(d) for d in self.pending[name]) >= ROW_GROUP_ROWS:
+            self.flush(name)
+        while self.buffered > BUFFER_ROWS:
+            self.flush(max(self.pending, key=lambda k: sum(len(d) for d in self.pending[k])))
+
+    def flush(self, name):
+        import pyarrow.parquet as pq
+        frames = self.pending.pop(name, [])
+        if not frames:
+            return
+        df = to_frame(pd.concat(frames, ignore_index=True))
+        self.buffered -= len(df)
+        w = self.writers.get(name)
+        if w is None:
+            os.makedirs(os.path.join(PARQUET_DIR, self.table, name), exist_ok=True)
+            w = self.writers[name] = pq.ParquetWriter(
+                self.tmp_path(name), self.schema, compression="zstd",
+                use_dictionary=sorted(DICT_COLS & set(self.schema.names)))
+        w.write_table(pa().Table.from_pandas(df, schema=self.schema, preserve_index=False),
+                      row_group_size=ROW_GROUP_ROWS)
+
+    def close(self):
+        for name in list(self.pending):
+            self.flush(name)
+        for w in self.writers.values():
+            w.close()
+        return {n: (self.rows[n], self.digests[n].hexdigest()) for n in self.writers}
+
+    def path(self, name):
+        return os.path.join(PARQUET_DIR, self.table, name, "part-0.parquet")
+
+    def tmp_path(self, name):
+        return self.path(name) + ".tmp"
+
+def export_table(conn, table):
+    """Read the table once in id order and route every chunk to its partitions."""
+    out = PartitionWriters(table, arrow_schema(table))
+    col, cols, last = PARTITION_BY.get(table), ",".join(TABLES[table]["cols"]), -(1 << 63)
+    while True:
+        df = pd.read_sql_query(f"SELECT {cols} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                               conn, params=(last, CHUNK_ROWS))
+        if df.empty:
+            break
+        last = int(df["id"].iloc[-1])
+        if col is None:
+            out.add(WHOLE, df)
+            continue
+        for day, part in df.groupby(df[col].str[:10], sort=False):
+            out.add(f"order_date={day}", part)
+    return out, out.close()
+
+def export(tables=RAW_MAP):
+    """Export changed partitions; returns {table: [changed partition names]}."""
+    manifest, changed = load_manifest(), {}
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    with sqlite3.connect(DB_PATH) as conn:
+        for table in tables:
+            t0 = time.perf_counter()
+            out, parts = export_table(conn, table)
+            entries = manifest.setdefault(table, {})
+            changed[table] = []
+            for name, (n, digest) in sorted(parts.items()):
+                path = out.path(name)
+                if entries.get(name, {}).get("digest") == digest and os.path.exists(path):
+                    os.remove(out.tmp_path(name))
+                    continue
+                os.replace(out.tmp_path(name), path)
+                entries[name] = {"digest": digest, "rows": n, "bytes": os.path.getsize(path), "loaded": False}
+                changed[table].append(name)
+            for name in set(entries) - set(parts):  # e.g. a day with no orders any more
+                if entries[name]["rows"]:
+                    entries[name] = {"digest": None, "rows": 0, "bytes": 0, "loaded": False}
+                    changed[table].append(name)
+                    if os.path.exists(out.path(name)):
+                        os.remove(out.path(name))
+            dt = time.perf_counter() - t0
+            rows = sum(n for n, _ in parts.values())
+            print(f"{table}: {rows} rows, {len(parts)} partitions, {len(changed[table])} changed ({dt:.1f}s).")
+    save_manifest(manifest)
+    return changed
+
+def validate(tables=RAW_MAP):
+    """Read every Parquet partition back and compare row counts and ids with SQLite."""
+    import pyarrow.parquet as pq
+    manifest, bad = load_manifest(), []
+    with sqlite3.connect(DB_PATH) as conn:
+        for table in tables:
+            for name, where, params in partition_queries(conn, table):
+                path = os.path.join(PARQUET_DIR, table, name, "part-0.parquet")
+                if not os.path.exists(path):
+                    bad.append(f"{table}/{name}: missing"); continue
+                t = pq.read_table(path, columns=["id"])
+                n, s = conn.execute(f"SELECT COUNT(*), TOTAL(id) FROM {table} WHERE {where}", params).fetchone()
+                ids = t.column("id").to_numpy()
+                if len(ids) != n or float(ids.sum()) != s:
+                    bad.append(f"{table}/{name}: parquet {len(ids)} rows, sqlite {n}")
+                if manifest.get(table, {}).get(name, {}).get("rows") != n:
+                    bad.append(f"{table}/{name}: manifest out of date")
+    for b in bad:
+        print(b)
+    print("Parquet export valid." if not bad else f"{len(bad)} problems.")
+    return not bad
+
+def copy_into_snowflake(conn, tables=RAW_MAP):
+    """Replace each not-yet-loaded partition in *_RAW: PUT the file, then delete its rows and COPY it in.
+
+    The delete and the COPY share one transaction, so readers never see the partition empty.
+    FORCE=TRUE: a rerun after a COPY whose manifest update was lost re-stages the same file
+    (same name and checksum), which Snowflake's load metadata would otherwise skip.
+    """
+    manifest = load_manifest()
+    cur = conn.cursor()
+    try:
+        for table, raw in tables.items():
+            for name, entry in sorted(manifest.get(table, {}).items()):
+                if entry["loaded"]:
+                    continue
+                if entry["rows"]:
+                    path = os.path.abspath(os.path.join(PARQUET_DIR, table, name, "part-0.parquet"))
+                    cur.execute(f"PUT 'file://{path}' @%{raw}/{name}/ OVERWRITE=TRUE AUTO_COMPRESS=FALSE")
+                cur.execute("BEGIN")
+                try:
+                    if name == WHOLE:
+                        cur.execute(f"DELETE FROM {raw}")
+                    else:
+                        col, day = PARTITION_BY[table].upper(), name.split("=", 1)[1]
+                        cur.execute(f"DELETE FROM {raw} WHERE TO_DATE({col}) = %s", (day,))
+                    # COPY logs no changed keys: the next SP_REFRESH diffs the whole table
+                    cur.execute("DELETE FROM RAW_CHANGES WHERE TBL = %s", (raw,))
+                    if entry["rows"]:
+                        cur.execute(f"COPY INTO {raw} FROM @%{raw}/{name}/ FILE_FORMAT=(TYPE=PARQUET) "
+                                    f"MATCH_BY_COLUMN_NAME=CASE_INSENSITIVE FORCE=TRUE PURGE=TRUE")
+                    cur.execute("COMMIT")
+                except Exception:
+                    cur.execute("ROLLBACK")
+                    raise
+                entry["loaded"] = True
+                save_manifest(manifest)  # after every partition, so a rerun resumes where it stopped
+                print(f"{raw}: {name} loaded ({entry['rows']} rows, {entry['bytes']:,} bytes).")
+    finally:
+        cur.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Stage SQLite tables as Parquet and bulk-load them into Snowflake.")
+    ap.add_argument("step", choices=["export", "validate", "load"])
+    args = ap.parse_args(argv)
+    if args.step == "export":
+        export()
+    elif args.step == "validate":
+        if not validate():
+            raise SystemExit(1)
+    else:
+        from extract_and_load_to_snowflake import sf_conn
+        conn = sf_conn()
+        try:
+            copy_into_snowflake(conn)
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
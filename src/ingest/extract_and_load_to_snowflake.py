@@ -1,11 +1,19 @@
-import os, sqlite3, pandas as pd
+import os, sys, json, time, queue, sqlite3, argparse, threading, pandas as pd
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import instrumentation as ins
 
 load_dotenv()
 
 DB_PATH = os.getenv("SQLITE_DB", "winenot.db")
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 100_000))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
+PARTITION_ROWS = int(os.getenv("PARTITION_ROWS", 1_000_000))
+EXTRACT_STATE = os.getenv("EXTRACT_STATE", ".extract_state.json")
+RAW_CHANGES = os.getenv("RAW_CHANGES", "RAW_CHANGES")
+IN_LIST = 10_000  # ids per DELETE ... IN (...) statement
 
 SF = dict(
     account=os.getenv("SF_ACCOUNT"),
@@ -23,29 +31,460 @@ RAW_MAP = {
     "orders":  "ORDERS_RAW"
 }
 
+# High-watermark column per table for --incremental when the source keeps no row versions.
+# Any column that only grows for new rows works (order_ts, created_at), but such a watermark
+# is insert-only: rows updated or deleted in place below it are never shipped. Tables loaded
+# by `sqlite_seed.py --incremental` carry per-row versions and deletion tombstones instead
+# (_row_hash_<table>.v, _deleted_<table>), and the extract follows those (VERSION_COL).
+VERSION_COL = "_v"
+WATERMARK_COLS = {
+    "products": "id",
+    "consumers": "id",
+    "orders": "id",
+}
+
 def q(sql):
     with sqlite3.connect(DB_PATH) as conn:
         return pd.read_sql_query(sql, conn)
 
 def sf_conn():
+    import snowflake.connector
     return snowflake.connector.connect(**SF)
 
-def safe_write(df, table):
-    conn = sf_conn()
+# ---- Sinks: anything with write(df, table) -> (success, nchunks, nrows, output),
+# delete_after(table, col, value), delete_ids(table, ids, col), reset() and close() ----
+
+class SnowflakeSink:
+    """write_pandas over one connection that is opened lazily and reused for every chunk."""
+    def __init__(self, connect=sf_conn):
+        self._connect, self._conn = connect, None
+
+    def write(self, df, table):
+        from snowflake.connector.pandas_tools import write_pandas
+        if self._conn is None or self._conn.is_closed():
+            self._conn = self._connect()
+        return write_pandas(self._conn, df, table, auto_create_table=False)
+
+    def delete_after(self, table, col, value):
+        if self._conn is None or self._conn.is_closed():
+            self._conn = self._connect()
+        cur = self._conn.cursor()
+        try:
+            if value is None:
+                cur.execute(f"DELETE FROM {table}")
+            else:
+                cur.execute(f"DELETE FROM {table} WHERE {col.upper()} > %s", (value,))
+            return cur.rowcount
+        finally:
+            cur.close()
+
+    def delete_ids(self, table, ids, col="id"):
+        if self._conn is None or self._conn.is_closed():
+            self._conn = self._connect()
+        cur, n = self._conn.cursor(), 0
+        try:
+            for i in range(0, len(ids), IN_LIST):
+                part = list(ids[i:i + IN_LIST])
+                cur.execute(f"DELETE FROM {table} WHERE {col.upper()} IN ({','.join(['%s'] * len(part))})", part)
+                n += cur.rowcount
+            return n
+        finally:
+            cur.close()
+
+    def reset(self):
+        # drop a possibly broken session; the next write reconnects
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def close(self):
+        self.reset()
+
+class SQLiteSink:
+    """Offline stand-in for Snowflake with the same write_pandas return contract."""
+    def __init__(self, path):
+        self.path, self._conn = path, None
+
+    def write(self, df, table):
+        if self._conn is None:
+            # several writer threads may share the file; wait for the write lock instead of failing
+            self._conn = sqlite3.connect(self.path, timeout=300)
+        df.to_sql(table, self._conn, if_exists="append", index=False)
+        self._conn.commit()
+        return True, 1, len(df), []
+
+    def delete_after(self, table, col, value):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=300)
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+            return 0
+        if value is None:
+            n = self._conn.execute(f"DELETE FROM {table}").rowcount
+        else:
+            n = self._conn.execute(f"DELETE FROM {table} WHERE {col} > ?", (value,)).rowcount
+        self._conn.commit()
+        return n
+
+    def delete_ids(self, table, ids, col="id"):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=300)
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+            return 0
+        n = self._conn.execute(f"DELETE FROM {table} WHERE {col} IN (SELECT value FROM json_each(?))",
+                               (json.dumps(list(ids)),)).rowcount
+        self._conn.commit()
+        return n
+
+    def reset(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close(); self._conn = None
+
+def make_sink(kind, target=None):
+    if kind == "snowflake":
+        return SnowflakeSink()
+    if kind == "sqlite":
+        return SQLiteSink(target or "staging_local.db")
+    raise ValueError(f"unknown sink {kind!r}")
+
+# ---- Streaming extract ----
+
+def read_chunks(conn, table, chunk_rows=CHUNK_ROWS, after=None, until=None):
+    """Keyset pagination on id: bounded memory, and each chunk is an independent, repeatable query."""
+    last = -(1 << 63) if after is None else after
+    until = (1 << 63) - 1 if until is None else until
+    while True:
+        df = pd.read_sql_query(f"SELECT * FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?", conn,
+                               params=(last, until, chunk_rows))
+        if df.empty:
+            return
+        yield df
+        last = int(df["id"].iloc[-1])
+
+def read_since(conn, table, col, after=None, until=None, chunk_rows=CHUNK_ROWS):
+    """Rows with after < col <= until, keyset-paginated on (col, id) so ties on col are never split or repeated."""
+    if col == "id":
+        yield from read_chunks(conn, table, chunk_rows, after, until)
+        return
+    big = (1 << 63) - 1
+    last_v, last_id = after, big  # (after, +inf) excludes every row with col == after
+    while True:
+        if last_v is None:
+            where, params = f"{col} <= ?", (until,)
+        else:
+            where, params = f"{col} <= ? AND ({col} > ? OR ({col} = ? AND id > ?))", (until, last_v, last_v, last_id)
+        df = pd.read_sql_query(f"SELECT * FROM {table} WHERE {where} ORDER BY {col}, id LIMIT ?", conn,
+                               params=params + (chunk_rows,))
+        if df.empty:
+            return
+        yield df
+        last_v, last_id = df[col].iloc[-1], int(df["id"].iloc[-1])
+        last_v = last_v.item() if hasattr(last_v, "item") else last_v
+
+class PartialWrite(Exception):
+    """The sink reported a failed or short write; some rows may have landed, so it is not retried."""
+
+def write_with_retry(sink, df, table, retries=MAX_RETRIES, backoff=1.0):
+    for attempt in range(1, retries + 1):
+        try:
+            result = sink.write(df, table)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"{table}: chunk of {len(df)} rows failed ({e}); retry {attempt}/{retries - 1}")
+            ins.count("write_retries", table=table)
+            sink.reset()
+            time.sleep(backoff * 2 ** (attempt - 1))
+            continue
+        ok, _, n, _ = result
+        if not ok or n != len(df):
+            raise PartialWrite(f"{table}: write reported success={ok} with {n} of {len(df)} rows")
+        return result
+
+def stream_table(sink, src_table, table, chunk_rows=CHUNK_ROWS):
+    rows, t0 = 0, time.perf_counter()
+    with sqlite3.connect(DB_PATH) as conn, ins.span("extract", table=src_table, target=table) as s:
+        for df in read_chunks(conn, src_table, chunk_rows):
+            n = write_with_retry(sink, df, table)[2]
+            rows += n; s.add(rows=n)
+    dt = time.perf_counter() - t0
+    print(f"{table}: {rows} rows loaded ({rows / max(dt, 1e-9):,.0f} rows/s).")
+    return rows
+
+# ---- Parallel, range-partitioned load ----
+
+def partitions(conn, table, partition_rows=PARTITION_ROWS):
+    """Split [min(id), max(id)] into inclusive id ranges of partition_rows ids."""
+    lo, hi = conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+    if lo is None:
+        return []
+    return [(a, min(a + partition_rows - 1, hi)) for a in range(lo, hi + 1, partition_rows)]
+
+def parallel_load(sink_factory, tables=RAW_MAP, workers=4, partition_rows=PARTITION_ROWS, chunk_rows=CHUNK_ROWS):
+    """Load all tables at once: id-range readers feed a bounded queue drained by `workers` writers.
+
+    Readers and writers each own their connection (writers get one sink each from
+    sink_factory). The queue holds at most 2*workers chunks, so fast readers block
+    instead of buffering a table in memory. Row counts are checked per partition.
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        # largest partitions first so small tables fill the gaps at the end
+        parts = sorted(((src, raw, lo, hi) for src, raw in tables.items() for lo, hi in partitions(conn, src, partition_rows)),
+                       key=lambda p: p[2] - p[3])
+    chunks = queue.Queue(maxsize=2 * workers)
+    loaded, lock, stop, errors = Counter(), threading.Lock(), threading.Event(), []
+
+    def read(part):
+        src, _, lo, hi = part
+        with sqlite3.connect(DB_PATH) as conn:
+            for df in read_chunks(conn, src, chunk_rows, after=lo - 1, until=hi):
+                while not stop.is_set():
+                    try:
+                        chunks.put((part, df), timeout=0.5); break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+
+    def write():
+        sink = sink_factory()
+        try:
+            while (item := chunks.get()) is not None:
+                part, df = item
+                if stop.is_set():
+                    continue  # keep draining so readers never block forever
+                try:
+                    n = write_with_retry(sink, df, part[1])[2]
+                except Exception as e:
+                    errors.append(e); stop.set(); continue
+                with lock:
+                    loaded[part] += n
+        finally:
+            sink.close()
+
+    t0 = time.perf_counter()
+    writers = [threading.Thread(target=write, name=f"writer-{i}") for i in range(workers)]
+    for w in writers:
+        w.start()
+    with ins.span("extract_parallel", workers=workers, partitions=len(parts)) as s:
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reader") as ex:
+                list(ex.map(read, parts))
+        except Exception:
+            stop.set(); raise
+        finally:
+            for _ in writers:
+                chunks.put(None)
+            for w in writers:
+                w.join()
+            s.add(rows=sum(loaded.values()))
+    if errors:
+        raise errors[0]
+    dt = time.perf_counter() - t0
+
+    with sqlite3.connect(DB_PATH) as conn:
+        bad = []
+        for part in parts:
+            src, raw, lo, hi = part
+            expected = conn.execute(f"SELECT COUNT(*) FROM {src} WHERE id BETWEEN ? AND ?", (lo, hi)).fetchone()[0]
+            if loaded[part] != expected:
+                bad.append(f"{raw}[{lo}..{hi}]: loaded {loaded[part]}, source {expected}")
+    for raw in tables.values():
+        rows = sum(n for p, n in loaded.items() if p[1] == raw)
+        ins.count("rows_loaded", rows, table=raw)
+        print(f"{raw}: {rows} rows loaded.")
+    total = sum(loaded.values())
+    print(f"{len(parts)} partitions, {workers} workers: {total} rows in {dt:.1f}s ({total / max(dt, 1e-9):,.0f} rows/s).")
+    if bad:
+        raise SystemExit("Row count mismatch:\n  " + "\n  ".join(bad))
+    return loaded
+
+# ---- Watermark-based incremental extract ----
+
+def load_state(path=EXTRACT_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state, path=EXTRACT_STATE):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)  # atomic: a crash leaves either the old or the new watermark
+
+# RAW_CHANGES(TBL, ID) lists the ids an incremental run wrote or deleted in each *_RAW table,
+# so DEV.SP_REFRESH diffs only those keys instead of scanning RAW and DEV in full. The
+# procedure adds a marker row (ID NULL) once DEV matches RAW; any load that rewrites RAW
+# without logging keys drops the table's rows and marker, which forces the next full diff.
+
+def log_keys(sink, raw, ids):
+    if len(ids):
+        write_with_retry(sink, pd.DataFrame({"TBL": raw, "ID": ids}), RAW_CHANGES)
+
+def forget_keys(sink, raw):
+    return sink.delete_ids(RAW_CHANGES, [raw], "TBL")
+
+def tracked(conn, src):
+    """(version, since) of src's row history kept by sqlite_seed --incremental, or None."""
     try:
-        ok, chunks, rows, _ = write_pandas(conn, df, table, auto_create_table=False)
+        row = conn.execute("SELECT version, since FROM _load_state WHERE tbl = ?", (src,)).fetchone()
+    except sqlite3.OperationalError:  # no _load_state, or one written before versions were kept
+        return None
+    if not row or row[0] is None:
+        return None
+    n = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                     (f"_row_hash_{src}", f"_deleted_{src}")).fetchone()[0]
+    return tuple(row) if n == 2 else None
+
+def incremental_table(sink, src, raw, state, state_path=EXTRACT_STATE, chunk_rows=CHUNK_ROWS):
+    """Ship what changed since the committed watermark, then commit the new watermark.
+
+    The source is read in one transaction, so rows written during the run wait for the next
+    one. Tables with a row history (see tracked()) ship every insert, update and delete
+    since the committed load version; others ship rows above an insert-only watermark.
+    Either way a rerun after a failed one converges on the source: rows a failed run left
+    behind are deleted from the target before being written again.
+    """
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("BEGIN")
+        history = tracked(conn, src)
+        if history:
+            return changes_table(conn, sink, src, raw, state, history, state_path, chunk_rows)
+        col = WATERMARK_COLS[src]
+        prev = state.get(src, {})
+        wm = prev.get("value") if prev.get("col") == col else None
+        hi = conn.execute(f"SELECT MAX({col}) FROM {src}").fetchone()[0]
+        if hi is None or (wm is not None and hi <= wm):
+            print(f"{raw}: up to date ({col} = {wm}).")
+            return 0
+        removed = sink.delete_after(raw, col, wm)
+        if removed:
+            print(f"{raw}: removed {removed} rows " + ("for a full reload." if wm is None else "left by an unfinished run."))
+        if wm is None:
+            forget_keys(sink, raw)  # a full reload: the next refresh diffs the whole table
+        rows = 0
+        with ins.span("extract_incremental", table=src, target=raw) as s:
+            for df in read_since(conn, src, col, wm, hi, chunk_rows):
+                n = write_with_retry(sink, df, raw)[2]
+                if wm is not None:
+                    log_keys(sink, raw, df["id"].tolist())
+                rows += n; s.add(rows=n)
+    state[src] = {"col": col, "value": hi, "rows": rows}
+    save_state(state, state_path)
+    print(f"{raw}: {rows} new rows ({col} {wm} -> {hi}; inserts only, {src} has no row history).")
+    return rows
+
+def changes_table(conn, sink, src, raw, state, history, state_path=EXTRACT_STATE, chunk_rows=CHUNK_ROWS):
+    """Ship the rows src gained, changed or lost in the load versions after the committed one.
+
+    A new history (first run, or a plain reload of the source) re-ships the whole table.
+    Otherwise each chunk of changed ids is deleted from the target, the surviving rows are
+    written back and the ids are logged in RAW_CHANGES; deleted ids are simply not rewritten.
+    """
+    version, since = history
+    prev = state.get(src, {})
+    wm = prev.get("value") if prev.get("col") == VERSION_COL and prev.get("since") == since else None
+    if wm is not None and version <= wm:
+        print(f"{raw}: up to date (load version {wm}).")
+        return 0
+    rows = deleted = 0
+    with ins.span("extract_incremental", table=src, target=raw) as s:
+        if wm is None:
+            print(f"{raw}: emptied ({sink.delete_after(raw, 'id', None)} rows) for a full reload of {src}.")
+            forget_keys(sink, raw)
+            for df in read_chunks(conn, src, chunk_rows):
+                n = write_with_retry(sink, df, raw)[2]
+                rows += n; s.add(rows=n)
+        else:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS _ship (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM _ship")
+            for hist in (f"_row_hash_{src}", f"_deleted_{src}"):
+                conn.execute(f"INSERT OR IGNORE INTO _ship SELECT id FROM {hist} WHERE v > ? AND v <= ?", (wm, version))
+            last = -(1 << 63)
+            while ids := [r[0] for r in conn.execute("SELECT id FROM _ship WHERE id > ? ORDER BY id LIMIT ?",
+                                                    (last, chunk_rows))]:
+                sink.delete_ids(raw, ids)
+                df = pd.read_sql_query(f"SELECT t.* FROM _ship k JOIN {src} t ON t.id = k.id "
+                                       f"WHERE k.id >= ? AND k.id <= ? ORDER BY t.id", conn, params=(ids[0], ids[-1]))
+                n = write_with_retry(sink, df, raw)[2] if len(df) else 0
+                log_keys(sink, raw, ids)
+                rows += n; deleted += len(ids) - n; s.add(rows=n)
+                last = ids[-1]
+    state[src] = {"col": VERSION_COL, "since": since, "value": version, "rows": rows, "deleted": deleted}
+    save_state(state, state_path)
+    print(f"{raw}: {rows} rows written, {deleted} deleted (load version {wm} -> {version}).")
+    return rows
+
+def safe_write(df, table, sink=None):
+    own = sink is None
+    sink = sink or SnowflakeSink()
+    try:
+        ok, chunks, rows, _ = write_with_retry(sink, df, table)
         print(f"{table}: {rows} rows loaded.")
     finally:
-        conn.close()
+        if own:
+            sink.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Extract SQLite tables and load them into STAGING *_RAW tables.")
+    ap.add_argument("--sink", choices=["snowflake", "sqlite"], default="snowflake")
+    ap.add_argument("--target", help="database file for --sink sqlite")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--workers", type=int, default=0,
+                    help="load all tables concurrently with N writer connections, in id-range partitions")
+    ap.add_argument("--partition-rows", type=int, default=PARTITION_ROWS)
+    ap.add_argument("--incremental", action="store_true",
+                    help="ship only what changed since each table's committed watermark")
+    ap.add_argument("--state", default=EXTRACT_STATE, help="watermark state file for --incremental")
+    ap.add_argument("--replace", action="store_true",
+                    help="empty every *_RAW table first, so a full load can be rerun without duplicates")
+    args = ap.parse_args(argv)
+    if args.incremental and args.workers:
+        ap.error("--incremental runs sequentially; drop --workers")
+    if args.incremental and args.replace:
+        ap.error("--replace is a full reload; drop --incremental")
+
+    if not args.incremental:
+        # a full load logs no keys, so the next SP_REFRESH has to diff whole tables
+        sink, state = make_sink(args.sink, args.target), load_state(args.state)
+        try:
+            for src, raw in RAW_MAP.items():
+                forget_keys(sink, raw)
+                if args.replace:
+                    print(f"{raw}: emptied ({sink.delete_after(raw, 'id', None)} rows).")
+                    state.pop(src, None)  # the watermark described rows that are gone
+        finally:
+            sink.close()
+        if args.replace and os.path.exists(args.state):
+            save_state(state, args.state)
 
-def main():
-    products = q("SELECT * FROM products")
-    consumers = q("SELECT * FROM consumers")
-    orders    = q("SELECT * FROM orders")
+    if args.incremental:
+        sink, state = make_sink(args.sink, args.target), load_state(args.state)
+        try:
+            for src, raw in RAW_MAP.items():
+                incremental_table(sink, src, raw, state, args.state, args.chunk_rows)
+        finally:
+            sink.close()
+        return
 
-    safe_write(products, RAW_MAP["products"])
-    safe_write(consumers, RAW_MAP["consumers"])
-    safe_write(orders,    RAW_MAP["orders"])
+    if args.workers:
+        parallel_load(lambda: make_sink(args.sink, args.target), RAW_MAP, args.workers,
+                      args.partition_rows, args.chunk_rows)
+        return
+
+    sink = make_sink(args.sink, args.target)
+    try:
+        for src, raw in RAW_MAP.items():
+            stream_table(sink, src, raw, args.chunk_rows)
+    finally:
+        sink.close()
 
 if __name__ == "__main__":
     main()
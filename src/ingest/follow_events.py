@@ -0,0 +1,202 @@
+import os, json, time, sqlite3, argparse
+
+# Tails data/orders_events.jsonl while order_event_generator writes it. Complete lines are
+# collected into micro-batches (by size or age) and each batch is inserted into
+# order_events in one transaction together with the new byte offset, so after a crash the
+# consumer resumes exactly after the last committed event. Truncation (file shorter than
+# the offset) restarts at 0; rotation (path now points to another inode) drains the old
+# file first, then follows the new one from 0.
+
+DB_PATH = os.getenv("SQLITE_DB", "winenot.db")
+EVENTS_PATH = os.getenv("EVENTS_PATH", os.path.join("data", "orders_events.jsonl"))
+BATCH_SIZE = int(os.getenv("FOLLOW_BATCH_SIZE", 5000))
+BATCH_MS = int(os.getenv("FOLLOW_BATCH_MS", 200))
+POLL_MS = int(os.getenv("FOLLOW_POLL_MS", 20))
+READ_BYTES = 1 << 20
+
+COLS = ["order_id", "wine_id", "customer_id", "quantity", "order_date", "total_price", "status", "payment_method"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+  order_id TEXT,
+  wine_id INTEGER,
+  customer_id INTEGER,
+  quantity INTEGER,
+  order_date TEXT,
+  total_price TEXT,
+  status TEXT,
+  payment_method TEXT,
+  ingested_at REAL
+);
+CREATE TABLE IF NOT EXISTS order_events_rejects (
+  line TEXT,
+  error TEXT,
+  ingested_at REAL
+);
+CREATE TABLE IF NOT EXISTS _follow_offsets (
+  path TEXT PRIMARY KEY,
+  inode INTEGER,
+  offset INTEGER,
+  updated_at REAL
+);"""
+
+class Follower:
+    def __init__(self, path=EVENTS_PATH, db_path=DB_PATH, batch_size=BATCH_SIZE, batch_ms=BATCH_MS):
+        self.path, self.key = path, os.path.abspath(path)
+        self.batch_size, self.batch_s = batch_size, batch_ms / 1000
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # readers are not blocked by the consumer
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT inode, offset FROM _follow_offsets WHERE path = ?", (self.key,)).fetchone()
+        self.inode, self.offset = row if row else (None, 0)
+        self.f, self.buf = None, b""
+        self.read_to = self.offset  # end of the last complete line read, committed or not
+        self.rows, self.rejects, self.first_at = [], [], None
+        self.stats = dict(events=0, batches=0, rejects=0, truncations=0, rotations=0, last_latency_ms=0.0, max_latency_ms=0.0)
+
+    # ---- file handling ----
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        ino = os.fstat(f.fileno()).st_ino
+        if self.inode is not None and ino != self.inode:
+            self.offset = 0  # a different file than the one the saved offset belongs to
+        self.f, self.inode, self.buf, self.read_to = f, ino, b"", self.offset
+        self.f.seek(self.offset)
+        return True
+
+    def _check_file(self):
+        """Handle truncation and rotation; True when the current fd is worth reading."""
+        if self.f is None and not self._open():
+            return False
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True  # rotated away and not recreated yet: keep draining the old fd
+        if st.st_ino != self.inode:
+            if self._read() == 0:  # old file drained
+                self.flush()
+                self.f.close(); self.f = None
+                self.stats["rotations"] += 1
+                self.inode = st.st_ino
+                self.offset = self.read_to = 0
+                return self._open()
+            return True
+        if st.st_size < self.f.tell():
+            self.flush()  # what was read before the truncation is still valid
+            self.stats["truncations"] += 1
+            self.offset = self.read_to = 0
+            self.buf = b""
+            self.f.seek(0)
+        return True
+
+    def _read(self):
+        data = self.f.read(READ_BYTES)
+        if not data:
+            return 0
+        read_at = time.monotonic()
+        self.buf += data
+        *lines, self.buf = self.buf.split(b"\n")
+        consumed = 0
+        now = time.time()
+        for line in lines:
+            consumed += len(line) + 1
+            if not line.strip():
+                continue
+            try:
+                e = json.loads(line)
+                self.rows.append([e.get(c) for c in COLS] + [now])
+            except (ValueError, AttributeError) as ex:
+                self.rejects.append((line.decode("utf-8", "replace"), str(ex), now))
+        if self.first_at is None and (self.rows or self.rejects):
+            self.first_at = read_at  # a partial line or blank lines start no batch
+        self.read_to += consumed
+        return len(data)
+
+    # ---- batching ----
+
+    def due(self):
+        if not self.rows and not self.rejects:
+            return False
+        return len(self.rows) >= self.batch_size or time.monotonic() - self.first_at >= self.batch_s
+
+    def flush(self):
+        if not self.rows and not self.rejects:
+            return
+        offset = self.read_to
+        with self.conn:  # one transaction: events, rejects and the offset commit together
+            self.conn.executemany(f"INSERT INTO order_events ({','.join(COLS)}, ingested_at) "
+                                  f"VALUES ({','.join(['?'] * (len(COLS) + 1))})", self.rows)
+            if self.rejects:
+                self.conn.executemany("INSERT INTO order_events_rejects VALUES (?, ?, ?)", self.rejects)
+            self.conn.execute("INSERT OR REPLACE INTO _follow_offsets VALUES (?, ?, ?, ?)",
+                              (self.key, self.inode, offset, time.time()))
+        latency = (time.monotonic() - self.first_at) * 1000
+        self.stats["events"] += len(self.rows); self.stats["rejects"] += len(self.rejects)
+        self.stats["batches"] += 1
+        self.stats["last_latency_ms"] = round(latency, 1)
+        self.stats["max_latency_ms"] = round(max(self.stats["max_latency_ms"], latency), 1)
+        self.offset = offset
+        self.rows, self.rejects, self.first_at = [], [], None
+
+    def lag(self):
+        """Bytes written to the file but not yet committed, and age of the oldest pending event."""
+        try:
+            size = os.fstat(self.f.fileno()).st_size if self.f else self.offset
+        except OSError:
+            size = self.offset
+        pending_ms = (time.monotonic() - self.first_at) * 1000 if self.first_at else 0.0
+        return dict(bytes_lag=max(0, size - self.offset), pending_ms=round(pending_ms, 1))
+
+    def poll(self):
+        """Read what is available and commit due batches; returns bytes read."""
+        if not self._check_file():
+            return 0
+        n = self._read()
+        if self.due():
+            self.flush()
+        return n
+
+    def close(self):
+        self.flush()
+        if self.f:
+            self.f.close()
+        self.conn.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Follow orders_events.jsonl and ingest it into SQLite in micro-batches.")
+    ap.add_argument("--path", default=EVENTS_PATH)
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="commit after this many events")
+    ap.add_argument("--batch-ms", type=int, default=BATCH_MS, help="or when the oldest pending event is this old")
+    ap.add_argument("--poll-ms", type=int, default=POLL_MS)
+    ap.add_argument("--metrics-every", type=float, default=5.0, help="seconds between metric lines")
+    ap.add_argument("--once", action="store_true", help="ingest what is there now and exit")
+    args = ap.parse_args(argv)
+
+    fol = Follower(args.path, args.db, args.batch_size, args.batch_ms)
+    last_report, last_events = time.monotonic(), 0
+    try:
+        while True:
+            n = fol.poll()
+            if args.once and n == 0:
+                break
+            now = time.monotonic()
+            if now - last_report >= args.metrics_every:
+                rate = (fol.stats["events"] - last_events) / (now - last_report)
+                print(json.dumps(dict(fol.stats, **fol.lag(), events_per_s=round(rate, 1))), flush=True)
+                last_report, last_events = now, fol.stats["events"]
+            if n == 0:
+                time.sleep(args.poll_ms / 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fol.close()
+        print(json.dumps(dict(fol.stats, offset=fol.offset)))
+
+if __name__ == "__main__":
+    main()
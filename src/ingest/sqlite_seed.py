@@ -1,7 +1,25 @@
-import os, sqlite3, csv
+import os, sys, sqlite3, csv, time, argparse, hashlib
+from datetime import datetime, timezone
+from operator import itemgetter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import instrumentation as ins
 
 DB_PATH = os.getenv("SQLITE_DB", "winenot.db")
 DATA_DIR = os.getenv("DATA_DIR", "data")
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 50000))
+PROGRESS_EVERY = 1_000_000
+
+# Used only for the duration of a --bulk load: no rollback journal, no fsync, big cache.
+BULK_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",  # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+]
+# Put back after the load as they were before it, e.g. the WAL mode follow_events.py sets.
+RESTORE_PRAGMAS = ["journal_mode", "synchronous", "locking_mode"]
+BULK_PAGE_SIZE = 65536  # only takes effect on a fresh database file
 
 TABLES = {
     "products": {
@@ -26,7 +44,8 @@ TABLES = {
           stock_quantity INTEGER
         );""",
         "csv": "products.csv",
-        "cols": ["id","reference","color","country","region","appellation","vintage","grapes","alcohol_percent","bottle_size_l","sweetness","tannin","acidity","rating","price_eur","producer","stock_quantity"]
+        "cols": ["id","reference","color","country","region","appellation","vintage","grapes","alcohol_percent","bottle_size_l","sweetness","tannin","acidity","rating","price_eur","producer","stock_quantity"],
+        "indexes": []
     },
     "consumers": {
         "schema": """
@@ -38,7 +57,10 @@ TABLES = {
           created_at TEXT
         );""",
         "csv": "consumers.csv",
-        "cols": ["id","name","email","country","created_at"]
+        "cols": ["id","name","email","country","created_at"],
+        "indexes": [
+          "CREATE INDEX IF NOT EXISTS idx_consumers_email ON consumers(email)"
+        ]
     },
     "orders": {
         "schema": """
@@ -51,27 +73,292 @@ TABLES = {
           order_ts TEXT
         );""",
         "csv": "orders.csv",
-        "cols": ["id","consumer_id","product_id","qty","channel","order_ts"]
+        "cols": ["id","consumer_id","product_id","qty","channel","order_ts"],
+        "indexes": [
+          "CREATE INDEX IF NOT EXISTS idx_orders_consumer ON orders(consumer_id)",
+          "CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id)",
+          "CREATE INDEX IF NOT EXISTS idx_orders_ts ON orders(order_ts)"
+        ]
     }
 }
 
-def load_csv(cur, table, csv_path, cols):
+# --incremental bookkeeping: one row per table with the CSV digest and a load version, plus
+# _row_hash_<table>(id, h, v) holding a 64-bit digest of every loaded row and the version that
+# last wrote it, and _deleted_<table>(id, v) with the version that deleted each vanished id.
+# `since` marks when this history started (a plain load or a full reload restarts it), so the
+# extract can ship exactly the rows changed or deleted after the versions it already shipped.
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS _load_state (
+  tbl TEXT PRIMARY KEY,
+  file_hash TEXT,
+  row_count INTEGER,
+  loaded_at TEXT,
+  version INTEGER,
+  since TEXT
+);"""
+STATE_COLUMNS = {"version": "INTEGER", "since": "TEXT"}  # added after the first release of _load_state
+ID_MIN = -(1 << 63)
+
+def iter_batches(csv_path, cols, batch_size=BATCH_SIZE):
+    """Yield lists of at most batch_size tuples in `cols` order; memory is bounded by one batch."""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rdr = csv.reader(f)
+        header = next(rdr)
+        pick = itemgetter(*[header.index(c) for c in cols])
+        batch = []
+        for row in rdr:
+            batch.append(pick(row))
+            if len(batch) >= batch_size:
+                yield batch; batch = []
+        if batch:
+            yield batch
+
+def index_names(meta):
+    return [ddl.split(" ON ")[0].split()[-1] for ddl in meta.get("indexes", [])]
+
+def load_csv(cur, table, csv_path, cols, batch_size=BATCH_SIZE):
     if not os.path.exists(csv_path):
         raise SystemExit(f"Missing {csv_path}. Generate CSVs first.")
     cur.execute(f"DELETE FROM {table}")
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        rdr = csv.DictReader(f)
-        rows = [[row[c] for c in cols] for c,row in zip([cols]*10**9, rdr)]  # compact
-    cur.executemany(f"INSERT INTO {table} ({','.join(cols)}) VALUES ({','.join(['?']*len(cols))})", rows)
+    sql = f"INSERT INTO {table} ({','.join(cols)}) VALUES ({','.join(['?']*len(cols))})"
+    n, t0, next_report = 0, time.perf_counter(), PROGRESS_EVERY
+    for batch in iter_batches(csv_path, cols, batch_size):
+        cur.executemany(sql, batch)
+        n += len(batch)
+        if n >= next_report:
+            print(f"  {table}: {n:,} rows ({n / (time.perf_counter() - t0):,.0f} rows/s)")
+            next_report += PROGRESS_EVERY
+    return n, time.perf_counter() - t0
+
+def bulk_load(conn, table, meta, batch_size=BATCH_SIZE):
+    """Recreate the table, load it with secondary indexes absent, then build them."""
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {table}")  # much cheaper than DELETE on a big table
+    cur.execute(meta["schema"])
+    n, dt = load_csv(cur, table, os.path.join(DATA_DIR, meta["csv"]), meta["cols"], batch_size)
+    conn.commit()
+    t0 = time.perf_counter()
+    for ddl in meta.get("indexes", []):
+        cur.execute(ddl)
+    conn.commit(); cur.close()
+    return n, dt, time.perf_counter() - t0
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def batch_digests(batch):
+    """Signed 64-bit blake2b digest of each row (fits an SQLite INTEGER)."""
+    b2, fb, sep = hashlib.blake2b, int.from_bytes, "\x1f"
+    return [fb(b2(sep.join(r).encode("utf-8"), digest_size=8).digest(), "big", signed=True) for r in batch]
+
+def ensure_state(cur):
+    cur.execute(STATE_SCHEMA)
+    have = {r[1] for r in cur.execute("PRAGMA table_info(_load_state)")}
+    for col, decl in STATE_COLUMNS.items():
+        if col not in have:
+            cur.execute(f"ALTER TABLE _load_state ADD COLUMN {col} {decl}")
+
+def create_history(cur, table):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS _row_hash_{table} (id INTEGER PRIMARY KEY, h INTEGER, v INTEGER)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_row_hash_{table}_v ON _row_hash_{table}(v)")
+    cur.execute(f"CREATE TABLE IF NOT EXISTS _deleted_{table} (id INTEGER PRIMARY KEY, v INTEGER)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_deleted_{table}_v ON _deleted_{table}(v)")
+
+def has_history(cur, table):
+    """True when the table's row digests carry versions (older files only had (id, h))."""
+    cols = {r[1] for r in cur.execute(f"PRAGMA table_info(_row_hash_{table})")}
+    return "v" in cols and cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"_deleted_{table}",)).fetchone() is not None
+
+def reset_state(cur, table):
+    ensure_state(cur)
+    cur.execute("DELETE FROM _load_state WHERE tbl = ?", (table,))
+    cur.execute(f"DROP TABLE IF EXISTS _row_hash_{table}")
+    cur.execute(f"DROP TABLE IF EXISTS _deleted_{table}")
+
+class Unordered(Exception):
+    pass
+
+def apply_diff(cur, table, cols, batches, ordered=True, version=1):
+    """Upsert new/changed rows and delete vanished ones, one id range per CSV batch.
+
+    With ordered=True the CSV must be sorted by id: each batch covers the id range
+    (previous batch max, this batch max], so stored ids in that range that are absent
+    from the batch were deleted. Raises Unordered otherwise. Written and deleted ids are
+    stamped with `version` in _row_hash_<table> and _deleted_<table>.
+    """
+    pk = cols.index("id")
+    upsert = (f"INSERT INTO {table} ({','.join(cols)}) VALUES ({','.join(['?']*len(cols))}) "
+              f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in cols if c != 'id')}")
+    counts = dict(inserted=0, updated=0, deleted=0, unchanged=0)
+    lo = ID_MIN
+    for batch in batches:
+        ids = [int(r[pk]) for r in batch]
+        if ordered and (ids[0] < lo or any(a >= b for a, b in zip(ids, ids[1:]))):
+            raise Unordered(table)
+        hi = ids[-1] if ordered else None
+        stored = dict(cur.execute(f"SELECT id, h FROM _row_hash_{table} WHERE id BETWEEN ? AND ?", (lo, hi)).fetchall()) if ordered else {}
+        changed, hashes = [], []
+        for i, row, h in zip(ids, batch, batch_digests(batch)):
+            old = stored.pop(i, None)
+            if old == h:
+                counts["unchanged"] += 1
+                continue
+            counts["inserted" if old is None else "updated"] += 1
+            changed.append(row); hashes.append((i, h))
+        if changed:
+            cur.executemany(upsert, changed)
+            cur.executemany(f"INSERT OR REPLACE INTO _row_hash_{table} (id, h, v) VALUES (?, ?, {version})", hashes)
+            cur.executemany(f"DELETE FROM _deleted_{table} WHERE id = ?", ((i,) for i, _ in hashes))
+        if stored:
+            gone = [(i,) for i in stored]
+            _delete(cur, table, gone, version)
+            counts["deleted"] += len(gone)
+        if ordered:
+            lo = hi + 1
+    if ordered:
+        gone = cur.execute(f"SELECT id FROM _row_hash_{table} WHERE id >= ?", (lo,)).fetchall()
+        _delete(cur, table, gone, version)
+        counts["deleted"] += len(gone)
+    return counts
+
+def _delete(cur, table, ids, version):
+    cur.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+    cur.executemany(f"DELETE FROM _row_hash_{table} WHERE id = ?", ids)
+    cur.executemany(f"INSERT OR REPLACE INTO _deleted_{table} (id, v) VALUES (?, {version})", ids)
+
+def incremental_load(conn, table, meta, batch_size=BATCH_SIZE, agg=None):
+    """Apply only the rows of the CSV that changed since the last incremental load.
+
+    Returns None when the file digest is unchanged. The first run (or a CSV not sorted
+    by id) falls back to a full load that also records the row digests; the sales
+    aggregate triggers (agg, when installed) are off during it and the aggregates are
+    rebuilt after, as on a plain load.
+    """
+    csv_path = os.path.join(DATA_DIR, meta["csv"])
+    if not os.path.exists(csv_path):
+        raise SystemExit(f"Missing {csv_path}. Generate CSVs first.")
+    cur = conn.cursor()
+    cur.execute(meta["schema"]); ensure_state(cur)
+    digest = file_digest(csv_path)
+    prev = cur.execute("SELECT file_hash, version, since FROM _load_state WHERE tbl = ?", (table,)).fetchone()
+    if prev and prev[0] == digest:
+        return None
+    if not (prev and has_history(cur, table)):
+        reset_state(cur, table)
+        prev = None
+    create_history(cur, table)
+    conn.commit()  # keep the history tables if the ordered pass below is rolled back
+    version = (prev[1] or 0) + 1 if prev else 1
+    since = prev[2] if prev and prev[2] else datetime.now(timezone.utc).isoformat()
+    cols = meta["cols"]
+    rebuild = False
+    try:
+        if not prev:
+            raise Unordered(table)  # no trustworthy row digests yet
+        counts = apply_diff(cur, table, cols, iter_batches(csv_path, cols, batch_size), version=version)
+    except Unordered:
+        conn.rollback()
+        if agg and table in agg.SOURCES:
+            agg.drop_triggers(conn); rebuild = True
+        cur.execute(f"DELETE FROM {table}")
+        # every known id is deleted at this version unless the reload brings it back
+        cur.execute(f"INSERT OR REPLACE INTO _deleted_{table} (id, v) SELECT id, ? FROM _row_hash_{table}", (version,))
+        cur.execute(f"DELETE FROM _row_hash_{table}")
+        counts = apply_diff(cur, table, cols, iter_batches(csv_path, cols, batch_size), ordered=False, version=version)
+    for ddl in meta.get("indexes", []):  # a first run creates them; the aggregate triggers look rows up by them
+        cur.execute(ddl)
+    n = cur.execute(f"SELECT COUNT(*) FROM _row_hash_{table}").fetchone()[0]
+    cur.execute("INSERT OR REPLACE INTO _load_state (tbl, file_hash, row_count, loaded_at, version, since) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (table, digest, n, datetime.now(timezone.utc).isoformat(), version, since))
+    conn.commit(); cur.close()
+    if rebuild:
+        agg.rebuild(conn)
+    return counts
+
+def connect(bulk=False):
+    """Connection to DB_PATH, and the statements that undo BULK_PRAGMAS when bulk=True."""
+    conn = sqlite3.connect(DB_PATH)
+    restore = []
+    if bulk:
+        restore = [f"PRAGMA {p}={conn.execute(f'PRAGMA {p}').fetchone()[0]}" for p in RESTORE_PRAGMAS]
+        conn.execute(f"PRAGMA page_size={BULK_PAGE_SIZE}")
+        for p in BULK_PRAGMAS:
+            conn.execute(p)
+    return conn, restore
+
+def sales_aggregates(conn):
+    """The sales_aggregates module when its tables exist in this database, else None."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "transform"))
+    import sales_aggregates as agg
+    return agg if agg.installed(conn) else None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load data/*.csv into the local SQLite database.")
+    ap.add_argument("--bulk", action="store_true",
+                    help="load-optimized pragmas, drop/recreate tables, build indexes after the data is in")
+    ap.add_argument("--incremental", action="store_true",
+                    help="skip unchanged CSVs and upsert/delete only the rows that changed")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = ap.parse_args(argv)
+    if args.bulk and args.incremental:
+        ap.error("--bulk and --incremental are mutually exclusive")
 
-def main():
     os.makedirs(DATA_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    for t,meta in TABLES.items():
-        cur.execute(meta["schema"]); conn.commit()
-        load_csv(cur, t, os.path.join(DATA_DIR, meta["csv"]), meta["cols"]); conn.commit()
-        print(f"Loaded {t}.")
-    cur.close(); conn.close()
+    conn, restore = connect(args.bulk); cur = conn.cursor()
+    try:
+        mode = "incremental" if args.incremental else "bulk" if args.bulk else "plain"
+        # full loads: no per-row aggregate triggers, one rebuild at the end (incremental keeps
+        # them, except around its full-reload fallback)
+        agg = sales_aggregates(conn)
+        if agg and not args.incremental:
+            agg.drop_triggers(conn); conn.commit()
+        for t,meta in TABLES.items():
+            csv_path = os.path.join(DATA_DIR, meta["csv"])
+            with ins.span("load", table=t, mode=mode) as s:
+                s.add(bytes_read=os.path.getsize(csv_path) if os.path.exists(csv_path) else 0)
+                if args.incremental:
+                    t0 = time.perf_counter()
+                    counts = incremental_load(conn, t, meta, args.batch_size, agg)
+                    if counts is None:
+                        s.bytes_read = 0
+                        print(f"Skipped {t}: {meta['csv']} unchanged.")
+                    else:
+                        s.add(rows=counts["inserted"] + counts["updated"] + counts["unchanged"])
+                        print(f"Loaded {t} incrementally in {time.perf_counter() - t0:.1f}s: "
+                              + ", ".join(f"{k} {v:,}" for k, v in counts.items()))
+                    continue
+                reset_state(cur, t)  # a full load invalidates the incremental digests
+                if args.bulk:
+                    n, dt, idx_dt = bulk_load(conn, t, meta, args.batch_size)
+                    s.add(rows=n)
+                    ins.count("index_seconds", idx_dt, table=t)
+                    print(f"Loaded {t}: {n:,} rows in {dt:.1f}s ({n / max(dt, 1e-9):,.0f} rows/s), indexes {idx_dt:.1f}s.")
+                    continue
+                cur.execute(meta["schema"]); conn.commit()
+                for name in index_names(meta):
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+                n, dt = load_csv(cur, t, csv_path, meta["cols"], args.batch_size); conn.commit()
+                s.add(rows=n)
+                t0 = time.perf_counter()
+                for ddl in meta.get("indexes", []):
+                    cur.execute(ddl)
+                conn.commit()
+                ins.count("index_seconds", time.perf_counter() - t0, table=t)
+                print(f"Loaded {t}: {n:,} rows ({n / max(dt, 1e-9):,.0f} rows/s).")
+        if agg and not args.incremental:
+            with ins.span("rebuild_aggregates") as s:
+                rows, orders = agg.rebuild(conn)
+                s.add(rows=orders)
+            print(f"Rebuilt sales aggregates: {rows:,} daily rows for {orders:,} orders.")
+    finally:
+        for p in restore:
+            conn.execute(p)
+        cur.close(); conn.close()
     print(f"SQLite ready at {DB_PATH}.")
 if __name__ == "__main__":
     main()
@@ -0,0 +1,189 @@
+import os, sys, json, time, atexit, resource, threading
+from contextlib import contextmanager
+
+# Shared, lightweight run metrics for the pipeline scripts.
+#
+#   import instrumentation as ins
+#   with ins.span("load", table="orders") as s:
+#       ...; s.add(rows=len(batch), bytes_read=n)
+#   ins.count("rejects", 3, table="orders")
+#
+# Each finished span is one JSON line in METRICS_DIR/<script>-<run id>.jsonl (name, labels,
+# seconds, rows, bytes, peak RSS so far). When the process exits, the totals per span and
+# labels go to <script>-<run id>.om in the OpenMetrics text format. Spans wrap whole stages
+# or tables, never single rows, so the cost is a few syscalls per stage.
+#
+# Recording is opt-in: METRICS=on turns it on (src/pipeline.py and benchmarks/run.py do so
+# for the scripts they start), so a plain script run leaves no metrics/ directory behind.
+#
+# Pool workers forked from an instrumented process inherit the Run but record nothing: the
+# parent's span around the pool already covers their work.
+#
+# WINENOT_PROFILE=cprofile and/or tracemalloc (comma-separated) also profiles the run:
+# cProfile stats go to <run>.prof, and the top functions and allocation sites go to the JSON lines.
+
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+ENABLED = os.getenv("METRICS", "off").lower() in ("1", "on", "true", "yes")
+PROFILE = {p.strip() for p in os.getenv("WINENOT_PROFILE", "").lower().split(",") if p.strip()}
+PREFIX = "winenot"
+TOP_N = 15
+
+def peak_rss_bytes():
+    """Peak RSS of this process and of its (waited-for) children, e.g. pool workers."""
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return max(own, kids)
+
+class Span:
+    __slots__ = ("name", "labels", "rows", "bytes_read", "bytes_written", "start", "seconds")
+
+    def __init__(self, name, labels):
+        self.name, self.labels = name, labels
+        self.rows = self.bytes_read = self.bytes_written = 0
+        self.start, self.seconds = time.perf_counter(), 0.0
+
+    def add(self, rows=0, bytes_read=0, bytes_written=0):
+        self.rows += rows; self.bytes_read += bytes_read; self.bytes_written += bytes_written
+
+class Run:
+    def __init__(self, script, metrics_dir=METRICS_DIR, enabled=ENABLED, profile=PROFILE):
+        self.script, self.enabled, self.profile, self.pid = script, enabled, profile, os.getpid()
+        self.run_id = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.base = os.path.join(metrics_dir, f"{script}-{self.run_id}")
+        self.totals = {}  # (metric, labels) -> value
+        self.lock = threading.Lock()  # spans may end on worker threads
+        self.t0 = time.perf_counter()
+        self.out, self.profiler, self.closed = None, None, False
+        if not enabled:
+            return
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.out = open(self.base + ".jsonl", "a", encoding="utf-8", buffering=1)
+        if "tracemalloc" in profile:
+            import tracemalloc
+            tracemalloc.start()
+        if "cprofile" in profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.event("run_start", argv=sys.argv, profile=sorted(profile))
+        atexit.register(self.close)
+
+    def _active(self):
+        return self.enabled and self.out is not None and os.getpid() == self.pid
+
+    def event(self, kind, **fields):
+        if not self._active():
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "run": self.run_id, "script": self.script,
+                           "event": kind, **fields}, default=str)
+        with self.lock:
+            self.out.write(line + "\n")
+
+    def _add(self, metric, labels, value):
+        key = (metric, labels)
+        with self.lock:
+            self.totals[key] = self.totals.get(key, 0) + value
+
+    @contextmanager
+    def span(self, name, **labels):
+        s = Span(name, labels)
+        try:
+            yield s
+        finally:
+            s.seconds = time.perf_counter() - s.start
+            if self._active():
+                key = tuple(sorted({"span": name, **{k: str(v) for k, v in labels.items()}}.items()))
+                self._add("span_seconds", key, s.seconds)
+                self._add("span_calls", key, 1)
+                for metric in ("rows", "bytes_read", "bytes_written"):
+                    if getattr(s, metric):
+                        self._add(metric, key, getattr(s, metric))
+                fields = dict(span=name, labels=labels, seconds=round(s.seconds, 6), rows=s.rows,
+                              bytes_read=s.bytes_read, bytes_written=s.bytes_written,
+                              peak_rss_bytes=peak_rss_bytes())
+                if s.rows and s.seconds > 0:
+                    fields["rows_per_s"] = round(s.rows / s.seconds, 1)
+                self.event("span", **fields)
+
+    def count(self, name, value=1, **labels):
+        if self._active():
+            self._add(name, tuple(sorted((k, str(v)) for k, v in labels.items())), value)
+
+    def _profile_events(self):
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            self.profiler.dump_stats(self.base + ".prof")
+            stats = pstats.Stats(self.profiler).sort_stats("cumulative")
+            top = [{"function": f"{f[0]}:{f[1]}({f[2]})", "calls": v[1], "tottime": round(v[2], 4),
+                    "cumtime": round(v[3], 4)} for f, v in list(stats.stats.items())]
+            top.sort(key=lambda r: -r["cumtime"])
+            self.event("cprofile", path=self.base + ".prof", top=top[:TOP_N])
+        if "tracemalloc" in self.profile:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot().statistics("lineno")[:TOP_N]
+                self.event("tracemalloc", current_bytes=current, peak_bytes=peak,
+                           top=[{"where": str(s.traceback), "bytes": s.size, "blocks": s.count} for s in snapshot])
+                tracemalloc.stop()
+
+    def close(self):
+        if self.closed or not self._active():
+            return
+        self.closed = True
+        self._profile_events()
+        wall, rss = time.perf_counter() - self.t0, peak_rss_bytes()
+        self.event("run_end", seconds=round(wall, 3), peak_rss_bytes=rss)
+        self.out.close(); self.out = None
+        with open(self.base + ".om", "w", encoding="utf-8") as f:
+            f.write(openmetrics(self.script, self.totals, wall, rss))
+
+def _labels(pairs):
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+HELP = {
+    "span_seconds": ("counter", "Seconds spent in the span."),
+    "span_calls": ("counter", "Times the span ran."),
+    "rows": ("counter", "Rows processed in the span."),
+    "bytes_read": ("counter", "Bytes read in the span."),
+    "bytes_written": ("counter", "Bytes written in the span."),
+}
+
+def openmetrics(script, totals, wall, rss):
+    """OpenMetrics text exposition of the run totals."""
+    lines, families = [], {}
+    for (metric, labels), value in totals.items():
+        families.setdefault(metric, []).append((labels, value))
+    for metric in sorted(families):
+        kind, text = HELP.get(metric, ("counter", f"{metric} count."))
+        name = f"{PREFIX}_{metric}"
+        lines += [f"# TYPE {name} {kind}", f"# HELP {name} {text}"]
+        for labels, value in sorted(families[metric]):
+            lines.append(f"{name}_total{_labels((('script', script),) + labels)} {value}")
+    lines += [f"# TYPE {PREFIX}_run_seconds gauge", f"# HELP {PREFIX}_run_seconds Wall time of the run.",
+              f"{PREFIX}_run_seconds{_labels([('script', script)])} {wall:.6f}",
+              f"# TYPE {PREFIX}_peak_rss_bytes gauge", f"# HELP {PREFIX}_peak_rss_bytes Peak resident memory.",
+              f"{PREFIX}_peak_rss_bytes{_labels([('script', script)])} {rss}",
+              "# EOF"]
+    return "\n".join(lines) + "\n"
+
+_run = None
+
+def run(script=None):
+    """The process-wide Run, started on first use (named after the main script)."""
+    global _run
+    if _run is None:
+        _run = Run(script or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0])
+    return _run
+
+def span(name, **labels):
+    return run().span(name, **labels)
+
+def count(name, value=1, **labels):
+    run().count(name, value, **labels)
+
+def event(kind, **fields):
+    run().event(kind, **fields)
@@ -0,0 +1,358 @@
+import os, sys, json, time, hashlib, argparse, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "ingest"))
+from sqlite_seed import DB_PATH, file_digest
+import instrumentation as ins
+
+# The README_RUN steps as a DAG:
+#
+#   generate ──> seed ──┐
+#   bootstrap ──────────┴─> load_staging ──> refresh_dev ──> build_prod
+#   customers ──> resolve
+#   events
+#
+# Ready stages run in parallel, each script in its own process with its output in
+# PIPELINE_DIR/logs/<stage>.log. A stage's key hashes its code files, its parameters
+# (CLI flags and the env vars the script reads), the content of its input files and the
+# last runs of the stages it depends on. When the key matches the one in
+# PIPELINE_DIR/manifest.json and the stage's output files are as it left them, the stage is
+# skipped, so a change reruns exactly the stages downstream of it.
+#
+# Warehouse steps (bootstrap, load_staging, refresh_dev, build_prod) come from a sink:
+# SQLiteSink runs them against local SQLite files, so the DAG runs end to end offline, and
+# SnowflakeSink runs the same steps in WINENOT.
+#
+# Generated files go to PIPELINE_DATA (.pipeline/data), not to the samples checked in under
+# data/, and the seed stage reads them from there.
+
+PIPELINE_DIR = os.getenv("PIPELINE_DIR", ".pipeline")
+PIPELINE_DATA = os.getenv("PIPELINE_DATA", os.path.join(PIPELINE_DIR, "data"))
+STAGING_DB = os.getenv("STAGING_DB", "staging_local.db")
+PY = sys.executable
+ROOT = os.path.dirname(HERE)
+
+def src(*parts):
+    return os.path.join(HERE, *parts)
+
+GEN = src("generate", "wine_data_generator.py")
+CUSTOMERS = src("generate", "customer_generator.py")
+EVENTS = src("generate", "order_event_generator.py")
+POOLS = src("generate", "value_pools.py")
+COLUMNAR = src("generate", "columnar.py")
+PROFILE = src("generate", "load_profile.py")
+PROFILES = src("generate", "load_profiles.json")
+SEED = src("ingest", "sqlite_seed.py")
+EXTRACT = src("ingest", "extract_and_load_to_snowflake.py")
+CDC = src("transform", "cdc_promote.py")
+PRD = src("transform", "prd_wines.py")
+RESOLVE = src("transform", "resolve_customers.py")
+INS = src("instrumentation.py")
+DDL = os.path.join(ROOT, "snowflake", "ddl_bootstrap.sql")
+PRD_SQL = src("transform", "extract_to_PRD_from_DEV.sql")
+
+def env_params(*names):
+    return {n: os.getenv(n) for n in names}
+
+class Stage:
+    def __init__(self, name, run, deps=(), code=(), params=None, inputs=(), outputs=(), exists=(), env=None):
+        self.name, self.run, self.deps = name, run, list(deps)  # run: argv, callable(log) or None
+        self.code, self.params = list(code), params or {}
+        self.inputs, self.outputs, self.exists = list(inputs), list(outputs), list(exists)
+        self.env = env or {}
+
+# ---- warehouse sinks ----
+
+class SQLiteSink:
+    """Warehouse steps on local SQLite files: STAGING in `target`, DEV/PROD as table layers in DB_PATH."""
+    def __init__(self, target=STAGING_DB):
+        self.kind, self.target = "sqlite", target
+
+    def bootstrap(self):
+        return None, []  # SQLite tables are created by their first write
+
+    def load_staging(self):
+        return [PY, EXTRACT, "--sink", "sqlite", "--target", self.target, "--replace"], [EXTRACT, SEED, INS]
+
+    def refresh_dev(self):
+        return [PY, CDC, "--db", DB_PATH, "--staging", self.target], [CDC]
+
+    def build_prod(self):
+        return [PY, PRD, "--db", DB_PATH, "--src", "dev_products"], [PRD]
+
+class SnowflakeSink:
+    """Warehouse steps in Snowflake, over the connection settings of the extract (SF_* env vars)."""
+    kind, target = "snowflake", None
+
+    def _execute(self, sql, log):
+        from extract_and_load_to_snowflake import sf_conn
+        conn = sf_conn()
+        try:
+            for cur in conn.execute_string(sql):
+                log.write(f"{cur.sfqid}: {cur.rowcount} rows\n")
+        finally:
+            conn.close()
+
+    def _script(self, path):
+        def run(log):
+            with open(path, encoding="utf-8") as f:
+                self._execute(f.read(), log)
+        return run
+
+    def bootstrap(self):
+        return self._script(DDL), [DDL]
+
+    def load_staging(self):
+        return [PY, EXTRACT, "--sink", "snowflake", "--replace"], [EXTRACT, SEED, INS]
+
+    def refresh_dev(self):
+        return lambda log: self._execute("CALL WINENOT.DEV.SP_REFRESH();", log), [DDL]
+
+    def build_prod(self):
+        return self._script(PRD_SQL), [PRD_SQL]
+
+def make_sink(kind, target=None):
+    if kind == "snowflake":
+        return SnowflakeSink()
+    if kind == "sqlite":
+        return SQLiteSink(target or STAGING_DB)
+    raise ValueError(f"unknown sink {kind!r}")
+
+def data(name):
+    return os.path.join(PIPELINE_DATA, name)
+
+def build_stages(args, sink):
+    gen_files = [data("products.csv"), data("consumers.csv"), data("orders.csv")]
+    # a custom profile file is an input; a named one lives in load_profiles.json (code)
+    profile_files = [os.environ["LOAD_PROFILE"]] if os.path.isfile(os.getenv("LOAD_PROFILE") or "") else []
+    stages = [
+        Stage("generate", [PY, GEN, "--stream", "--seed", str(args.seed)]
+              + (["--workers", str(args.gen_workers)] if args.gen_workers else []),
+              code=[GEN, POOLS, COLUMNAR, PROFILE, PROFILES, INS], env={"OUT_DIR": PIPELINE_DATA}, inputs=profile_files,
+              params=dict(seed=args.seed, **env_params("N_PRODUCTS", "N_CONSUMERS", "N_ORDERS", "GEN_NOW", "POOL_SIZE",
+                                                       "LOAD_PROFILE")),
+              outputs=gen_files),  # --workers is left out of the key: the files do not depend on it
+        Stage("customers", [PY, CUSTOMERS, "--n", str(args.customers), "--dup_ratio", str(args.dup_ratio),
+                            "--seed", str(args.seed), "--out", data("customers.csv")],
+              code=[CUSTOMERS, POOLS, COLUMNAR, INS],
+              params=dict(n=args.customers, dup_ratio=args.dup_ratio, seed=args.seed, **env_params("POOL_SIZE")),
+              outputs=[data("customers.csv")]),
+        Stage("events", [PY, EVENTS, "--count", str(args.events), "--dup_ratio", str(args.dup_ratio),
+                         "--seed", str(args.seed), "--out", data("orders_events.jsonl")],
+              code=[EVENTS, POOLS, PROFILE, PROFILES, INS], inputs=profile_files,
+              params=dict(count=args.events, dup_ratio=args.dup_ratio, seed=args.seed, **env_params("LOAD_PROFILE")),
+              outputs=[data("orders_events.jsonl"), data("orders_events.csv")]),
+        Stage("resolve", [PY, RESOLVE, "--in", data("customers.csv"), "--out", data("customers_canonical.csv")],
+              deps=["customers"], code=[RESOLVE], inputs=[data("customers.csv")],
+              params=env_params("ER_WINDOW", "ER_THRESHOLD"), outputs=[data("customers_canonical.csv")]),
+        Stage("seed", [PY, SEED, "--bulk"], deps=["generate"], code=[SEED, INS], env={"DATA_DIR": PIPELINE_DATA},
+              inputs=gen_files, exists=[DB_PATH], params=dict(db=DB_PATH)),
+    ]
+    # the local databases are written again by later stages, so they are checked for presence
+    # (like the seed's DB_PATH) rather than fingerprinted: deleting one reruns its stages
+    local = sink.kind == "sqlite"
+    for name, deps, dbs in [("bootstrap", [], []), ("load_staging", ["seed", "bootstrap"], [sink.target]),
+                            ("refresh_dev", ["load_staging"], [sink.target, DB_PATH]),
+                            ("build_prod", ["refresh_dev"], [DB_PATH])]:
+        run, code = getattr(sink, name)()
+        stages.append(Stage(name, run, deps=deps, code=code, exists=dbs if local else [],
+                            params=dict(sink=sink.kind, target=sink.target, db=DB_PATH)))
+    return {s.name: s for s in stages}
+
+# ---- manifest ----
+
+class Manifest:
+    def __init__(self, path):
+        self.path, self.lock = path, threading.Lock()
+        self.data = {"version": 1, "files": {}, "stages": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def digest(self, path):
+        """Content digest of a file, recomputed only when its size or mtime changed."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            hit = self.data["files"].get(key)
+        if hit and hit[:2] == [st.st_size, st.st_mtime_ns]:
+            return hit[2]
+        d = file_digest(path)
+        with self.lock:
+            self.data["files"][key] = [st.st_size, st.st_mtime_ns, d]
+        return d
+
+    def stage(self, name):
+        return self.data["stages"].get(name)
+
+    def record(self, name, entry):
+        with self.lock:
+            self.data["stages"][name] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp, self.path)  # atomic: a crash keeps the previous manifest
+
+def fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def stage_key(stage, manifest, dep_runs):
+    """Hash of what determines the stage's result. Deps enter by run, so a rerun upstream reruns this."""
+    missing = [p for p in stage.inputs if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"{stage.name}: missing input {missing[0]}")
+    doc = dict(code={os.path.relpath(p, ROOT): manifest.digest(p) for p in stage.code}, params=stage.params,
+               inputs={p: manifest.digest(p) for p in stage.inputs}, deps={d: dep_runs[d] for d in stage.deps})
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def run_id(entry):
+    return f"{entry['key']}@{entry['finished_at']}" if entry else None
+
+def up_to_date(stage, key, manifest):
+    prev = manifest.stage(stage.name)
+    if not prev or prev.get("key") != key:
+        return False
+    if any(not os.path.exists(p) for p in stage.exists):
+        return False
+    outs = prev.get("outputs", {})
+    return all(os.path.exists(p) and fingerprint(p) == outs.get(p) for p in stage.outputs)
+
+# ---- scheduling ----
+
+def ancestors(stages, names):
+    seen, todo = set(), list(names)
+    while todo:
+        n = todo.pop()
+        if n not in seen:
+            seen.add(n); todo += stages[n].deps
+    return seen
+
+def descendants(stages, name):
+    seen, changed = {name}, True
+    while changed:
+        changed = False
+        for s in stages.values():
+            if s.name not in seen and any(d in seen for d in s.deps):
+                seen.add(s.name); changed = True
+    return seen
+
+def run_stage(stage, log_path):
+    env = dict(os.environ, **stage.env)
+    env.setdefault("METRICS", "on")  # stage metrics next to the logs unless the caller says otherwise
+    env.setdefault("METRICS_DIR", os.path.join(PIPELINE_DIR, "metrics"))
+    with open(log_path, "w", encoding="utf-8") as log:
+        if isinstance(stage.run, list):
+            subprocess.run(stage.run, stdout=log, stderr=subprocess.STDOUT, env=env, check=True)
+        elif stage.run is not None:
+            stage.run(log)
+
+def tail(path, n=15):
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-n:])
+    except OSError:
+        return ""
+
+def execute(stages, selected, force, manifest, jobs, dry_run=False):
+    """Run the selected stages in dependency order; returns the failed names and the counts."""
+    runs = {n: run_id(manifest.stage(n)) for n in stages if n not in selected}
+    status, failed, pending, running = {}, [], [n for n in stages if n in selected], {}
+    logs = os.path.join(PIPELINE_DIR, "logs")
+    os.makedirs(logs, exist_ok=True)
+
+    def start(name):
+        stage = stages[name]
+        missing = [d for d in stage.deps if runs.get(d) is None]
+        if missing:
+            raise RuntimeError(f"{missing[0]} has never run here; run without --from first")
+        key = stage_key(stage, manifest, runs)
+        if name not in force and up_to_date(stage, key, manifest):
+            return "cached", key, 0.0
+        if dry_run:
+            return "would run", key, 0.0
+        t0 = time.perf_counter()
+        with ins.span("stage", stage=name):
+            run_stage(stage, os.path.join(logs, f"{name}.log"))
+        dt = time.perf_counter() - t0
+        manifest.record(name, dict(key=key, finished_at=time.strftime("%Y-%m-%dT%H:%M:%S") + f".{time.time_ns() % 10**9:09d}",
+                                   seconds=round(dt, 3), outputs={p: fingerprint(p) for p in stage.outputs}))
+        return "ran", key, dt
+
+    with ThreadPoolExecutor(max_workers=jobs) as ex:
+        while pending or running:
+            if not failed:
+                for name in list(pending):
+                    deps = [d for d in stages[name].deps if d in selected]
+                    if all(d in status for d in deps):
+                        pending.remove(name)
+                        if dry_run and any(status[d] == "would run" for d in deps):
+                            status[name] = "would run"  # its key depends on a run that did not happen
+                            print(f"{name}: would run (after {', '.join(deps)}).")
+                            continue
+                        running[ex.submit(start, name)] = name
+            if not running:
+                if pending and not failed:
+                    continue
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    status[name], key, dt = fut.result()
+                except Exception as e:
+                    failed.append(name)
+                    detail = tail(os.path.join(logs, f"{name}.log")) if isinstance(e, subprocess.CalledProcessError) else ""
+                    print(f"{name}: FAILED ({e}).\n{detail}".rstrip("\n"), flush=True)
+                    continue
+                runs[name] = run_id(manifest.stage(name))
+                if status[name] == "ran":
+                    print(f"{name}: done in {dt:.1f}s [{key}].", flush=True)
+                else:
+                    if status[name] == "cached":
+                        ins.count("stages_cached", stage=name)
+                    print(f"{name}: {status[name]} [{key}].", flush=True)
+    if pending:
+        print(f"Not run after the failure: {', '.join(pending)}.")
+    values = list(status.values())
+    return failed, dict(ran=values.count("ran") + values.count("would run"), cached=values.count("cached"))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run the Wine-NOT pipeline as a DAG, skipping stages whose inputs did not change.")
+    ap.add_argument("targets", nargs="*", help="stages to bring up to date, with what they depend on (default: all)")
+    ap.add_argument("--from", dest="from_stage", help="rerun this stage and everything downstream of it")
+    ap.add_argument("--force", action="store_true", help="ignore the manifest and rerun every selected stage")
+    ap.add_argument("--dry-run", action="store_true", help="print what would run")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="stages run at the same time")
+    ap.add_argument("--sink", choices=["sqlite", "snowflake"], default="sqlite", help="where the warehouse steps run")
+    ap.add_argument("--target", help=f"STAGING database file for --sink sqlite (default {STAGING_DB})")
+    ap.add_argument("--seed", type=int, default=int(os.getenv("SEED", 7)))
+    ap.add_argument("--customers", type=int, default=150)
+    ap.add_argument("--events", type=int, default=60)
+    ap.add_argument("--dup-ratio", type=float, default=0.05)
+    ap.add_argument("--gen-workers", type=int, default=0, help="--workers for wine_data_generator")
+    args = ap.parse_args(argv)
+
+    stages = build_stages(args, make_sink(args.sink, args.target))
+    for n in args.targets + ([args.from_stage] if args.from_stage else []):
+        if n not in stages:
+            ap.error(f"unknown stage {n!r} (stages: {', '.join(stages)})")
+    selected = ancestors(stages, args.targets) if args.targets else set(stages)
+    force = set(stages) if args.force else set()
+    if args.from_stage:
+        below = descendants(stages, args.from_stage)
+        selected &= below
+        force |= below
+
+    manifest = Manifest(os.path.join(PIPELINE_DIR, "manifest.json"))
+    t0 = time.perf_counter()
+    failed, counts = execute(stages, selected, force, manifest, max(1, args.jobs), args.dry_run)
+    print(f"Pipeline: {counts['ran']} {'to run' if args.dry_run else 'run'}, {counts['cached']} cached, "
+          f"{len(failed)} failed in {time.perf_counter() - t0:.1f}s.")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import os, sys, time, sqlite3, argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingest"))
+from sqlite_seed import TABLES, DB_PATH
+
+# Change-data-capture promotion STAGING -> DEV -> PROD, replacing the full-table MERGEs.
+#
+# STAGING -> DEV: every DEV row carries _row_hash, a hash of its columns, behind a covering
+# (id, _row_hash) index. Staging is read in id chunks and hashed; each chunk is compared with
+# the DEV hashes of the same id range and only inserted, updated or deleted rows are
+# written. Their keys go to _cdc_changes under a new version.
+# DEV -> PROD: no scan at all; the keys logged since PROD's last consumed version are
+# applied, so that hop costs the size of the delta.
+# Logged keys are pruned once every consumer has applied them and they are older than the
+# last CDC_KEEP_VERSIONS versions, so the log stays the size of the recent deltas. A
+# consumer whose unapplied versions were pruned catches up with a hash diff instead.
+#
+# When the incremental extract has logged the ids it wrote or deleted in RAW_CHANGES, and
+# the table's marker row (ID NULL) says DEV matched RAW before them, STAGING -> DEV diffs
+# only those keys; otherwise it diffs both tables and sets the marker. The logged keys are
+# consumed either way.
+#
+# Locally the layers are table prefixes in one SQLite file: products (as loaded by
+# sqlite_seed) -> dev_products -> prod_products. With --staging, DEV reads the *_RAW tables
+# (and RAW_CHANGES) the extract wrote to that file instead, attached as STAGING, so
+# STAGING.PRODUCTS_RAW. snowflake_sql() generates the same promotion for
+# WINENOT.STAGING/DEV/PROD; snowflake/ddl_bootstrap.sql holds its output.
+
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 200_000))
+KEEP_VERSIONS = max(int(os.getenv("CDC_KEEP_VERSIONS", 10)), 1)
+LAYERS = ["dev", "prod"]
+SNOWFLAKE = {"products": ("STAGING.PRODUCTS_RAW", "DEV.PRODUCTS", "PROD.WINES"),
+             "consumers": ("STAGING.CONSUMERS_RAW", "DEV.CONSUMERS", None),
+             "orders": ("STAGING.ORDERS_RAW", "DEV.ORDERS", None)}
+
+CDC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS _cdc_changes (
+  tbl TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  id INTEGER NOT NULL,
+  op TEXT NOT NULL,        -- I, U or D
+  PRIMARY KEY (tbl, version, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS _cdc_versions (
+  tbl TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  promoted_at TEXT NOT NULL,
+  inserted INTEGER, updated INTEGER, deleted INTEGER,
+  PRIMARY KEY (tbl, version)
+);
+CREATE TABLE IF NOT EXISTS _cdc_offsets (
+  consumer TEXT NOT NULL,  -- table that applies the changes
+  tbl TEXT NOT NULL,       -- table whose changes it applies
+  version INTEGER NOT NULL,
+  PRIMARY KEY (consumer, tbl)
+);"""
+
+def layer_table(table, layer):
+    return f"{layer}_{table}"
+
+def row_hashes(df, cols):
+    """Signed 64-bit hash of each row over cols, independent of how pandas typed the chunk."""
+    norm = {}
+    for c in cols:
+        s = df[c]
+        # a numeric column reads as int64 or float64 depending on NULLs in the chunk
+        norm[c] = s.astype(np.float64) if pd.api.types.is_numeric_dtype(s) else s.astype(object)
+    return pd.util.hash_pandas_object(pd.DataFrame(norm), index=False).to_numpy().view(np.int64)
+
+def ensure_target(conn, source, target):
+    """Create target like source plus _row_hash; returns the data columns."""
+    schema, _, name = source.rpartition(".")
+    info = f"PRAGMA {schema}.table_info({name})" if schema else f"PRAGMA table_info({name})"
+    cols = [(r[1], r[2]) for r in conn.execute(info) if r[1] != "_row_hash"]
+    if not cols:
+        raise SystemExit(f"No table {source}; load it first (sqlite_seed.py, or the extract with --sink sqlite).")
+    decl = ",\n      ".join(f"{n} {t}{' PRIMARY KEY' if n == 'id' else ''}" for n, t in cols)
+    conn.executescript(CDC_SCHEMA + f"""
+    CREATE TABLE IF NOT EXISTS {target} (
+      {decl},
+      _row_hash INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_{target}_hash ON {target}(id, _row_hash);""")
+    return [n for n, _ in cols]
+
+def _start_version(conn, target):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM _cdc_versions WHERE tbl = ?",
+                        (target,)).fetchone()[0]
+
+def _finish_version(conn, target, version, counts):
+    conn.execute("INSERT INTO _cdc_versions VALUES (?, ?, datetime('now'), ?, ?, ?)",
+                 (target, version, counts["inserted"], counts["updated"], counts["deleted"]))
+
+def _log(conn, target, version, ids, op):
+    conn.executemany("INSERT INTO _cdc_changes VALUES (?, ?, ?, ?)",
+                     ((target, version, int(i), op) for i in ids))
+
+def _hashes(conn, target, where, params):
+    return np.array(conn.execute(f"SELECT id, _row_hash FROM {target} INDEXED BY idx_{target}_hash "
+                                 f"WHERE {where} ORDER BY id", params).fetchall(), dtype=np.int64).reshape(-1, 2)
+
+def _range_chunks(conn, source, target, cols, chunk_rows):
+    """Both whole tables in id chunks: (source rows, target (id, hash) pairs) of one id range."""
+    last = -(1 << 63)
+    while True:
+        src = pd.read_sql_query(f"SELECT {','.join(cols)} FROM {source} WHERE id > ? ORDER BY id LIMIT ?",
+                                conn, params=(last, chunk_rows))
+        done = len(src) < chunk_rows
+        hi = (1 << 63) - 1 if done else int(src["id"].iloc[-1])  # the last chunk also owns every id above
+        yield src, _hashes(conn, target, "id > ? AND id <= ?", (last, hi))
+        if done:
+            return
+        last = hi
+
+def _keyed_chunks(conn, source, target, cols, log, table, chunk_rows):
+    """Like _range_chunks, restricted to the ids logged for table in log."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _cdc_logged (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM _cdc_logged")
+    conn.execute(f"INSERT OR IGNORE INTO _cdc_logged SELECT ID FROM {log} WHERE TBL = ? AND ID IS NOT NULL", (table,))
+    keys = "id IN (SELECT id FROM _cdc_logged WHERE id BETWEEN ? AND ?)"
+    last = -(1 << 63)
+    while ids := conn.execute("SELECT id FROM _cdc_logged WHERE id > ? ORDER BY id LIMIT ?",
+                              (last, chunk_rows)).fetchall():
+        lo, hi = ids[0][0], ids[-1][0]
+        src = pd.read_sql_query(f"SELECT {','.join(cols)} FROM {source} WHERE {keys} ORDER BY id", conn, params=(lo, hi))
+        yield src, _hashes(conn, target, keys, (lo, hi))
+        last = hi
+
+def key_log(conn, source):
+    """(RAW_CHANGES next to source or None, whether it holds source's marker row)."""
+    schema, _, name = source.rpartition(".")
+    log = f"{schema}.RAW_CHANGES" if schema else "RAW_CHANGES"
+    master = f"{schema}.sqlite_master" if schema else "sqlite_master"
+    if schema:  # a staging file: keep a log even before the extract has logged anything
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {log} (TBL TEXT, ID INTEGER)")
+    if not conn.execute(f"SELECT 1 FROM {master} WHERE type = 'table' AND name = 'RAW_CHANGES'").fetchone():
+        return None, False
+    marked = conn.execute(f"SELECT 1 FROM {log} WHERE TBL = ? AND ID IS NULL", (name,)).fetchone()
+    return log, marked is not None
+
+def promote(conn, source, target, chunk_rows=CHUNK_ROWS):
+    """Bring target in line with source by hash diff, writing only changed rows.
+
+    Diffs only the keys logged in RAW_CHANGES when the marker allows it, both whole
+    tables otherwise. Returns ({inserted, updated, deleted, unchanged}, version).
+    """
+    cols = ensure_target(conn, source, target)
+    log, keyed = key_log(conn, source)
+    schema, _, name = source.rpartition(".")
+    if schema:
+        # the extract's stand-in tables have no key: index id once, for the keyset reads and key lookups
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{name}_id ON {name}(id)")
+    counts = dict(inserted=0, updated=0, deleted=0, unchanged=0)
+    upsert = (f"INSERT OR REPLACE INTO {target} ({','.join(cols)}, _row_hash) "
+              f"VALUES ({','.join('?' * (len(cols) + 1))})")
+    with conn:
+        version = _start_version(conn, target)
+        chunks = (_keyed_chunks(conn, source, target, cols, log, name, chunk_rows) if keyed
+                  else _range_chunks(conn, source, target, cols, chunk_rows))
+        for src, old in chunks:
+            ids, h = src["id"].to_numpy(dtype=np.int64), row_hashes(src, cols)
+            # both sides are sorted by id: match them with a binary search
+            pos = np.minimum(np.searchsorted(old[:, 0], ids), max(len(old) - 1, 0))
+            present = (old[pos, 0] == ids) if len(old) else np.zeros(len(ids), dtype=bool)
+            changed = present & (old[pos, 1] != h) if len(old) else present
+            is_new = ~present
+            gone = old[~np.isin(old[:, 0], ids), 0]
+            m = is_new | changed
+            if m.any():
+                rows = src[m].astype(object).where(src[m].notna(), None)
+                conn.executemany(upsert, (r + (int(x),) for r, x in
+                                          zip(rows.itertuples(index=False, name=None), h[m])))
+                _log(conn, target, version, ids[is_new], "I")
+                _log(conn, target, version, ids[changed], "U")
+            if len(gone):
+                conn.executemany(f"DELETE FROM {target} WHERE id = ?", ((int(i),) for i in gone))
+                _log(conn, target, version, gone, "D")
+            counts["inserted"] += int(is_new.sum()); counts["updated"] += int(changed.sum())
+            counts["deleted"] += len(gone); counts["unchanged"] += int((present & ~changed).sum())
+        if log:
+            # target now matches source: the logged keys are consumed and later ones can be trusted
+            conn.execute(f"DELETE FROM {log} WHERE TBL = ?", (name,))
+            conn.execute(f"INSERT INTO {log} (TBL, ID) VALUES (?, NULL)", (name,))
+        _finish_version(conn, target, version, counts)
+    return counts, version
+
+def prune(conn, tbl, keep=KEEP_VERSIONS):
+    """Drop tbl's logged versions that every consumer has applied, except the last `keep`."""
+    upto = conn.execute("SELECT MAX(version) - ? FROM _cdc_versions WHERE tbl = ?", (max(keep, 1), tbl)).fetchone()[0]
+    consumed = conn.execute("SELECT MIN(version) FROM _cdc_offsets WHERE tbl = ?", (tbl,)).fetchone()[0]
+    if upto is None:
+        return 0
+    if consumed is not None:
+        upto = min(upto, consumed)
+    # _cdc_versions goes too: its oldest row tells a late consumer what is still logged
+    conn.execute("DELETE FROM _cdc_versions WHERE tbl = ? AND version <= ?", (tbl, upto))
+    return conn.execute("DELETE FROM _cdc_changes WHERE tbl = ? AND version <= ?", (tbl, upto)).rowcount
+
+def apply_changes(conn, source, target, chunk_rows=CHUNK_ROWS, keep=KEEP_VERSIONS):
+    """Apply to target the keys source logged since target last did; cost follows the delta.
+
+    Falls back to promote() when some of those versions were already pruned. Afterwards
+    both logs are pruned. Returns ({inserted, updated, deleted, unchanged}, version) like promote().
+    """
+    cols = ensure_target(conn, source, target)
+    row = conn.execute("SELECT version FROM _cdc_offsets WHERE consumer = ? AND tbl = ?",
+                       (target, source)).fetchone()
+    since = row[0] if row else 0
+    first, upto = conn.execute("SELECT MIN(version), COALESCE(MAX(version), 0) FROM _cdc_versions WHERE tbl = ?",
+                               (source,)).fetchone()
+    if first is not None and first > since + 1:
+        counts, version = promote(conn, source, target, chunk_rows)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO _cdc_offsets VALUES (?, ?, ?)", (target, source, upto))
+            prune(conn, source, keep); prune(conn, target, keep)
+        return counts, version
+    with conn:
+        version = _start_version(conn, target)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _cdc_keys (id INTEGER PRIMARY KEY, op TEXT)")
+        conn.execute("DELETE FROM _cdc_keys")
+        # the current source row decides the outcome, whatever happened in between
+        conn.execute(f"""
+            INSERT INTO _cdc_keys
+            SELECT k.id,
+                   CASE WHEN s.id IS NULL AND t.id IS NULL THEN NULL
+                        WHEN s.id IS NULL THEN 'D'
+                        WHEN t.id IS NULL THEN 'I'
+                        WHEN s._row_hash IS NOT t._row_hash THEN 'U' END
+            FROM (SELECT DISTINCT id FROM _cdc_changes WHERE tbl = ? AND version > ? AND version <= ?) k
+            LEFT JOIN {source} s ON s.id = k.id
+            LEFT JOIN {target} t ON t.id = k.id""", (source, since, upto))
+        conn.execute("DELETE FROM _cdc_keys WHERE op IS NULL")
+        conn.execute(f"DELETE FROM {target} WHERE id IN (SELECT id FROM _cdc_keys WHERE op = 'D')")
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {target} ({','.join(cols)}, _row_hash)
+            SELECT {','.join('s.' + c for c in cols)}, s._row_hash
+            FROM _cdc_keys k JOIN {source} s ON s.id = k.id WHERE k.op IN ('I', 'U')""")
+        n = dict(conn.execute("SELECT op, COUNT(*) FROM _cdc_keys GROUP BY op"))
+        counts = dict(inserted=n.get("I", 0), updated=n.get("U", 0), deleted=n.get("D", 0), unchanged=0)
+        conn.execute("INSERT INTO _cdc_changes SELECT ?, ?, id, op FROM _cdc_keys", (target, version))
+        conn.execute("INSERT OR REPLACE INTO _cdc_offsets VALUES (?, ?, ?)", (target, source, upto))
+        _finish_version(conn, target, version, counts)
+        prune(conn, source, keep); prune(conn, target, keep)
+    return counts, version
+
+# ---- Snowflake ----
+
+def snowflake_sql(tables=tuple(SNOWFLAKE), keep=KEEP_VERSIONS):
+    """DEV.SP_REFRESH(): the same CDC promotion as Snowflake Scripting, for ddl_bootstrap.sql."""
+    # a sequence, not MAX(VERSION) + 1: pruning (or a run without changes) must never reuse a version
+    body = ["  LET v NUMBER := (SELECT DEV.CDC_VERSION_SEQ.NEXTVAL);"]
+    for table in tables:
+        raw, dev, prod = SNOWFLAKE[table]
+        cols = [c.upper() for c in TABLES[table]["cols"]]
+        data = [c for c in cols if c != "ID"]
+        tag = table.upper()
+        hash_expr = lambda a: f"HASH({', '.join(f'{a}.{c}' for c in data)})"
+        raw_name = raw.split(".")[-1]
+        logged = f"STAGING.RAW_CHANGES WHERE TBL = '{raw_name}'"
+        body.append(f"""
+  -- {raw} -> {dev}: changed keys by hash diff, then a MERGE over those keys only.
+  -- The diff reads just the keys the extract logged when the marker row (ID NULL) says
+  -- DEV matched RAW before they were written, and both whole tables otherwise.
+  LET keyed_{table} BOOLEAN := (SELECT COUNT(*) > 0 FROM {logged} AND ID IS NULL);
+  IF (keyed_{table}) THEN
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT '{tag}', :v, k.ID,
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT DISTINCT ID FROM {logged} AND ID IS NOT NULL) k
+      LEFT JOIN (SELECT r.ID, {hash_expr('r')} AS ROW_HASH FROM {raw} r) s ON s.ID = k.ID
+      LEFT JOIN {dev} t ON t.ID = k.ID
+      WHERE (s.ID IS NOT NULL OR t.ID IS NOT NULL)
+        AND (t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH);
+  ELSE
+    INSERT INTO DEV.CDC_CHANGES (TBL, VERSION, ID, OP)
+      SELECT '{tag}', :v, COALESCE(s.ID, t.ID),
+             CASE WHEN t.ID IS NULL THEN 'I' WHEN s.ID IS NULL THEN 'D' ELSE 'U' END
+      FROM (SELECT r.ID, {hash_expr('r')} AS ROW_HASH FROM {raw} r) s
+      FULL OUTER JOIN {dev} t ON t.ID = s.ID
+      WHERE t.ID IS NULL OR s.ID IS NULL OR t.ROW_HASH <> s.ROW_HASH;
+  END IF;
+  DELETE FROM {logged};
+  INSERT INTO STAGING.RAW_CHANGES (TBL, ID) VALUES ('{raw_name}', NULL);
+  MERGE INTO {dev} t
+  USING (SELECT c.ID AS CDC_ID, c.OP, r.*, {hash_expr('r')} AS NEW_HASH
+         FROM DEV.CDC_CHANGES c LEFT JOIN {raw} r ON r.ID = c.ID
+         WHERE c.TBL = '{tag}' AND c.VERSION = :v) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.OP = 'D' THEN DELETE
+  WHEN MATCHED THEN UPDATE SET {', '.join(f't.{c} = s.{c}' for c in data)}, t.ROW_HASH = s.NEW_HASH
+  WHEN NOT MATCHED AND s.OP = 'I' THEN INSERT ({', '.join(cols)}, ROW_HASH)
+    VALUES ({', '.join(f's.{c}' for c in cols)}, s.NEW_HASH);""")
+        if prod:
+            body.append(f"""
+  -- {dev} -> {prod}: only the keys logged since {prod} last consumed them
+  LET since_{table} NUMBER := (SELECT COALESCE(MAX(VERSION), 0) FROM DEV.CDC_OFFSETS
+                                WHERE CONSUMER = '{prod}' AND TBL = '{tag}');
+  MERGE INTO {prod} t
+  USING (SELECT k.ID AS CDC_ID, d.*
+         FROM (SELECT DISTINCT ID FROM DEV.CDC_CHANGES
+               WHERE TBL = '{tag}' AND VERSION > :since_{table} AND VERSION <= :v) k
+         LEFT JOIN {dev} d ON d.ID = k.ID) s
+  ON t.ID = s.CDC_ID
+  WHEN MATCHED AND s.ID IS NULL THEN DELETE
+  WHEN MATCHED AND t.ROW_HASH IS DISTINCT FROM s.ROW_HASH THEN
+    UPDATE SET {', '.join(f't.{c} = s.{c}' for c in data)}, t.ROW_HASH = s.ROW_HASH
+  WHEN NOT MATCHED AND s.ID IS NOT NULL THEN INSERT ({', '.join(cols)}, ROW_HASH)
+    VALUES ({', '.join(f's.{c}' for c in cols)}, s.ROW_HASH);
+  MERGE INTO DEV.CDC_OFFSETS o USING (SELECT '{prod}' AS CONSUMER, '{tag}' AS TBL) n
+    ON o.CONSUMER = n.CONSUMER AND o.TBL = n.TBL
+    WHEN MATCHED THEN UPDATE SET o.VERSION = :v
+    WHEN NOT MATCHED THEN INSERT (CONSUMER, TBL, VERSION) VALUES (n.CONSUMER, n.TBL, :v);""")
+        body.append(f"""
+  -- keys every consumer of {dev} has applied, older than the last {keep} versions
+  DELETE FROM DEV.CDC_CHANGES WHERE TBL = '{tag}' AND VERSION <= :v - {keep}
+    AND VERSION <= (SELECT COALESCE(MIN(VERSION), :v) FROM DEV.CDC_OFFSETS WHERE TBL = '{tag}');""")
+    body.append("""
+  LET summary STRING := (SELECT COALESCE(LISTAGG(TBL || ' ' || OP || '=' || N, ', ')
+                                  WITHIN GROUP (ORDER BY TBL, OP), 'no changes')
+                         FROM (SELECT TBL, OP, COUNT(*) AS N FROM DEV.CDC_CHANGES
+                               WHERE VERSION = :v GROUP BY TBL, OP));
+  RETURN summary;""")
+    return ("CREATE OR REPLACE PROCEDURE DEV.SP_REFRESH()\nRETURNS STRING LANGUAGE SQL AS\n$$\nBEGIN\n"
+            + "\n".join(body) + "\nEND;\n$$;")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Promote STAGING -> DEV -> PROD by hash diff, touching only changed rows.")
+    ap.add_argument("step", nargs="?", default="promote", choices=["promote", "sql"],
+                    help="promote the local SQLite layers, or print the Snowflake SP_REFRESH")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--staging", help="SQLite file with the *_RAW tables (extract --sink sqlite) to promote "
+                                      "from; default: the tables sqlite_seed loaded into --db")
+    ap.add_argument("--tables", nargs="+", default=list(TABLES), choices=list(TABLES))
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = ap.parse_args(argv)
+    if args.step == "sql":
+        print(snowflake_sql())
+        return
+    with sqlite3.connect(args.db) as conn:
+        if args.staging:
+            conn.execute("ATTACH DATABASE ? AS STAGING", (args.staging,))
+        for table in args.tables:
+            source = SNOWFLAKE[table][0] if args.staging else table
+            dev, prod = (layer_table(table, l) for l in LAYERS)
+            for name, step in [(dev, lambda: promote(conn, source, dev, args.chunk_rows)),
+                               (prod, lambda: apply_changes(conn, dev, prod, args.chunk_rows))]:
+                t0 = time.perf_counter()
+                c, v = step()
+                print(f"{name} v{v}: +{c['inserted']} ~{c['updated']} -{c['deleted']} "
+                      f"({c['unchanged']} unchanged, {time.perf_counter() - t0:.1f}s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os, re, csv, json, math, time, shutil, hashlib, argparse, tempfile
+from pathlib import Path
+import numpy as np
+
+# Exact, bounded-memory dedup for the JSONL/CSV feeds (orders_events, customers).
+#
+# One streaming pass: each record gets a 128-bit digest of (key, raw record). A Bloom filter
+# answers "definitely new" for most records, which are written straight through and whose
+# digest is spilled to a hash partition on disk. The few "maybe seen" records are spilled as
+# candidates and resolved at the end, one partition at a time, against the exact digests of
+# that partition, so only ~1/P of all digests is ever in memory.
+
+MEMORY_MB = int(os.getenv("DEDUP_MEMORY_MB", 256))
+BATCH_ROWS = 65536
+DIGEST = 16
+KEYS = ["order_id", "customer_id"]  # first one present in the input is used
+
+class BloomFilter:
+    def __init__(self, n, fp_rate=0.01, max_bytes=None):
+        m = int(-n * math.log(fp_rate) / math.log(2) ** 2) or 8
+        if max_bytes:
+            m = min(m, max_bytes * 8)
+        self.m = max(64, m)
+        self.k = max(1, round(self.m / max(n, 1) * math.log(2)))
+        self.bits = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, h1, h2):
+        # Kirsch-Mitzenmacher double hashing: position_i = h1 + i*h2 (mod m)
+        i = np.arange(self.k, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.m)
+
+    def contains(self, h1, h2):
+        pos = self._positions(h1, h2)
+        return ((self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def add(self, h1, h2):
+        pos = self._positions(h1, h2).ravel()
+        np.bitwise_or.at(self.bits, pos >> np.uint64(3), (1 << (pos & np.uint64(7))).astype(np.uint8))
+
+def plan(expected, memory_mb=MEMORY_MB):
+    """Split the memory cap: up to half for the Bloom filter, the rest bounds one partition's digest set."""
+    cap = memory_mb << 20
+    bloom_bytes = min(cap // 2, max(1024, int(-expected * math.log(0.01) / math.log(2) ** 2 / 8)))
+    per_digest = 90  # a 16-byte bytes object in a Python set
+    partitions = max(1, math.ceil(expected * per_digest / max(cap - bloom_bytes, 1 << 20)))
+    return bloom_bytes, partitions
+
+class KeyReader:
+    """Raw records (bytes lines) plus the dedup key of each, for .jsonl or .csv input."""
+    def __init__(self, path, key=None):
+        self.path, self.jsonl = Path(path), Path(path).suffix == ".jsonl"
+        self.f = open(self.path, "rb")
+        self.header = None if self.jsonl else self.f.readline()
+        if self.jsonl:
+            first = self.f.readline()
+            self.key = key or next((k for k in KEYS if k in json.loads(first)), None)
+            self.f.seek(0)
+            # the raw JSON token is as good a key as the decoded value, and much cheaper
+            self.pattern = re.compile(rb'"' + re.escape((self.key or "").encode()) + rb'"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)')
+        else:
+            cols = next(csv.reader([self.header.decode("utf-8")]))
+            self.key = key or next((k for k in KEYS if k in cols), None)
+            self.col = cols.index(self.key) if self.key else None
+        if self.key is None:
+            raise SystemExit(f"No key column ({' / '.join(KEYS)}) in {path}; pass --key.")
+
+    def key_of(self, line):
+        if self.jsonl:
+            m = self.pattern.search(line)
+            return m.group(1) if m else json.dumps(json.loads(line).get(self.key)).encode("utf-8")
+        if b'"' in line:
+            return next(csv.reader([line.decode("utf-8")]))[self.col].encode("utf-8")
+        return line.rstrip(b"\r\n").split(b",")[self.col]
+
+    def batches(self, size=BATCH_ROWS):
+        batch = []
+        for line in self.f:
+            if not line.strip():
+                continue
+            batch.append(line if line.endswith(b"\n") else line + b"\n")
+            if len(batch) >= size:
+                yield batch; batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.f.close()
+
+def dedup(src, out, key=None, expected=None, memory_mb=MEMORY_MB, spill_dir=None):
+    """Write the records of src without exact duplicates to out; returns counts."""
+    src, out = Path(src), Path(out)
+    expected = expected or max(1, src.stat().st_size // 100)  # ~100 bytes per record
+    bloom_bytes, P = plan(expected, memory_mb)
+    bloom = BloomFilter(expected, max_bytes=bloom_bytes)
+    reader = KeyReader(src, key)
+    tmp = Path(tempfile.mkdtemp(prefix="dedup-", dir=spill_dir))
+    seen = [open(tmp / f"seen-{p:04d}.bin", "wb") for p in range(P)]
+    cand = [open(tmp / f"cand-{p:04d}.bin", "wb") for p in range(P)]
+    counts = dict(rows=0, written=0, duplicates=0, candidates=0, partitions=P)
+    t0 = time.perf_counter()
+    b2 = hashlib.blake2b
+    try:
+        with open(out, "wb") as fo:
+            if reader.header is not None:
+                fo.write(reader.header)
+            for batch in reader.batches():
+                digests = b"".join(b2(reader.key_of(l) + b"\x00" + l, digest_size=DIGEST).digest() for l in batch)
+                d = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+                h1, h2 = d[:, 0], d[:, 1] | np.uint64(1)
+                # repeats inside the batch are duplicates of their first occurrence
+                _, first = np.unique(np.frombuffer(digests, dtype=f"V{DIGEST}"), return_index=True)
+                is_first = np.zeros(len(batch), dtype=bool); is_first[first] = True
+                counts["duplicates"] += int((~is_first).sum())
+                maybe = bloom.contains(h1, h2) & is_first
+                bloom.add(h1[is_first], h2[is_first])
+                part = (h1 % np.uint64(P)).astype(np.int64)
+                for i in np.flatnonzero(is_first):
+                    dg = digests[i*DIGEST:(i+1)*DIGEST]
+                    if maybe[i]:
+                        cand[part[i]].write(dg + len(batch[i]).to_bytes(4, "little") + batch[i])
+                        counts["candidates"] += 1
+                    else:
+                        seen[part[i]].write(dg)
+                        fo.write(batch[i]); counts["written"] += 1
+                counts["rows"] += len(batch)
+            for f in seen + cand:
+                f.close()
+            # exact resolution of Bloom candidates, one partition in memory at a time
+            for p in range(P):
+                if not os.path.getsize(tmp / f"cand-{p:04d}.bin"):
+                    continue
+                raw = (tmp / f"seen-{p:04d}.bin").read_bytes()
+                known = {raw[i:i+DIGEST] for i in range(0, len(raw), DIGEST)}
+                with open(tmp / f"cand-{p:04d}.bin", "rb") as f:
+                    while head := f.read(DIGEST + 4):
+                        dg, n = head[:DIGEST], int.from_bytes(head[DIGEST:], "little")
+                        line = f.read(n)
+                        if dg in known:
+                            counts["duplicates"] += 1
+                        else:
+                            known.add(dg); fo.write(line); counts["written"] += 1
+    finally:
+        reader.close()
+        for f in seen + cand:
+            f.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    counts["seconds"] = time.perf_counter() - t0
+    return counts
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Remove exact duplicate records from a JSONL or CSV feed in bounded memory.")
+    ap.add_argument("--in", dest="src", type=Path, default=Path("data/orders_events.jsonl"))
+    ap.add_argument("--out", type=Path, help="default: <in stem>.dedup<suffix>")
+    ap.add_argument("--key", help=f"key column (default: first of {KEYS} present)")
+    ap.add_argument("--expected", type=int, help="expected record count, sizes the Bloom filter and partitions")
+    ap.add_argument("--memory-mb", type=int, default=MEMORY_MB)
+    ap.add_argument("--spill-dir", help="where partition files go (default: system temp)")
+    args = ap.parse_args(argv)
+    out = args.out or args.src.with_name(f"{args.src.stem}.dedup{args.src.suffix}")
+    c = dedup(args.src, out, args.key, args.expected, args.memory_mb, args.spill_dir)
+    print(f"{c['rows']} rows → {c['written']} written to {out}, {c['duplicates']} duplicates removed "
+          f"({c['candidates']} Bloom candidates, {c['partitions']} partitions, "
+          f"{c['rows'] / max(c['seconds'], 1e-9):,.0f} rows/s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import os, time, argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Vectorized parser for the "dirty" feeds: order_date / registration_date in ISO, EU and US
+# layouts and total_price as "€78.24", "165.56 EUR", "12,5" or "78.24". Each value is
+# classified by fixed-position pattern checks on a code-point matrix, every format group is
+# parsed in bulk, and whatever matches no format (or is out of range) goes to quarantine.
+
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 1_000_000))
+
+# Same placeholder language as value_pools.format_datetimes: YYYY mm dd HH MM SS.
+DATE_FORMATS = {
+    "iso": "YYYY-mm-ddTHH:MM:SSZ",       # order_event_generator
+    "iso_space": "YYYY-mm-dd HH:MM:SS",  # customer_generator
+    "iso_t": "YYYY-mm-ddTHH:MM:SS",      # datetime.isoformat() without fraction
+    "eu": "dd/mm/YYYY HH:MM",
+    "us": "mm-dd-YYYY HH:MM:SS",
+}
+PRICE_FORMATS = ["euro_symbol", "euro_suffix", "comma", "plain"]
+DATE_COLS = ["order_date", "registration_date"]
+PRICE_COLS = ["total_price"]
+# one spare column so values longer than every template never look like a match
+WIDTH = max(len(t) for t in DATE_FORMATS.values()) + 1
+
+def _codepoints(values, width=WIDTH):
+    """(n, width) uint32 matrix of code points; shorter strings are zero-padded."""
+    arr = np.asarray(values, dtype=f"U{width}")
+    return arr.view(np.uint32).reshape(len(arr), width)
+
+def _fields(template):
+    pos = {}
+    for i, c in enumerate(template):
+        if c in "YmdHMS":
+            pos.setdefault(c, []).append(i)
+    return pos
+
+def _number(cp, idx):
+    out = np.zeros(len(cp), dtype=np.int64)
+    for i in idx:
+        out = out * 10 + (cp[:, i].astype(np.int64) - 48)
+    return out
+
+def classify_dates(values):
+    """Index into DATE_FORMATS for each value, -1 when no layout matches."""
+    cp = _codepoints(values)
+    lengths = (cp != 0).sum(axis=1)
+    digit = (cp >= 48) & (cp <= 57)
+    codes = np.full(len(values), -1, dtype=np.int8)
+    for k, template in enumerate(DATE_FORMATS.values()):
+        m = (lengths == len(template)) & (codes == -1)
+        for i, c in enumerate(template):
+            m &= digit[:, i] if c in "YmdHMS" else (cp[:, i] == ord(c))
+        codes[m] = k
+    return codes, cp
+
+def parse_dates(values):
+    """-> (datetime64[s] array with NaT where invalid, ok mask, format codes)."""
+    codes, cp = classify_dates(values)
+    out = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[s]")
+    for k, template in enumerate(DATE_FORMATS.values()):
+        m = codes == k
+        if not m.any():
+            continue
+        sub, pos = cp[m], _fields(template)
+        get = lambda f: _number(sub, pos[f]) if f in pos else np.zeros(len(sub), dtype=np.int64)
+        y, mo, d, h, mi, s = (get(f) for f in "YmdHMS")
+        valid = (mo >= 1) & (mo <= 12) & (d >= 1) & (h < 24) & (mi < 60) & (s < 60)
+        month = (np.clip(y, 1, 9999) - 1970) * 12 + np.clip(mo, 1, 12) - 1
+        day0 = month.astype("datetime64[M]").astype("datetime64[D]")
+        ts = day0 + (d - 1)
+        # a day past the end of the month rolls over into the next one
+        valid &= ts.astype("datetime64[M]") == day0.astype("datetime64[M]")
+        ts = ts.astype("datetime64[s]") + (h * 3600 + mi * 60 + s)
+        out[np.flatnonzero(m)[valid]] = ts[valid]
+        codes[np.flatnonzero(m)[~valid]] = -1
+    return out, codes >= 0, codes
+
+def parse_prices(values):
+    """-> (float64 euros with NaN where invalid, ok mask, format codes)."""
+    s = pd.Series(values, dtype="string").str.strip()
+    sym = s.str.startswith("€").fillna(False).to_numpy(bool)
+    suf = s.str.endswith(" EUR").fillna(False).to_numpy(bool)
+    com = s.str.contains(",", regex=False).fillna(False).to_numpy(bool)
+    codes = np.select([sym, suf, com], [0, 1, 2], default=3).astype(np.int8)
+    cleaned = s.str.removeprefix("€").str.removesuffix(" EUR").str.replace(",", ".", regex=False)
+    amount = pd.to_numeric(cleaned, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    ok = np.isfinite(amount) & (amount >= 0)
+    codes[~ok] = -1
+    return np.round(amount, 2), ok, codes
+
+def normalize_frame(df, date_cols=DATE_COLS, price_cols=PRICE_COLS):
+    """-> (typed rows that parsed, mask of quarantined rows, reason per quarantined row)."""
+    df = df.copy()
+    bad = np.zeros(len(df), dtype=bool)
+    reasons = np.full(len(df), "", dtype=object)
+    for c in [c for c in date_cols if c in df.columns]:
+        ts, ok, _ = parse_dates(df[c].fillna("").astype(str).to_numpy(dtype=object))
+        df[c] = ts
+        reasons[~ok] += f"bad {c};"
+        bad |= ~ok
+    for c in [c for c in price_cols if c in df.columns]:
+        amount, ok, _ = parse_prices(df[c].fillna("").astype(str).to_numpy(dtype=object))
+        df[c] = amount
+        reasons[~ok] += f"bad {c};"
+        bad |= ~ok
+    return df[~bad], bad, reasons[bad]
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    if Path(path).suffix == ".jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Normalize mixed date/price formats in events or customers files.")
+    ap.add_argument("--in", dest="src", type=Path, default=Path("data/orders_events.jsonl"))
+    ap.add_argument("--out", type=Path, help="clean CSV (default: <in>.normalized.csv)")
+    ap.add_argument("--quarantine", type=Path, help="unparseable rows (default: <in>.quarantine.csv)")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = ap.parse_args(argv)
+    out = args.out or args.src.with_suffix(".normalized.csv")
+    qpath = args.quarantine or args.src.with_suffix(".quarantine.csv")
+
+    n = n_bad = 0
+    t0 = time.perf_counter()
+    with out.open("w", newline="", encoding="utf-8") as fo, qpath.open("w", newline="", encoding="utf-8") as fq:
+        for i, raw in enumerate(read_chunks(args.src, args.chunk_rows)):
+            clean, bad, reasons = normalize_frame(raw)
+            quarantined = raw[bad].assign(reason=reasons)
+            clean.to_csv(fo, index=False, header=i == 0, float_format="%.2f", date_format="%Y-%m-%dT%H:%M:%S")
+            quarantined.to_csv(fq, index=False, header=i == 0)
+            n += len(raw); n_bad += len(quarantined)
+    dt = time.perf_counter() - t0
+    print(f"Normalized {n - n_bad} of {n} rows → {out} ({n / max(dt, 1e-9):,.0f} rows/s); "
+          f"{n_bad} quarantined → {qpath}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os, re, sys, time, sqlite3, argparse
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "ingest"))
+from sqlite_seed import TABLES, DB_PATH
+
+# Local, vectorized version of the PRD wine logic that otherwise only runs in Snowflake:
+# the CASE ladders of extract_to_PRD_from_DEV.sql and the derivations and filters of
+# extract_UAT_to_PRD.SQL. Categorical CASEs become lookups on the distinct values of a
+# chunk, threshold CASEs become sums of comparisons (bin index), and the products table is
+# read in id-keyset chunks, so memory does not grow with the table.
+
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", 100_000))
+UAT_SQL = os.path.join(HERE, "..", "..", "extract_UAT_to_PRD.SQL")
+DEV_SQL = os.path.join(HERE, "extract_to_PRD_from_DEV.sql")
+OUT_TABLE = "PRD_WINES"
+CURRENT_YEAR = 2025  # extract_UAT_to_PRD.SQL: (2025 - vintage) AS wine_age
+
+REGION_CLASS = {
+    "Rhone": "Premium French - Rhone Valley",
+    "Bordeaux": "Premium French - Bordeaux",
+    "Burgundy": "Premium French - Burgundy",
+    "Champagne": "Prestige French - Champagne",
+    **dict.fromkeys(["Loire", "Alsace", "Provence", "Jura", "Beaujolais", "Languedoc"], "Regional French"),
+    "Rioja": "Premium Spanish - Rioja",
+    "Ribera del Duero": "Premium Spanish - Ribera",
+    "Rias Baixas": "Regional Spanish - Atlantic",
+    **dict.fromkeys(["Tuscany", "Piedmont"], "Premium Italian - North"),
+    **dict.fromkeys(["Sicily", "Veneto"], "Regional Italian"),
+    "Kakheti": "Georgian Heritage",
+}
+REGION_OTHER = "Other"
+# bin index = number of thresholds passed; index 0 of PRICE_CATEGORIES is NULL price
+PRICE_CATEGORIES = np.array([None, "Budget", "Mid-Range", "Premium", "Luxury"], dtype=object)
+QUALITY_TIERS = np.array(["Average", "Good", "Very Good", "Excellent", "Exceptional"], dtype=object)
+QUALITY_BINS = [80, 85, 90, 95]
+RATING_CATEGORIES = np.array(["Average", "Good", "Very Good", "Excellent"], dtype=object)
+RATING_BINS = [85, 90, 95]
+
+DERIVED = ["region_classification", "price_category", "quality_tier",
+           "wine_age", "rating_category", "is_available", "price_per_liter"]
+COLS = TABLES["products"]["cols"] + DERIVED
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {OUT_TABLE} (
+  id INTEGER PRIMARY KEY,
+  reference TEXT,
+  color TEXT,
+  country TEXT,
+  region TEXT,
+  appellation TEXT,
+  vintage INTEGER,
+  grapes TEXT,
+  alcohol_percent REAL,
+  bottle_size_l REAL,
+  sweetness TEXT,
+  tannin TEXT,
+  acidity TEXT,
+  rating REAL,
+  price_eur REAL,
+  producer TEXT,
+  stock_quantity INTEGER,
+  region_classification TEXT,
+  price_category TEXT,
+  quality_tier TEXT,
+  wine_age INTEGER,
+  rating_category TEXT,
+  is_available INTEGER,
+  price_per_liter REAL
+);"""
+
+# The reference for --check is read from the Snowflake scripts themselves, so it cannot
+# drift from them: the derivations and filters of the MERGE source in extract_UAT_to_PRD.SQL
+# and the CASE ladders of extract_to_PRD_from_DEV.sql. Their expressions are also valid SQLite.
+DEV_COLUMNS = ["region_classification", "price_category", "quality_tier"]
+
+def _select_items(sql):
+    """{alias: expression} for a SELECT list, split on top-level commas."""
+    items, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(sql):
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted:
+            depth += (ch == "(") - (ch == ")")
+            if ch == "," and depth == 0:
+                items.append(sql[start:i]); start = i + 1
+    items.append(sql[start:])
+    out = {}
+    for item in map(str.strip, items):
+        m = re.fullmatch(r"(.*)\s+AS\s+(\w+)", item, re.S | re.I)
+        expr, alias = (m.group(1), m.group(2)) if m else (item, item)
+        out[alias.lower()] = expr.strip()
+    return out
+
+def _read_sql(path):
+    with open(path, encoding="utf-8") as f:
+        return re.sub(r"--[^\n]*", "", f.read())
+
+def reference_sql(src):
+    """The PRD rules as one SELECT over src, assembled from the two .sql files."""
+    uat = re.search(r"USING\s*\(\s*SELECT(.*?)FROM\s+UAT\.WINE_CATALOG\s+WHERE(.*?)\)\s*AS\s+source",
+                    _read_sql(UAT_SQL), re.S | re.I)
+    dev = re.search(r"SELECT(.*?)FROM\s+WINENOT\.DEV\.PRODUCTS", _read_sql(DEV_SQL), re.S | re.I)
+    exprs = _select_items(uat.group(1))
+    exprs.update({c: _select_items(dev.group(1))[c] for c in DEV_COLUMNS})
+    # the incremental MERGE also restricts to the changed ids; the rules are the other conditions
+    where = [c.strip() for c in re.split(r"\bAND\b(?![^(]*\))", uat.group(2)) if "PRD_CHANGED_IDS" not in c]
+    return (f"SELECT {', '.join(f'{exprs[c]} AS {c}' for c in COLS)}\nFROM {src}\n"
+            f"WHERE {' AND '.join(where)}\nORDER BY id")
+
+# Edge cases for --check: the BETWEEN overlap at 30 and 50, every rating threshold, NULLs,
+# future vintages, out-of-range ratings, quotes in grapes and a zero bottle size. (SQLite's
+# LOWER only folds ASCII while Snowflake's and str.lower fold all letters, so É stays out.)
+BOUNDARY_PRICES = [None, 0.0, 14.99, 15.0, 15.01, 29.99, 30.0, 30.01, 49.99, 50.0, 50.01, 1e6]
+BOUNDARY_RATINGS = [None, -1, 0, 79, 80, 84, 85, 89, 90, 94, 95, 100, 101]
+
+def boundary_rows():
+    rows, i = [], 0
+    for p in BOUNDARY_PRICES:
+        for r in BOUNDARY_RATINGS:
+            i += 1
+            rows.append((i, f"EDGE-{i}", ["Red", "ROSé", None][i % 3], "France",
+                         [None, "Rhone", "Jura", "Sicily", "Nowhere"][i % 5], "AOC",
+                         [None, 2024, 2025, 2026][i % 4], ['"Syrah", "Grenache"', "Merlot", None][i % 3],
+                         13.0, [0.75, 1.5, 0.0, None, 0.375][i % 5], "dry", "low", "high",
+                         r, p, "Edge", [None, 0, 3, -1][i % 4]))
+    return rows
+
+def _bins(x, thresholds):
+    """Number of thresholds x has reached (x >= t): the branch index of a descending >= CASE."""
+    out = np.zeros(len(x), dtype=np.int8)
+    for t in thresholds:
+        out += x >= t
+    return out
+
+def _round_half_away(x, digits=2):
+    scale = 10.0 ** digits
+    return np.sign(x) * np.floor(np.abs(x) * scale + 0.5) / scale
+
+def transform(df):
+    """PRD rows for a chunk of products (columns as in sqlite_seed.TABLES["products"])."""
+    vintage = pd.to_numeric(df["vintage"], errors="coerce").to_numpy(dtype=np.float64)
+    rating = pd.to_numeric(df["rating"], errors="coerce").to_numpy(dtype=np.float64)
+    # NULL compares false in SQL, and NaN compares false here: both drop the row
+    keep = (vintage <= CURRENT_YEAR) & (rating >= 0) & (rating <= 100)
+    df, vintage, rating = df[keep].reset_index(drop=True), vintage[keep], rating[keep]
+
+    price = pd.to_numeric(df["price_eur"], errors="coerce").to_numpy(dtype=np.float64)
+    size = pd.to_numeric(df["bottle_size_l"], errors="coerce").to_numpy(dtype=np.float64)
+    stock = pd.to_numeric(df["stock_quantity"], errors="coerce").to_numpy(dtype=np.float64)
+
+    out = df.copy()
+    out["color"] = df["color"].str.lower()
+    out["grapes"] = df["grapes"].str.replace('"', "", regex=False)
+    out["vintage"] = pd.array(vintage, dtype="Int64")
+    out["rating"], out["price_eur"], out["bottle_size_l"] = rating, price, size
+    out["alcohol_percent"] = pd.to_numeric(df["alcohol_percent"], errors="coerce")
+    out["stock_quantity"] = pd.array(np.nan_to_num(stock, nan=0.0), dtype="Int64")
+
+    # categorical CASE: look up each distinct region once, then take by code
+    codes, uniques = pd.factorize(df["region"])
+    classes = np.array([REGION_CLASS.get(u, REGION_OTHER) for u in uniques] + [REGION_OTHER], dtype=object)
+    out["region_classification"] = classes[codes]  # code -1 (NULL region) takes the trailing 'Other'
+
+    # < 15 Budget; BETWEEN 15 AND 30 Mid-Range; BETWEEN 30 AND 50 only sees 30 < p <= 50
+    # because 30 already matched; >= 50 only sees p > 50. So 30 and 50 fall in the lower band.
+    with np.errstate(invalid="ignore"):
+        band = 1 + (price >= 15) + (price > 30) + (price > 50)
+    out["price_category"] = PRICE_CATEGORIES[np.where(np.isnan(price), 0, band)]
+    out["quality_tier"] = QUALITY_TIERS[_bins(rating, QUALITY_BINS)]
+    out["rating_category"] = RATING_CATEGORIES[_bins(rating, RATING_BINS)]
+    out["wine_age"] = pd.array(CURRENT_YEAR - vintage, dtype="Int64")
+    # (stock_quantity > 0) is evaluated on the raw column, so NULL stock stays NULL here
+    out["is_available"] = pd.array(np.where(np.isnan(stock), np.nan, stock > 0), dtype="Int64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ppl = _round_half_away(price / size)
+    out["price_per_liter"] = np.where(np.isfinite(ppl), ppl, np.nan)  # x / NULLIF(0, 0) is NULL, not inf
+    return out[COLS]
+
+def read_chunks(conn, src="products", chunk_rows=CHUNK_ROWS):
+    cols, last = ",".join(TABLES["products"]["cols"]), -(1 << 63)
+    while True:
+        df = pd.read_sql_query(f"SELECT {cols} FROM {src} WHERE id > ? ORDER BY id LIMIT ?",
+                               conn, params=(last, chunk_rows))
+        if df.empty:
+            return
+        last = int(df["id"].iloc[-1])
+        yield df
+
+def _rows(df):
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def build(conn, src="products", chunk_rows=CHUNK_ROWS):
+    """Recreate PRD_WINES from src in one transaction; returns (rows read, rows written)."""
+    n_in = n_out = 0
+    insert = f"INSERT INTO {OUT_TABLE} ({','.join(COLS)}) VALUES ({','.join('?' * len(COLS))})"
+    with conn:
+        conn.execute(f"DROP TABLE IF EXISTS {OUT_TABLE}")
+        conn.execute(SCHEMA)
+        for df in read_chunks(conn, src, chunk_rows):
+            out = transform(df)
+            conn.executemany(insert, _rows(out))
+            n_in += len(df); n_out += len(out)
+    return n_in, n_out
+
+def _same(a, b):
+    """Column-wise equality with NULL == NULL, comparing numbers as floats."""
+    na, nb = a.isna().to_numpy(), b.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(b) or pd.api.types.is_numeric_dtype(a.infer_objects()):
+        fa = pd.to_numeric(a, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        fb = pd.to_numeric(b, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        eq = np.isclose(fa, fb, rtol=0, atol=1e-9)
+    else:
+        eq = (a.astype(object).to_numpy() == b.astype(object).to_numpy())
+    return (na & nb) | (~na & ~nb & eq)
+
+def compare(conn, src, chunk_rows=CHUNK_ROWS):
+    """Rows where transform() differs from reference_sql() on src: {column: mismatches}."""
+    ours = pd.concat([transform(df) for df in read_chunks(conn, src, chunk_rows)] or [pd.DataFrame(columns=COLS)],
+                     ignore_index=True)
+    ref = pd.read_sql_query(reference_sql(src), conn)
+    if len(ours) != len(ref) or not (ours["id"].to_numpy() == ref["id"].to_numpy()).all():
+        return {"id": abs(len(ours) - len(ref)) or 1}
+    return {c: int((~_same(ours[c], ref[c])).sum()) for c in COLS if (~_same(ours[c], ref[c])).any()}
+
+def check(conn, chunk_rows=CHUNK_ROWS):
+    """Parity of transform() with the SQL semantics on boundary cases and on the products table."""
+    edge = sqlite3.connect(":memory:")
+    edge.execute(TABLES["products"]["schema"])
+    edge.executemany(f"INSERT INTO products VALUES ({','.join('?' * len(TABLES['products']['cols']))})",
+                     boundary_rows())
+    ok = True
+    for name, c in [("boundary cases", edge), ("products", conn)]:
+        diff = compare(c, "products", chunk_rows)
+        print(f"{name}: " + ("match" if not diff else f"MISMATCH {diff}"))
+        ok &= not diff
+    return ok
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compute PRD wine columns locally from a SQLite products table.")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--src", default="products",
+                    help="table to read: products as seeded, or dev_products after cdc_promote.py")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--check", action="store_true",
+                    help="compare with the same rules run as SQL (boundary cases + products) instead of building")
+    args = ap.parse_args(argv)
+    with sqlite3.connect(args.db) as conn:
+        if args.check:
+            if not check(conn, args.chunk_rows):
+                raise SystemExit(1)
+            return
+        t0 = time.perf_counter()
+        n_in, n_out = build(conn, args.src, args.chunk_rows)
+        dt = time.perf_counter() - t0
+    print(f"{OUT_TABLE}: {n_out} of {n_in} products kept ({n_in / max(dt, 1e-9):,.0f} rows/s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os, time, argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Fuzzy customer identity resolution for the customer feeds (customer_generator's
+# customers.csv, the consumers table, the CUSTOMERS rows of data_generator_in_snowflake
+# with their ~10% NULL emails) -> a customer_id,canonical_id map.
+#
+# Candidate pairs come from blocking keys, never from all pairs:
+#   email   normalized email local part (sanitize_email_name rules, '+tag' and dots dropped)
+#   name    Soundex of the last name + first initial, within a country
+#   place   country + city
+# Rows are sorted by (block, neighbour key) and every row is paired with the next WINDOW
+# rows of its block: all pairs for small blocks, a sorted neighbourhood for big ones, so
+# the work is O(n * WINDOW) per key whatever the block sizes. Blocks are hashed into
+# shards that a process pool scores independently.
+#
+# A pair's score is the weighted mean of its field similarities over the fields both rows
+# have (MinHash estimate of the 3-gram Jaccard for email and name, equality for the rest),
+# so a NULL email neither helps nor hurts. Emails whose digits differ score 0. Pairs scoring >= THRESHOLD are merged with
+# union-find; the canonical id of a cluster is its smallest customer id.
+
+WINDOW = int(os.getenv("ER_WINDOW", 8))
+THRESHOLD = float(os.getenv("ER_THRESHOLD", 0.8))
+SHARDS = int(os.getenv("ER_SHARDS", 16))
+SIG_HASHES = 8
+WIDTH = 40  # characters used for MinHash; longer values are cut
+SIG_CHUNK = 200_000
+WEIGHTS = {"email": 0.45, "name": 0.30, "city": 0.15, "country": 0.05, "address": 0.05}
+
+# first column present wins: customer_generator, consumers table, Snowflake CUSTOMERS
+COLUMNS = {
+    "id": ["customer_id", "id"],
+    "name": ["customer_name", "name"],
+    "email": ["customer_email", "email"],
+    "country": ["country"],
+    "city": ["city"],
+    "address": ["address"],
+}
+
+SOUNDEX = {c: d for d, letters in enumerate(["aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]) for c in letters}
+
+def soundex(word):
+    word = "".join(c for c in word.lower() if c.isalpha())
+    if not word:
+        return ""
+    out, last = [word[0]], SOUNDEX.get(word[0])
+    for c in word[1:]:
+        d = SOUNDEX.get(c)
+        if d and d != last:
+            out.append(str(d))
+        if c not in "hw":
+            last = d
+    return ("".join(out) + "000")[:4].upper()
+
+# ---- normalization ----
+
+# Arrow-backed strings: the regexes below run in C over the whole column, not per row.
+STRING = "string[pyarrow]"
+
+def _text(s):
+    return s.astype(STRING).str.strip().str.lower().replace("", pd.NA)
+
+def email_local(email):
+    """sanitize_email_name applied to the local part, plus '+tag' and dots removed."""
+    return _text(email).str.replace(r"[@+].*$|[^0-9a-z]", "", regex=True).replace("", pd.NA)
+
+def clean_name(name):
+    return _text(name).str.replace(r"[^a-z ]", "", regex=True).str.replace(r"\s+", " ", regex=True).str.strip().replace("", pd.NA)
+
+def phonetic(name):
+    """Soundex of the last word + first letter of the first word of cleaned names."""
+    parts = name.str.split(" ")
+    return (parts.str[-1].fillna("").map(soundex) + parts.str[0].str[:1].fillna("")).where(name.notna())
+
+def codes(values):
+    """Dense codes (-1 for missing) whose order follows the sorted values, and the uniques."""
+    c, uniq = pd.factorize(values, sort=True, use_na_sentinel=True)
+    return c.astype(np.int64), np.asarray(uniq, dtype=object)
+
+# ---- MinHash ----
+
+_rng = np.random.default_rng(20250601)
+HASH_A = _rng.integers(1, 1 << 61, SIG_HASHES, dtype=np.uint64) | np.uint64(1)
+HASH_B = _rng.integers(0, 1 << 61, SIG_HASHES, dtype=np.uint64)
+
+def minhash(values, width=WIDTH):
+    """(n, SIG_HASHES) uint32 signatures of the character 3-grams of each value (padded with spaces)."""
+    sig = np.empty((len(values), SIG_HASHES), dtype=np.uint32)
+    for lo in range(0, len(values), SIG_CHUNK):
+        chunk = np.asarray([f" {v} " for v in values[lo:lo + SIG_CHUNK]], dtype=f"U{width}")
+        cp = chunk.view(np.uint32).reshape(len(chunk), width).astype(np.uint64)
+        grams = (cp[:, :-2] << np.uint64(42)) ^ (cp[:, 1:-1] << np.uint64(21)) ^ cp[:, 2:]
+        valid = cp[:, 2:] != 0
+        for j in range(SIG_HASHES):
+            h = (grams * HASH_A[j] + HASH_B[j]) >> np.uint64(32)  # multiply-shift, wraps mod 2**64
+            h[~valid] = np.uint64(0xFFFFFFFF)
+            sig[lo:lo + len(chunk), j] = h.min(axis=1)
+    return sig
+
+# ---- loading ----
+
+def pick(df, field):
+    return next((c for c in COLUMNS[field] if c in df.columns), None)
+
+def load(path):
+    """One row per customer id (first occurrence), with the raw columns the keys need."""
+    header = pd.read_csv(path, nrows=0).columns
+    use = [c for cands in COLUMNS.values() for c in cands if c in header]
+    df = pd.read_csv(path, usecols=use, dtype=STRING, keep_default_na=True)
+    id_col = pick(df, "id")
+    if id_col is None or pick(df, "name") is None:
+        raise SystemExit(f"{path}: needs an id and a name column ({COLUMNS['id']}, {COLUMNS['name']})")
+    df = df.rename(columns={pick(df, f): f for f in COLUMNS if pick(df, f)})
+    df["id"] = pd.to_numeric(df["id"], errors="raise").astype(np.int64)
+    return df.drop_duplicates("id", ignore_index=True)
+
+class Features:
+    """Integer codes and signatures for every row; everything the scorer touches is a numpy array."""
+    def __init__(self, df):
+        self.n = len(df)
+        self.ids = df["id"].to_numpy()
+        raw, raw_names = pd.factorize(df["name"])  # names repeat: clean each distinct one once
+        name = clean_name(pd.Series(raw_names, dtype=STRING))
+        self.name, names = codes(name)
+        self.name = np.where(raw >= 0, self.name[np.maximum(raw, 0)], -1)
+        self.phonetic = codes(phonetic(name))[0]
+        self.phonetic = np.where(raw >= 0, self.phonetic[np.maximum(raw, 0)], -1)
+        local = email_local(df["email"]) if "email" in df else pd.Series(pd.NA, index=df.index, dtype=STRING)
+        self.email, locals_ = codes(local)
+        # trailing numbers tell namesakes apart (jane.doe12 / jane.doe871) while sharing most 3-grams
+        self.email_digits = codes(local.str.replace(r"[^0-9]", "", regex=True))[0]
+        self.name_sig, self.email_sig = minhash(names), minhash(locals_)
+        self.eq = {f: codes(_text(df[f]))[0] for f in ("city", "country", "address") if f in df}
+
+    def blocks(self):
+        """(key name, block code per row or -1, neighbour order) for each blocking key."""
+        country = self.eq.get("country", np.full(self.n, -1))
+        city = self.eq.get("city", np.full(self.n, -1))
+        both = lambda a, b: np.where((a >= 0) & (b >= 0), a * (b.max() + 1) + b, -1)
+        yield "email", self.email, self.name
+        yield "name", both(self.phonetic, np.maximum(country, 0)), np.where(self.email >= 0, self.email, self.name)
+        yield "place", both(country, city) if "country" in self.eq else city, self.name
+
+    def shard(self, rows):
+        return dict(ids=self.ids[rows], name_sig=self.name_sig[np.maximum(self.name[rows], 0)],
+                    email_sig=self.email_sig[np.maximum(self.email[rows], 0)] if len(self.email_sig) else None,
+                    name=self.name[rows], email=self.email[rows], email_digits=self.email_digits[rows],
+                    eq={f: c[rows] for f, c in self.eq.items()})
+
+# ---- candidate pairs and scoring (runs in the pool) ----
+
+def candidate_pairs(block, order, window=WINDOW):
+    """Positions (i, j) of rows in the same block at most `window` apart in (block, order) order."""
+    idx = np.lexsort((order, block))
+    b = block[idx]
+    left, right = [], []
+    for k in range(1, window + 1):
+        same = np.flatnonzero(b[:-k] == b[k:])
+        left.append(idx[same]); right.append(idx[same + k])
+    return np.concatenate(left), np.concatenate(right)
+
+def score(f, a, b):
+    """Weighted mean similarity over the fields present on both rows of each pair."""
+    total = np.zeros(len(a)); weight = np.zeros(len(a))
+    sims = {"name": (f["name"], f["name_sig"]), "email": (f["email"], f["email_sig"])}
+    for field, (c, sig) in sims.items():
+        if sig is None:
+            continue
+        have = (c[a] >= 0) & (c[b] >= 0)
+        sim = np.where(c[a] == c[b], 1.0, (sig[a] == sig[b]).mean(axis=1))
+        if field == "email":
+            sim = np.where(f["email_digits"][a] == f["email_digits"][b], sim, 0.0)
+        total += np.where(have, WEIGHTS[field] * sim, 0.0); weight += np.where(have, WEIGHTS[field], 0.0)
+    for field, c in f["eq"].items():
+        have = (c[a] >= 0) & (c[b] >= 0)
+        total += np.where(have & (c[a] == c[b]), WEIGHTS[field], 0.0); weight += np.where(have, WEIGHTS[field], 0.0)
+    return np.divide(total, weight, out=np.zeros(len(a)), where=weight > 0)
+
+def match_shard(block, order, f, window=WINDOW, threshold=THRESHOLD):
+    """-> (customer ids of matched pairs, number of candidate pairs scored)."""
+    a, b = candidate_pairs(block, order, window)
+    keep = score(f, a, b) >= threshold
+    return f["ids"][a[keep]], f["ids"][b[keep]], len(a)
+
+# ---- merge ----
+
+class UnionFind:
+    """Array union-find, merged a batch of pairs at a time; roots are the smallest index of their set."""
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, x):
+        p, r = self.parent, self.parent[x]
+        while True:
+            up = p[r]
+            if np.array_equal(up, r):
+                return r
+            r = up
+
+    def union(self, a, b):
+        while len(a):
+            ra, rb = self.find(a), self.find(b)
+            keep = ra != rb
+            a, b, ra, rb = a[keep], b[keep], ra[keep], rb[keep]
+            # hook the larger root under the smaller one; when several pairs hook the same
+            # root only one write lands and the others go round again
+            self.parent[np.maximum(ra, rb)] = np.minimum(ra, rb)
+
+    def roots(self):
+        p = self.parent
+        while True:  # pointer jumping until every node points at its root
+            q = p[p]
+            if np.array_equal(q, p):
+                return p
+            p = q
+
+def resolve(df, window=WINDOW, threshold=THRESHOLD, shards=SHARDS, workers=None):
+    """customer_id -> canonical_id (smallest id of its cluster) as a DataFrame, and stats."""
+    t0 = time.perf_counter()
+    df = df.sort_values("id", ignore_index=True)
+    feats = Features(df)
+    stats = dict(rows=feats.n, candidates=0, matches=0)
+    uf = UnionFind(feats.n)
+
+    def shards_of():
+        for key, block, order in feats.blocks():
+            rows = np.flatnonzero(block >= 0)
+            shard_of = (block[rows] * 0x9E3779B1) % shards  # a block never spans two shards
+            for s in range(shards):
+                r = rows[shard_of == s]
+                if len(r) > 1:
+                    yield block[r], order[r], feats.shard(r)
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        todo, ahead = shards_of(), deque()
+        for args in todo:  # keep ~2 shards per worker in flight so memory stays bounded
+            ahead.append(ex.submit(match_shard, *args, window, threshold))
+            if len(ahead) >= 2 * workers:
+                break
+        while ahead:
+            a, b, n_cand = ahead.popleft().result()
+            for args in todo:
+                ahead.append(ex.submit(match_shard, *args, window, threshold))
+                break
+            stats["candidates"] += n_cand; stats["matches"] += len(a)
+            uf.union(np.searchsorted(feats.ids, a), np.searchsorted(feats.ids, b))
+    roots = uf.roots()
+    out = pd.DataFrame({"customer_id": feats.ids, "canonical_id": feats.ids[roots]})
+    stats["clusters"] = int((np.bincount(roots) > 1).sum())
+    stats["merged"] = int((out["customer_id"] != out["canonical_id"]).sum())
+    stats["seconds"] = time.perf_counter() - t0
+    return out, stats
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Map every customer id to a canonical id by blocked fuzzy matching.")
+    ap.add_argument("--in", dest="src", type=Path, default=Path("data/customers.csv"))
+    ap.add_argument("--out", type=Path, help="customer_id,canonical_id CSV (default: <in stem>_canonical.csv)")
+    ap.add_argument("--window", type=int, default=WINDOW, help="neighbours each row is compared with per blocking key")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD, help="minimum pair score to merge")
+    ap.add_argument("--shards", type=int, default=SHARDS)
+    ap.add_argument("--workers", type=int, help="scoring processes (default: CPU count)")
+    args = ap.parse_args(argv)
+    out = args.out or args.src.with_name(f"{args.src.stem}_canonical.csv")
+
+    mapping, s = resolve(load(args.src), args.window, args.threshold, args.shards, args.workers)
+    mapping.to_csv(out, index=False)
+    print(f"{s['rows']} customers → {s['rows'] - s['merged']} entities in {out}: {s['matches']} matches out of "
+          f"{s['candidates']} candidate pairs, {s['clusters']} clusters, {s['merged']} ids merged "
+          f"({s['rows'] / max(s['seconds'], 1e-9):,.0f} rows/s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import os, sys, time, sqlite3, argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingest"))
+from sqlite_seed import DB_PATH, BATCH_SIZE, iter_batches
+
+# Materialized sales aggregates over the SQLite orders:
+#
+#   agg_sales_daily    (day, region, channel, color)   -> orders, units, revenue_cents
+#   agg_sales_monthly  (month, region, channel, color) -> same; answers whole-month queries
+#   agg_product_sales  product_id                      -> same; top wines, stock cover
+#
+# New orders and their aggregates commit (or roll back) together. append_orders() inserts a
+# batch and adds its GROUP BY to the three tables in one transaction; triggers cover every
+# other write: single-row inserts, updates and deletes of orders, and changes to a product's
+# region, color or price (which move its orders between keys). The order triggers are paused
+# while append_orders() runs, so a batch is never counted twice.
+#
+# Revenue is sum(round(qty * price_eur * 100)) in integer cents, so incremental updates and
+# a rebuild agree exactly. Orders of an unknown product count under region/color '' at 0.
+# Full reloads (sqlite_seed plain/--bulk) drop the triggers and call rebuild() once the data
+# is in. Dashboards read only these tables, whose size depends on days x regions x channels
+# x colors, not on the number of orders.
+
+ROLLUPS = {"agg_sales_daily": ("day", 10), "agg_sales_monthly": ("month", 7)}  # table: (period, order_ts prefix)
+DAILY, MONTHLY = ROLLUPS
+PRODUCT = "agg_product_sales"
+STATE = "agg_state"
+TABLES = list(ROLLUPS) + [PRODUCT]
+SOURCES = ["orders", "products"]  # the tables the triggers watch
+DIMENSIONS = ["day", "region", "channel", "color"]
+MEASURES = ["orders", "units", "revenue_cents"]
+ORDER_COLS = ["consumer_id", "product_id", "qty", "channel", "order_ts"]
+
+def _rollup_schema(table, period):
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {table} (
+      {period} TEXT NOT NULL,
+      region TEXT NOT NULL,
+      channel TEXT NOT NULL,
+      color TEXT NOT NULL,
+      orders INTEGER NOT NULL,
+      units INTEGER NOT NULL,
+      revenue_cents INTEGER NOT NULL,
+      PRIMARY KEY ({period}, region, channel, color)
+    ) WITHOUT ROWID""",
+        # covering: region-first filters (one region over a date range) never touch the table
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_region ON {table}(region, {period}, channel, color, orders, units, revenue_cents)",
+        # only the rows that dropped to 0 orders: what the triggers prune after a delete or a move
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_empty ON {table}(orders) WHERE orders = 0",
+    ]
+
+SCHEMA = [ddl for table, (period, _) in ROLLUPS.items() for ddl in _rollup_schema(table, period)] + [
+    f"""CREATE TABLE IF NOT EXISTS {PRODUCT} (
+      product_id INTEGER PRIMARY KEY,
+      orders INTEGER NOT NULL,
+      units INTEGER NOT NULL,
+      revenue_cents INTEGER NOT NULL
+    )""",
+    # one row; paused = 1 while append_orders() maintains the aggregates itself
+    f"CREATE TABLE IF NOT EXISTS {STATE} (id INTEGER PRIMARY KEY CHECK (id = 1), paused INTEGER NOT NULL)",
+    f"INSERT OR IGNORE INTO {STATE} VALUES (1, 0)",
+]
+
+CENTS = "CAST(round({qty} * {price} * 100) AS INTEGER)"
+ADD = ", ".join(f"{m} = {m} + excluded.{m}" for m in MEASURES)
+
+def _grouped(source, sign=1, attrs=None, where="true", into=None):
+    """Upserts adding (sign=1) or removing (sign=-1) the orders of `source` (alias o).
+
+    Region, color and price come from products unless `attrs` pins them; pinned moves leave
+    the product table alone (its counts do not depend on them). `into` renames targets.
+    """
+    into = into or {}
+    if attrs:
+        region, color, price = attrs
+        frm = f"FROM {source} o WHERE {where}"
+    else:
+        region, color, price = "COALESCE(p.region, '')", "COALESCE(p.color, '')", "COALESCE(p.price_eur, 0)"
+        # "WHERE ..." keeps SQLite from reading the upsert's ON CONFLICT as the join's ON clause
+        frm = f"FROM {source} o LEFT JOIN products p ON p.id = o.product_id WHERE {where}"
+    measures = f"{sign} * COUNT(*), {sign} * SUM(o.qty), {sign} * SUM({CENTS.format(qty='o.qty', price=price)})"
+    out = [f"INSERT INTO {into.get(t, t)} ({period}, region, channel, color, {', '.join(MEASURES)}) "
+           f"SELECT substr(o.order_ts, 1, {n}), {region}, COALESCE(o.channel, ''), {color}, {measures} "
+           f"{frm} GROUP BY 1, 2, 3, 4 ON CONFLICT DO UPDATE SET {ADD}"
+           for t, (period, n) in ROLLUPS.items()]
+    if not attrs:
+        out.append(f"INSERT INTO {into.get(PRODUCT, PRODUCT)} (product_id, {', '.join(MEASURES)}) "
+                   f"SELECT o.product_id, {measures} {frm} GROUP BY 1 ON CONFLICT DO UPDATE SET {ADD}")
+    return out
+
+def _order_delta(row, sign):
+    """Add or remove one order row (NEW or OLD)."""
+    return _grouped(f"(SELECT {row}.product_id AS product_id, {row}.qty AS qty, "
+                    f"{row}.channel AS channel, {row}.order_ts AS order_ts)", sign)
+
+def _product_move(sign, attrs, pid):
+    """Add or remove all orders of one product under the given (region, color, price)."""
+    return _grouped("orders", sign, attrs, where=f"o.product_id = {pid}")
+
+def _product_revenue(pid, price):
+    return (f"UPDATE {PRODUCT} SET revenue_cents = (SELECT COALESCE(SUM({CENTS.format(qty='qty', price=price)}), 0) "
+            f"FROM orders WHERE product_id = {pid}) WHERE product_id = {pid}")
+
+def _prune(pid=None):
+    out = [f"DELETE FROM {t} WHERE orders = 0" for t in ROLLUPS]
+    if pid:
+        out.append(f"DELETE FROM {PRODUCT} WHERE product_id = {pid} AND orders = 0")
+    return out
+
+UNKNOWN = ("''", "''", "0")  # region, color, price of an order whose product is missing
+OLD = ("COALESCE(OLD.region, '')", "COALESCE(OLD.color, '')", "COALESCE(OLD.price_eur, 0)")
+NEW = ("COALESCE(NEW.region, '')", "COALESCE(NEW.color, '')", "COALESCE(NEW.price_eur, 0)")
+ACTIVE = f"NOT (SELECT paused FROM {STATE})"
+
+def _changed(cols):
+    return "(" + " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in cols) + ")"
+
+def _trigger(name, event, body, when=None):
+    """AFTER trigger, optionally guarded by a WHEN condition."""
+    return (f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}" + (f" WHEN {when}" if when else "")
+            + " BEGIN\n  " + ";\n  ".join(body) + ";\nEND")
+
+TRIGGERS = {
+    "trg_agg_orders_insert": ("INSERT ON orders", _order_delta("NEW", 1), ACTIVE),
+    "trg_agg_orders_delete": ("DELETE ON orders", _order_delta("OLD", -1) + _prune("OLD.product_id"), ACTIVE),
+    "trg_agg_orders_update": ("UPDATE OF product_id, qty, channel, order_ts ON orders",
+                              _order_delta("OLD", -1) + _prune("OLD.product_id") + _order_delta("NEW", 1),
+                              f"{ACTIVE} AND {_changed(['product_id', 'qty', 'channel', 'order_ts'])}"),
+    "trg_agg_products_insert": ("INSERT ON products",
+                                _product_move(-1, UNKNOWN, "NEW.id") + _product_move(1, NEW, "NEW.id")
+                                + [_product_revenue("NEW.id", NEW[2])] + _prune(), None),
+    "trg_agg_products_update": ("UPDATE OF id, region, color, price_eur ON products",
+                                _product_move(-1, OLD, "OLD.id") + _product_move(1, UNKNOWN, "OLD.id")
+                                + _product_move(-1, UNKNOWN, "NEW.id") + _product_move(1, NEW, "NEW.id")
+                                + [_product_revenue("OLD.id", "0"), _product_revenue("NEW.id", NEW[2])] + _prune(),
+                                _changed(["id", "region", "color", "price_eur"])),
+    "trg_agg_products_delete": ("DELETE ON products",
+                                _product_move(-1, OLD, "OLD.id") + _product_move(1, UNKNOWN, "OLD.id")
+                                + [_product_revenue("OLD.id", "0")] + _prune(), None),
+}
+
+def installed(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DAILY,)).fetchone() is not None
+
+def drop_triggers(conn):
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+def create_triggers(conn):
+    for name, (event, body, when) in TRIGGERS.items():
+        conn.execute(_trigger(name, event, body, when))
+
+def rebuild(conn):
+    """Recompute every table from orders and products and (re)install the triggers, in one transaction."""
+    with conn:
+        conn.execute("BEGIN")
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+        drop_triggers(conn)
+        for t in TABLES:
+            conn.execute(f"DELETE FROM {t}")
+        for sql in _grouped("orders"):
+            conn.execute(sql)
+        conn.execute(f"UPDATE {STATE} SET paused = 0")
+        create_triggers(conn)
+    for t in TABLES:
+        conn.execute(f"ANALYZE {t}")
+    conn.commit()
+    return conn.execute(f"SELECT COUNT(*), COALESCE(SUM(orders), 0) FROM {DAILY}").fetchone()
+
+def check(conn):
+    """Differences between the maintained tables and a fresh rebuild: {table: rows that differ}."""
+    out = {}
+    with conn:
+        fresh = {t: f"temp.fresh_{t}" for t in TABLES}
+        for t in TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {fresh[t]}")
+            conn.execute(f"CREATE TEMP TABLE fresh_{t} AS SELECT * FROM main.{t} WHERE 0")
+        for sql in _grouped("orders", into=fresh):
+            conn.execute(sql)
+        for t in TABLES:
+            ours, theirs = f"SELECT * FROM main.{t}", f"SELECT * FROM {fresh[t]}"
+            n = conn.execute(f"SELECT (SELECT COUNT(*) FROM ({ours} EXCEPT {theirs})) "
+                             f"+ (SELECT COUNT(*) FROM ({theirs} EXCEPT {ours}))").fetchone()[0]
+            conn.execute(f"DROP TABLE {fresh[t]}")
+            if n:
+                out[t] = n
+    return out
+
+def append_orders(conn, rows, cols=ORDER_COLS):
+    """Insert a batch of orders and add it to the aggregates in one transaction.
+
+    One GROUP BY per batch instead of trigger work per row; the order triggers are paused
+    meanwhile. Rows go through temp.agg_batch, so only this batch is aggregated.
+    """
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(f"UPDATE {STATE} SET paused = 1")
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS agg_batch AS SELECT * FROM main.orders WHERE 0")
+        conn.execute("DELETE FROM temp.agg_batch")
+        conn.executemany(f"INSERT INTO temp.agg_batch ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})", rows)
+        conn.execute(f"INSERT INTO main.orders ({','.join(cols)}) SELECT {','.join(cols)} FROM temp.agg_batch")
+        for sql in _grouped("temp.agg_batch"):
+            conn.execute(sql)
+        conn.execute(f"UPDATE {STATE} SET paused = 0")
+    return len(rows)
+
+# ---- query API (reads only the summary tables and products) ----
+
+def _whole_months(start, end):
+    """True when [start, end] (either end may be open) covers only whole calendar months."""
+    if start and not start.endswith("-01"):
+        return False
+    return not end or (date.fromisoformat(end) + timedelta(days=1)).day == 1
+
+def revenue(conn, by=("region",), start=None, end=None, **filters):
+    """Orders, units and revenue (EUR) grouped by any of DIMENSIONS or month.
+
+    start/end bound the day (inclusive, 'YYYY-MM-DD'); filters pin dimensions, e.g.
+    revenue(conn, by=["day"], channel="web", color="red"). Without day resolution and with
+    month-aligned bounds, the monthly table answers instead of the daily one.
+    """
+    by = list(by)
+    known = DIMENSIONS + ["month"]
+    bad = [c for c in by + list(filters) if c not in known]
+    if bad:
+        raise ValueError(f"unknown dimensions {bad}; use {known}")
+    monthly = "day" not in by and "day" not in filters and _whole_months(start, end)
+    table, period = (MONTHLY, "month") if monthly else (DAILY, "day")
+    expr = {c: "substr(day, 1, 7)" if c == "month" and not monthly else c for c in known}
+    where, params = [], []
+    if start:
+        where.append(f"{period} >= ?"); params.append(start[:7] if monthly else start)
+    if end:
+        where.append(f"{period} <= ?"); params.append(end[:7] if monthly else end)
+    for col, value in filters.items():
+        where.append(f"{expr[col]} = ?"); params.append(value)
+    keys = [expr[c] for c in by]
+    sql = (f"SELECT {', '.join(keys + ['SUM(orders)', 'SUM(units)', 'SUM(revenue_cents) / 100.0'])} FROM {table}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + (f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if by else ""))
+    cols = by + ["orders", "units", "revenue_eur"]
+    return [dict(zip(cols, r)) for r in conn.execute(sql, params)]
+
+def top_wines(conn, n=10, by="revenue"):
+    """Best-selling products by revenue or units, with their catalogue columns and stock."""
+    order = {"revenue": "a.revenue_cents", "units": "a.units", "orders": "a.orders"}[by]
+    sql = (f"SELECT a.product_id, p.reference, p.producer, p.color, p.region, a.orders, a.units, "
+           f"a.revenue_cents / 100.0, p.stock_quantity FROM {PRODUCT} a LEFT JOIN products p ON p.id = a.product_id "
+           f"ORDER BY {order} DESC, a.product_id LIMIT ?")
+    cols = ["product_id", "reference", "producer", "color", "region", "orders", "units", "revenue_eur", "stock_quantity"]
+    return [dict(zip(cols, r)) for r in conn.execute(sql, (n,))]
+
+def stock_cover(conn, n=20):
+    """Products with the fewest days of stock left at their average daily sales."""
+    first, last = conn.execute(f"SELECT MIN(day), MAX(day) FROM {DAILY}").fetchone()
+    if first is None:
+        return []
+    sql = (f"SELECT p.id, p.reference, p.stock_quantity, COALESCE(a.units, 0), "
+           f"julianday(?) - julianday(?) + 1 AS days FROM products p LEFT JOIN {PRODUCT} a ON a.product_id = p.id")
+    rows = []
+    for pid, ref, stock, units, days in conn.execute(sql, (last, first)):
+        per_day = units / days
+        rows.append(dict(product_id=pid, reference=ref, stock_quantity=stock, units_sold=units,
+                         units_per_day=round(per_day, 3),
+                         days_of_cover=round(stock / per_day, 1) if per_day and stock is not None else None))
+    rows.sort(key=lambda r: (r["days_of_cover"] is None, r["days_of_cover"] or 0, r["product_id"]))
+    return rows[:n]
+
+def _print(rows):
+    if not rows:
+        print("(no rows)"); return
+    cols = list(rows[0])
+    width = {c: max(len(c), *(len(f"{r[c]}") for r in rows)) for c in cols}
+    print("  ".join(c.ljust(width[c]) for c in cols))
+    for r in rows:
+        print("  ".join(f"{r[c]}".ljust(width[c]) for c in cols))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Incrementally maintained sales aggregates over the SQLite orders, and queries on them.")
+    ap.add_argument("step", choices=["install", "rebuild", "check", "append", "revenue", "top", "stock"],
+                    help="install/rebuild: (re)create tables and triggers from orders; check: compare with a rebuild; "
+                         "append: add the orders of --csv with their aggregates")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--csv", help="orders CSV to append (append); its id column, if any, is not used")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--by", default="region", help=f"comma-separated subset of {','.join(DIMENSIONS)},month (revenue)")
+    ap.add_argument("--from", dest="start", help="first day, YYYY-MM-DD (revenue)")
+    ap.add_argument("--to", dest="end", help="last day, YYYY-MM-DD (revenue)")
+    for d in DIMENSIONS[1:]:
+        ap.add_argument(f"--{d}", help=f"only this {d} (revenue)")
+    ap.add_argument("--n", type=int, default=10, help="rows to show (top, stock)")
+    ap.add_argument("--rank", choices=["revenue", "units", "orders"], default="revenue", help="top wines by (top)")
+    args = ap.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.step in ("install", "rebuild"):
+            t0 = time.perf_counter()
+            rows, orders = rebuild(conn)
+            print(f"{DAILY}: {rows:,} rows for {orders:,} orders, rebuilt in {time.perf_counter() - t0:.1f}s; triggers on.")
+            return
+        if not installed(conn):
+            raise SystemExit(f"No {DAILY} in {args.db}; run: sales_aggregates.py install")
+        if args.step == "check":
+            diff = check(conn)
+            print("aggregates: " + ("match a rebuild" if not diff else f"MISMATCH {diff}"))
+            if diff:
+                raise SystemExit(1)
+            return
+        t0 = time.perf_counter()
+        if args.step == "append":
+            if not args.csv:
+                ap.error("append needs --csv")
+            n = sum(append_orders(conn, batch) for batch in iter_batches(args.csv, ORDER_COLS, args.batch_size))
+            dt = time.perf_counter() - t0
+            print(f"Appended {n:,} orders with their aggregates in {dt:.1f}s ({n / max(dt, 1e-9):,.0f} rows/s).")
+            return
+        if args.step == "revenue":
+            filters = {d: getattr(args, d) for d in DIMENSIONS[1:] if getattr(args, d)}
+            rows = revenue(conn, [c for c in args.by.split(",") if c], args.start, args.end, **filters)
+        elif args.step == "top":
+            rows = top_wines(conn, args.n, args.rank)
+        else:
+            rows = stock_cover(conn, args.n)
+        dt = time.perf_counter() - t0
+        _print(rows)
+        print(f"({len(rows)} rows in {dt * 1000:.1f} ms)")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
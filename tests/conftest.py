@@ -0,0 +1,6 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # data_generator_in_snowflake.py
+for d in ("", "generate", "ingest", "transform"):
+    sys.path.insert(0, os.path.join(ROOT, "src", d))
@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+import data_generator_in_snowflake as gen
+
+TABLES = {"CUSTOMERS": "customer_id", "WINES": "id", "ORDERS": "order_id"}
+
+
+def run(tmp_path, name):
+    db, state = tmp_path / f"{name}.db", tmp_path / f"{name}.json"
+    gen.main(["--customers", "120", "--wines", "90", "--orders", "500", "--chunk-rows", "40",
+              "--sink", "sqlite", "--target", str(db), "--state", str(state)])
+    return db
+
+
+def rows(db):
+    with sqlite3.connect(db) as conn:
+        return {t: conn.execute(f"SELECT * FROM {t} ORDER BY {col}").fetchall() for t, col in TABLES.items()}
+
+
+def test_rerun_after_a_kill_resumes_without_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(gen, "GEN_NOW", "2025-10-01T00:00:00")
+    expected = rows(run(tmp_path, "clean"))
+
+    write, calls = gen.SQLiteSink.write, []
+    def killed_after_the_write(self, batch, table):
+        result = write(self, batch, table)
+        calls.append(table)
+        if table == "ORDERS" and calls.count(table) == 4:
+            raise KeyboardInterrupt  # the chunk landed, its checkpoint did not
+        return result
+    monkeypatch.setattr(gen.SQLiteSink, "write", killed_after_the_write)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, "resumed")
+    monkeypatch.setattr(gen.SQLiteSink, "write", write)
+
+    assert rows(run(tmp_path, "resumed")) == expected
@@ -0,0 +1,30 @@
+import sqlite3
+
+import prd_wines
+
+
+def products_db(rows):
+    conn = sqlite3.connect(":memory:")
+    conn.execute(prd_wines.TABLES["products"]["schema"])
+    conn.executemany(f"INSERT INTO products VALUES ({','.join('?' * len(prd_wines.TABLES['products']['cols']))})", rows)
+    return conn
+
+
+def test_reference_sql_comes_from_the_snowflake_scripts():
+    sql = prd_wines.reference_sql("products")
+    assert "NULLIF(bottle_size_l, 0)" in sql           # extract_UAT_to_PRD.SQL
+    assert "'Georgian Heritage'" in sql                 # extract_to_PRD_from_DEV.sql
+    assert "PRD_CHANGED_IDS" not in sql
+    assert "rating BETWEEN 0 AND 100" in sql
+
+
+def test_transform_matches_the_sql_on_boundary_cases():
+    assert prd_wines.compare(products_db(prd_wines.boundary_rows()), "products") == {}
+
+
+def test_build_keeps_only_valid_vintages_and_ratings():
+    conn = products_db(prd_wines.boundary_rows())
+    n_in, n_out = prd_wines.build(conn)
+    expected = conn.execute("SELECT COUNT(*) FROM products WHERE vintage <= 2025 AND rating BETWEEN 0 AND 100").fetchone()[0]
+    assert (n_in, n_out) == (len(prd_wines.boundary_rows()), expected)
+    assert conn.execute("SELECT COUNT(*) FROM PRD_WINES WHERE bottle_size_l = 0 AND price_per_liter IS NOT NULL").fetchone()[0] == 0
@@ -0,0 +1,32 @@
+import resolve_customers as rc
+
+CSV = """customer_id,customer_name,customer_email,country,city
+1,Jane Doe,jane.doe12@example.com,France,Lyon
+2,Jane  Doe,,France,Lyon
+3,Anna Berg,anna.berg12@example.com,Spain,Rioja
+4,Jane Doe,,France,Nice
+5,Paolo Rossi,,Italy,Rome
+6,paolo rossi,,Italy,Rome
+7,Anna Berg,anna.berg871@example.com,Spain,Rioja
+"""
+
+
+def canonical(tmp_path):
+    path = tmp_path / "customers.csv"
+    path.write_text(CSV, encoding="utf-8")
+    out, stats = rc.resolve(rc.load(path), shards=2, workers=1)
+    return dict(zip(out["customer_id"], out["canonical_id"])), stats
+
+
+def test_null_email_duplicates_are_matched_on_name_and_place(tmp_path):
+    ids, _ = canonical(tmp_path)
+    assert ids[2] == 1               # NULL email, same person as 1
+    assert ids[6] == 5               # both emails NULL
+    assert ids[4] == 4               # same name but another city: not enough without an email
+    assert ids[7] == 7               # namesake in the same city whose email digits differ
+
+
+def test_clusters_map_to_their_smallest_id(tmp_path):
+    ids, stats = canonical(tmp_path)
+    assert stats["clusters"] == 2 and stats["merged"] == 2
+    assert all(c <= i for i, c in ids.items())
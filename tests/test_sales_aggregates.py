@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+import sales_aggregates as agg
+from sqlite_seed import TABLES
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    for t in ("products", "orders"):
+        conn.execute(TABLES[t]["schema"])
+    products = [(1, "Bordeaux", "red", 12.5), (2, "Rioja", "red", 9.99), (3, "Napa", "white", 30.0)]
+    conn.executemany("INSERT INTO products (id, region, color, price_eur) VALUES (?, ?, ?, ?)", products)
+    orders = [(i, 100 + i, 1 + i % 3, 1 + i % 4, ["web", "store"][i % 2], f"2025-0{1 + i % 3}-1{i % 9}T12:00:00")
+              for i in range(1, 13)]
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?)", orders)
+    conn.commit()
+    agg.rebuild(conn)
+    return conn
+
+
+def test_check_is_clean_after_order_and_product_dml(conn):
+    steps = [
+        "INSERT INTO orders VALUES (50, 1, 2, 3, 'web', '2025-03-01T08:00:00')",
+        "INSERT INTO orders VALUES (51, 1, 99, 1, 'web', '2025-03-01T09:00:00')",  # unknown product
+        "UPDATE orders SET qty = qty + 2 WHERE id = 3",
+        "UPDATE orders SET product_id = 3, order_ts = '2025-04-02T10:00:00' WHERE id = 4",
+        "DELETE FROM orders WHERE id = 5",
+        "UPDATE products SET region = 'Sonoma', price_eur = 31.25 WHERE id = 3",
+        "UPDATE products SET color = 'rosé' WHERE id = 1",
+        "DELETE FROM products WHERE id = 2",
+        "INSERT INTO products (id, region, color, price_eur) VALUES (99, 'Kakheti', 'white', 7.5)",
+    ]
+    for sql in steps:
+        with conn:
+            conn.execute(sql)
+        assert agg.check(conn) == {}, sql
+    agg.append_orders(conn, [(7, 1, 2, "mobile", "2025-05-05T05:00:00"), (8, 99, 1, "web", "2025-05-06T06:00:00")])
+    assert agg.check(conn) == {}
+
+
+def test_check_reports_a_drifted_table(conn):
+    with conn:
+        conn.execute(f"UPDATE {agg.PRODUCT} SET units = units + 1 WHERE product_id = 1")
+    assert agg.check(conn) == {agg.PRODUCT: 2}
@@ -0,0 +1,48 @@
+import csv, sqlite3
+
+import sqlite_seed
+
+
+def write_orders(data_dir, rows):
+    with open(data_dir / "orders.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(sqlite_seed.TABLES["orders"]["cols"])
+        w.writerows(rows)
+
+
+def order(i, qty=1):
+    return [i, 10 + i, 20 + i, qty, "web", f"2025-01-0{i}T10:00:00"]
+
+
+def load(conn):
+    return sqlite_seed.incremental_load(conn, "orders", sqlite_seed.TABLES["orders"], batch_size=2)
+
+
+def test_incremental_load_counts_and_versions_the_diff(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_seed, "DATA_DIR", str(tmp_path))
+    conn = sqlite3.connect(":memory:")
+
+    write_orders(tmp_path, [order(1), order(2), order(3), order(4)])
+    assert load(conn) == dict(inserted=4, updated=0, deleted=0, unchanged=0)
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'orders'")}
+    assert set(sqlite_seed.index_names(sqlite_seed.TABLES["orders"])) <= indexes
+    assert load(conn) is None  # same file digest
+
+    write_orders(tmp_path, [order(1), order(2, qty=5), order(4), order(5)])
+    assert load(conn) == dict(inserted=1, updated=1, deleted=1, unchanged=2)
+    assert conn.execute("SELECT id, qty FROM orders ORDER BY id").fetchall() == [(1, 1), (2, 5), (4, 1), (5, 1)]
+    assert conn.execute("SELECT id FROM _row_hash_orders WHERE v = 2 ORDER BY id").fetchall() == [(2,), (5,)]
+    assert conn.execute("SELECT id, v FROM _deleted_orders").fetchall() == [(3, 2)]
+    assert conn.execute("SELECT version, row_count FROM _load_state WHERE tbl = 'orders'").fetchone() == (2, 4)
+
+
+def test_unsorted_csv_falls_back_to_a_full_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_seed, "DATA_DIR", str(tmp_path))
+    conn = sqlite3.connect(":memory:")
+    write_orders(tmp_path, [order(1), order(2), order(3)])
+    load(conn)
+
+    write_orders(tmp_path, [order(3), order(1, qty=2)])
+    assert load(conn)["inserted"] == 2  # reloaded, not diffed
+    assert conn.execute("SELECT id, qty FROM orders ORDER BY id").fetchall() == [(1, 2), (3, 1)]
+    assert conn.execute("SELECT id FROM _deleted_orders").fetchall() == [(2,)]
@@ -0,0 +1,24 @@
+import os, sys, subprocess
+
+GEN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "generate",
+                   "wine_data_generator.py")
+FILES = ("products.csv", "consumers.csv", "orders.csv")
+# more orders than one ORDER_BLOCK, so the chunked paths write several chunks
+ENV = dict(N_PRODUCTS="300", N_CONSUMERS="200", N_ORDERS="70000", GEN_NOW="2025-06-01T00:00:00", SEED="7")
+
+
+def generate(out_dir, *flags, **env):
+    subprocess.run([sys.executable, GEN, *flags], check=True, capture_output=True,
+                   env=dict(os.environ, **ENV, **env, OUT_DIR=str(out_dir)))
+    return {f: (out_dir / f).read_bytes() for f in FILES}
+
+
+def test_stream_writes_the_same_bytes_as_the_default_path(tmp_path):
+    assert generate(tmp_path / "default") == generate(tmp_path / "stream", "--stream")
+
+
+def test_workers_write_the_same_bytes_for_any_worker_count(tmp_path):
+    default = generate(tmp_path / "default")
+    # one block per shard: 70k orders make two part files to merge
+    assert generate(tmp_path / "w1", "--workers", "1", SHARD_BLOCKS="1") == default
+    assert generate(tmp_path / "w3", "--workers", "3", SHARD_BLOCKS="1") == default